@@ -1,6 +1,6 @@
 from django.contrib import admin
 from .models import (
-    User, Course, Lesson, Enrollment, Olympiad, Question,
+    User, Course, Lesson, Enrollment, Olympiad, Question, BankQuestion,
     OlympiadRegistration, TestResult, Certificate, SupportTicket,
     TicketMessage, Payment, BotConfig, TeacherProfile, Subject,
     Profession, ProfessionSubject, ProfessionRoadmapStep,
@@ -10,6 +10,13 @@ from .models import (
     PaymentProviderConfig, Permission, RolePermission, AuditLog
 )
 
+@admin.register(BankQuestion)
+class BankQuestionAdmin(admin.ModelAdmin):
+    list_display = ['text', 'type', 'subject', 'difficulty', 'created_at']
+    list_filter = ['type', 'difficulty', 'subject']
+    search_fields = ['text']
+    readonly_fields = ['content_hash', 'answer_key']
+
 @admin.register(AIAssistantFAQ)
 class AIAssistantFAQAdmin(admin.ModelAdmin):
     list_display = ['question_uz', 'category', 'priority', 'order', 'is_active']
@@ -29,7 +36,7 @@ class AIConversationAdmin(admin.ModelAdmin):
 
 @admin.register(AIUnansweredQuestion)
 class AIUnansweredQuestionAdmin(admin.ModelAdmin):
-    list_display = ['question', 'user', 'context_url', 'is_resolved', 'created_at']
+    list_display = ['question', 'count', 'user', 'context_url', 'is_resolved', 'last_asked_at']
     list_filter = ['is_resolved', 'created_at']
     search_fields = ['question']
 
@@ -7,3 +7,5 @@ class ApiConfig(AppConfig):
     def ready(self):
         # Import signals to register them
         import api.signals  # noqa
+        # Register domain event handlers
+        import api.event_handlers  # noqa
@@ -1,10 +1,13 @@
-import requests
 from django.conf import settings
 from .models import BotConfig, User
 import logging
+from .services.bot_update_core import pooled_session
 
 logger = logging.getLogger(__name__)
 
+# Keep-alive connections to the Bot API, shared by all callers in the process
+_session = pooled_session(8)
+
 class BotService:
     """
     Centralized service for Telegram Bot interaction
@@ -33,7 +36,7 @@ class BotService:
             payload["reply_markup"] = reply_markup
             
         try:
-            response = requests.post(url, json=payload, timeout=10)
+            response = _session.post(url, json=payload, timeout=10)
             return response.status_code == 200
         except Exception as e:
             logger.error(f"Error sending telegram message: {e}")
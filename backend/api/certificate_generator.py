@@ -6,8 +6,10 @@ import os
 import io
 import qrcode
 from datetime import datetime
+from PIL import Image
 from django.conf import settings
 from django.core.files.base import ContentFile
+from django.utils import timezone
 
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4, landscape
@@ -15,7 +17,6 @@ from reportlab.lib.units import cm, mm
 from reportlab.pdfgen import canvas
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.lib.utils import ImageReader
 
 
 class CertificateGenerator:
@@ -33,8 +34,13 @@ class CertificateGenerator:
     LIGHT_TEXT = colors.HexColor('#4B5563')     # Slate gray
     BORDER_COLOR = colors.HexColor('#E5E7EB')   # Light border
     
-    def __init__(self, certificate):
-        self.cert = certificate
+    def __init__(self, data, qr=None):
+        """
+        data: plain dict from certificate_render_data() (no ORM access while drawing)
+        qr: optional prebuilt qrcode.QRCode for the verify URL (shared with the PNG file)
+        """
+        self.data = data
+        self.qr = qr or build_verify_qr(data['cert_number'])
         self.buffer = io.BytesIO()
         self.c = canvas.Canvas(self.buffer, pagesize=landscape(A4))
         
@@ -136,7 +142,7 @@ class CertificateGenerator:
             'OLYMPIAD': 'OLIMPIADA SERTIFIKATI', 
             'DIPLOMA': 'FAXRIY DIPLOM'
         }
-        return type_map.get(self.cert.cert_type, 'SERTIFIKAT')
+        return type_map.get(self.data['cert_type'], 'SERTIFIKAT')
     
     def _draw_recipient(self):
         """Draw recipient name with normalization"""
@@ -149,8 +155,7 @@ class CertificateGenerator:
         c.drawCentredString(center_x, self.PAGE_HEIGHT - 245, "Ushbu sertifikat quyidagi shaxsga berildi:")
         
         # Recipient Name - Properly Capitalized
-        user_full_name = self.cert.user.get_full_name() or self.cert.user.username
-        display_name = user_full_name.title() # Capitalize Each Word
+        display_name = self.data['recipient'].title() # Capitalize Each Word
         
         c.setFillColor(self.TEXT_COLOR)
         c.setFont("Helvetica-Bold", 42)
@@ -170,13 +175,13 @@ class CertificateGenerator:
         c.setFillColor(self.LIGHT_TEXT)
         c.setFont("Helvetica", 13)
         
-        if self.cert.cert_type == 'OLYMPIAD':
+        if self.data['cert_type'] == 'OLYMPIAD':
             c.drawCentredString(center_x, self.PAGE_HEIGHT - 345, "quyidagi olimpiadada muvaffaqiyatli ishtirok etgani uchun:")
         else:
             c.drawCentredString(center_x, self.PAGE_HEIGHT - 345, "quyidagi kursni muvaffaqiyatli tugatgani uchun:")
         
         # Title - Capitalized properly
-        title = self.cert.title
+        title = self.data['title']
         if title:
             # Capitalize first letter if it's a single word subject, else handle carefully
             display_title = title.capitalize() if len(title.split()) == 1 else title
@@ -194,7 +199,7 @@ class CertificateGenerator:
         badge_y = self.PAGE_HEIGHT - 450
         
         # Normalize grade text (Handle long texts like "shtirok etdi")
-        grade_text = str(self.cert.grade)
+        grade_text = str(self.data['grade'])
         # Fix: if it's "GOLD", "SILVER", "BRONZE", translate or format nicely
         grade_map = {
             'GOLD': "1-O'RIN (OLTIN)",
@@ -228,23 +233,12 @@ class CertificateGenerator:
         qr_x = self.PAGE_WIDTH - 140
         qr_y = 70
         
-        # Generate QR internally
-        verify_url = f"https://hogwords.uz/certificate/verify/{self.cert.cert_number}"
-        qr = qrcode.QRCode(version=1, box_size=10, border=1)
-        qr.add_data(verify_url)
-        qr.make(fit=True)
-        img = qr.make_image(fill_color="#111827", back_color="white")
-        
-        buf = io.BytesIO()
-        img.save(buf, format='PNG')
-        buf.seek(0)
-        
         # Draw white background for QR
         c.setFillColor(colors.white)
         c.roundRect(qr_x - 5, qr_y - 5, qr_size + 10, qr_size + 10, 8, fill=True, stroke=False)
         
-        # Draw QR
-        c.drawImage(ImageReader(buf), qr_x, qr_y, width=qr_size, height=qr_size)
+        # Draw QR modules as vector rectangles (no PNG encode/decode or image embedding)
+        self._draw_qr_modules(qr_x, qr_y, qr_size)
         
         # ID and Label
         c.setFillColor(self.LIGHT_TEXT)
@@ -253,7 +247,37 @@ class CertificateGenerator:
         
         c.setFont("Helvetica-Bold", 11)
         c.setFillColor(self.SECONDARY_COLOR)
-        c.drawCentredString(qr_x + qr_size/2, qr_y - 35, self.cert.cert_number)
+        c.drawCentredString(qr_x + qr_size/2, qr_y - 35, self.data['cert_number'])
+        
+    def _draw_qr_modules(self, x, y, size, quiet_zone=1):
+        """
+        Fill dark QR modules as one path in module units (one rectangle per
+        horizontal run) under a single transform, so the page stream holds
+        small integers instead of hundreds of formatted floats
+        """
+        c = self.c
+        modules = self.qr.modules
+        count = len(modules)
+        module = size / (count + 2 * quiet_zone)
+        
+        ops = []
+        for row_index, row in enumerate(modules):
+            top = count - 1 - row_index
+            col = 0
+            while col < count:
+                if row[col]:
+                    start = col
+                    while col < count and row[col]:
+                        col += 1
+                    ops.append(f"{start} {top} {col - start} 1 re")
+                else:
+                    col += 1
+        
+        c.saveState()
+        c.setFillColor(self.TEXT_COLOR)
+        c.transform(module, 0, 0, module, x + quiet_zone * module, y + quiet_zone * module)
+        c.addLiteral("\n".join(ops) + "\nf")
+        c.restoreState()
         
     def _draw_footer(self):
         """Clean footer"""
@@ -261,7 +285,7 @@ class CertificateGenerator:
         center_x = self.PAGE_WIDTH / 2
         
         # Issue date
-        issue_date = self.cert.issued_at.strftime("%d %B %Y")
+        issue_date = self.data['issued_at'].strftime("%d %B %Y")
         c.setFillColor(self.LIGHT_TEXT)
         c.setFont("Helvetica", 12)
         c.drawCentredString(center_x, 85, f"Berilgan sana: {issue_date}")
@@ -292,9 +316,7 @@ class CertificateGenerator:
         c.setStrokeColor(self.BORDER_COLOR)
         c.line(right_x - 60, sig_y, right_x + 60, sig_y)
         
-        verifier = "O'qituvchi"
-        if self.cert.verified_by:
-            verifier = self.cert.verified_by.get_full_name() or self.cert.verified_by.username
+        verifier = self.data['verifier'] or "O'qituvchi"
         
         c.setFillColor(self.TEXT_COLOR)
         c.setFont("Helvetica-Bold", 12)
@@ -303,16 +325,89 @@ class CertificateGenerator:
         c.drawCentredString(right_x, sig_y - 35, "Tasdiqlovchi mas'ul")
 
 
+def certificate_render_data(certificate):
+    """Everything the PDF/QR depend on, as a plain (picklable) dict"""
+    verifier = None
+    if certificate.verified_by:
+        verifier = certificate.verified_by.get_full_name() or certificate.verified_by.username
+    return {
+        'id': certificate.pk,
+        'cert_number': certificate.cert_number,
+        'cert_type': certificate.cert_type,
+        'recipient': certificate.user.get_full_name() or certificate.user.username,
+        'title': certificate.title,
+        'grade': certificate.grade,
+        'issued_at': timezone.localtime(certificate.issued_at),
+        'verifier': verifier,
+    }
+
+
+VERIFY_URL = "https://hogwords.uz/certificate/verify/{cert_number}"
+
+
+def build_verify_qr(cert_number):
+    """
+    QR code for the public verification URL.
+    A fixed mask pattern skips qrcode's 8-way mask scoring (most of its CPU time).
+    """
+    qr = qrcode.QRCode(version=1, box_size=10, border=2, mask_pattern=0)
+    qr.add_data(VERIFY_URL.format(cert_number=cert_number))
+    qr.make(fit=True)
+    return qr
+
+
+def _qr_png(qr, box_size=10):
+    """Two-colour palette PNG straight from the module matrix (no per-module drawing)"""
+    matrix = qr.get_matrix()
+    size = len(matrix)
+    img = Image.new('P', (size, size), 0)
+    img.putpalette([255, 255, 255, 0x7C, 0x3A, 0xED])  # white, #7C3AED
+    img.putdata([1 if dark else 0 for row in matrix for dark in row])
+    img = img.resize((size * box_size, size * box_size), Image.NEAREST)
+    
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def render_certificate_files(data):
+    """Render (pdf_bytes, qr_png_bytes) from certificate_render_data() with a single QR build"""
+    qr = build_verify_qr(data['cert_number'])
+    pdf_bytes = CertificateGenerator(data, qr=qr).generate().getvalue()
+    return pdf_bytes, _qr_png(qr)
+
+
+def render_certificate_pdf(data):
+    """Render PDF bytes from certificate_render_data()"""
+    return CertificateGenerator(data).generate().getvalue()
+
+
+def render_qr_code(data):
+    """Render verification QR PNG bytes from certificate_render_data()"""
+    return _qr_png(build_verify_qr(data['cert_number']))
+
+
+def generate_certificate_files(certificate):
+    """
+    Generate PDF and QR code together (one QR build)
+    Returns (pdf ContentFile, qr ContentFile) for saving to model
+    """
+    pdf_bytes, qr_bytes = render_certificate_files(certificate_render_data(certificate))
+    return (
+        ContentFile(pdf_bytes, name=f"certificate_{certificate.cert_number}.pdf"),
+        ContentFile(qr_bytes, name=f"qr_{certificate.cert_number}.png"),
+    )
+
+
 def generate_certificate_pdf(certificate):
     """
     Main function to generate certificate PDF
     Returns the PDF as ContentFile for saving to model
     """
-    generator = CertificateGenerator(certificate)
-    pdf_buffer = generator.generate()
+    pdf_bytes = render_certificate_pdf(certificate_render_data(certificate))
     
     filename = f"certificate_{certificate.cert_number}.pdf"
-    return ContentFile(pdf_buffer.read(), name=filename)
+    return ContentFile(pdf_bytes, name=filename)
 
 
 def generate_qr_code(certificate):
@@ -320,16 +415,7 @@ def generate_qr_code(certificate):
     Generate QR code image for certificate verification
     Returns ContentFile for saving to model
     """
-    verify_url = f"https://ardent.uz/certificate/verify/{certificate.cert_number}"
-    
-    qr = qrcode.QRCode(version=1, box_size=10, border=2)
-    qr.add_data(verify_url)
-    qr.make(fit=True)
-    qr_img = qr.make_image(fill_color="#7C3AED", back_color="white")
-    
-    buffer = io.BytesIO()
-    qr_img.save(buffer, format='PNG')
-    buffer.seek(0)
+    qr_bytes = render_qr_code(certificate_render_data(certificate))
     
     filename = f"qr_{certificate.cert_number}.png"
-    return ContentFile(buffer.read(), name=filename)
+    return ContentFile(qr_bytes, name=filename)
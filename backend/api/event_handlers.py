@@ -0,0 +1,141 @@
+"""
+Side effects of completed lessons, courses and olympiads (see EventBus).
+Handlers receive the event only and load what they need.
+"""
+from .models import Course, Lesson, Module, Olympiad, TestResult, User
+from .services.event_bus import CourseCompleted, EventBus, LessonCompleted, OlympiadFinished
+
+
+# ==================== LESSONS ====================
+
+@EventBus.subscribe(LessonCompleted)
+def record_lesson_streak(event):
+    from .streak_service import StreakService
+    lesson = Lesson.objects.only('title').get(id=event.lesson_id)
+    StreakService.record_activity(User.objects.get(id=event.user_id), 'LESSON_COMPLETE', f"Completed lesson: {lesson.title}")
+
+
+@EventBus.subscribe(LessonCompleted)
+def reward_lesson_xp(event):
+    lesson = Lesson.objects.only('title', 'xp_amount').get(id=event.lesson_id)
+    if lesson.xp_amount > 0:
+        User.objects.get(id=event.user_id).add_xp(lesson.xp_amount, 'LESSON_COMPLETE', f"Dars yakunlandi: {lesson.title}")
+
+
+@EventBus.subscribe(LessonCompleted, key=lambda event: (event.user_id, event.module_id))
+def check_module_completion(event):
+    from .services.learning_service import LearningService
+    if event.module_id:
+        LearningService.check_module_completion(User.objects.get(id=event.user_id), Module.objects.get(id=event.module_id))
+
+
+# ==================== COURSES ====================
+
+@EventBus.subscribe(CourseCompleted)
+def reward_course_xp(event):
+    course = Course.objects.get(id=event.course_id)
+    User.objects.get(id=event.user_id).add_xp(course.xp_reward, 'COURSE_ENROLL', f"Kurs yakunlandi: {course.title}")
+
+
+@EventBus.subscribe(CourseCompleted, key=lambda event: event.user_id)
+@EventBus.subscribe(OlympiadFinished, key=lambda event: event.user_id)
+def update_career_progress(event):
+    from .services.profession_service import ProfessionService
+    ProfessionService.update_all_active_professions(User.objects.get(id=event.user_id))
+
+
+@EventBus.subscribe(CourseCompleted)
+def complete_course_nodes(event):
+    """🚀 HOGWARTS CAREER ENGINE HOOK: Auto-complete Course Nodes"""
+    from .services.career_engine_service import CareerEngineService
+    CareerEngineService.complete_reference_nodes(User.objects.get(id=event.user_id), 'course', event.course_id, score=100)
+
+
+@EventBus.subscribe(CourseCompleted)
+def issue_course_certificate(event):
+    """Create certificate if not already exists AND it's enabled for course"""
+    from django.db.models import Avg
+    from .models import Certificate, LessonProgress
+    from .utils import generate_unique_id
+
+    course = Course.objects.get(id=event.course_id)
+    if not course.is_certificate_enabled or Certificate.objects.filter(user_id=event.user_id, course=course).exists():
+        return
+
+    # Calculate average score for certificate
+    avg_score = LessonProgress.objects.filter(
+        user_id=event.user_id,
+        lesson__course=course,
+        test_score__isnull=False
+    ).aggregate(avg=Avg('test_score'))['avg'] or 0
+
+    Certificate.objects.create(
+        cert_number=generate_unique_id('CRT'),
+        user_id=event.user_id,
+        course=course,
+        grade=f"{int(avg_score)}%",
+        score=int(avg_score),
+        status='PENDING'
+    )
+
+
+@EventBus.subscribe(CourseCompleted)
+def notify_course_completed(event):
+    from .models import Notification
+    course = Course.objects.only('title').get(id=event.course_id)
+    Notification.objects.create(
+        user_id=event.user_id,
+        title="Tabriklaymiz! 🎓",
+        message=f"Siz '{course.title}' kursini muvaffaqiyatli yakunladingiz! Bilimlaringizni amalda qo'llashda omad tilaymiz.",
+        notification_type='ACHIEVEMENT',
+        channel='ALL',
+        link=f"/course/{course.id}"
+    )
+
+
+# ==================== OLYMPIADS ====================
+
+@EventBus.subscribe(OlympiadFinished)
+def reward_olympiad_xp(event):
+    olympiad = Olympiad.objects.get(id=event.olympiad_id)
+    if olympiad.xp_reward > 0:
+        User.objects.get(id=event.user_id).add_xp(
+            olympiad.xp_reward, 'OLYMPIAD_PARTICIPATION', f"Olimpiada yakunlandi: {olympiad.title}"
+        )
+
+
+@EventBus.subscribe(OlympiadFinished)
+def record_olympiad_streak(event):
+    from .streak_service import StreakService
+    olympiad = Olympiad.objects.only('title').get(id=event.olympiad_id)
+    StreakService.record_activity(
+        User.objects.get(id=event.user_id), 'OLYMPIAD_PARTICIPATION', f"Olimpiada topshirildi: {olympiad.title}"
+    )
+
+
+@EventBus.subscribe(OlympiadFinished)
+def complete_olympiad_nodes(event):
+    """🚀 HOGWARTS CAREER ENGINE HOOK: Auto-complete Olympiad Nodes"""
+    from .services.career_engine_service import CareerEngineService
+    result = TestResult.objects.only('percentage').get(id=event.result_id)
+    # Pass the actual score percentage achieved as the node score
+    CareerEngineService.complete_reference_nodes(
+        User.objects.get(id=event.user_id), 'olympiad', event.olympiad_id, score=int(result.percentage)
+    )
+
+
+@EventBus.subscribe(OlympiadFinished)
+def notify_olympiad_result(event):
+    user = User.objects.get(id=event.user_id)
+    if not user.telegram_id:
+        return
+    from .telegram_service import TelegramService
+
+    result = TestResult.objects.select_related('olympiad').get(id=event.result_id)
+    msg = (
+        f"🏁 <b>{result.olympiad.title} yakunlandi!</b>\n\n"
+        f"📊 Natijangiz: {result.score} ball ({result.percentage:.1f}%)\n"
+        f"⏱ Vaqt: {result.time_taken // 60} daqiqa\n\n"
+        f"Batafsil tahlilni saytda ko'rishingiz mumkin."
+    )
+    TelegramService.send_message(str(user.telegram_id), msg)
@@ -0,0 +1,28 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.services.analytics_service import AnalyticsService
+
+class Command(BaseCommand):
+    help = 'Build daily analytics fact tables (nightly: yesterday, today and days changed since; --backfill: full history)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backfill', action='store_true', help='Rebuild from the first user/payment until today')
+        parser.add_argument('--since', type=date.fromisoformat, help='Rebuild from this date (YYYY-MM-DD) until today')
+        parser.add_argument('--days', type=int, default=2, help='Number of recent days to rebuild (default: 2)')
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+
+        if options['backfill']:
+            days = AnalyticsService.backfill()
+        elif options['since']:
+            days = AnalyticsService.backfill(start_date=options['since'], end_date=today)
+        else:
+            days = AnalyticsService.backfill(start_date=today - timedelta(days=options['days'] - 1), end_date=today)
+
+        days += AnalyticsService.rebuild_dirty()
+
+        self.stdout.write(self.style.SUCCESS(f'Analytics facts rebuilt for {days} days'))
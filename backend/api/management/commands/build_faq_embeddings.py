@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from api.services.faq_embeddings import FAQEmbeddingIndex, suggest_faqs
+
+
+class Command(BaseCommand):
+    help = 'Build the AI assistant FAQ embedding index, or suggest FAQs from unanswered questions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--suggest', action='store_true', help='Cluster unanswered questions instead of building')
+        parser.add_argument('--similarity', type=float, default=0.5, help='Clustering similarity (with --suggest)')
+        parser.add_argument('--min-count', type=int, default=2, help='Smallest cluster to report (with --suggest)')
+
+    def handle(self, *args, **options):
+        if not options['suggest']:
+            rows = FAQEmbeddingIndex.build()
+            self.stdout.write(self.style.SUCCESS(f'Embedded {rows} FAQ rows into {FAQEmbeddingIndex.directory()}'))
+            return
+
+        suggestions = suggest_faqs(similarity=options['similarity'], min_count=options['min_count'])
+        if not suggestions:
+            self.stdout.write('No recurring unanswered questions')
+            return
+        for suggestion in suggestions:
+            self.stdout.write(self.style.SUCCESS(f"[{suggestion['count']}] {suggestion['question']}"))
+            for example in suggestion['examples']:
+                self.stdout.write(f"    - {example}")
+            if suggestion['nearest_faq_id']:
+                self.stdout.write(
+                    f"    nearest FAQ #{suggestion['nearest_faq_id']} ({suggestion['nearest_similarity']:.2f})"
+                )
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from api.services.faq_index import FAQIndex, benchmark
+
+SAMPLE_QUERIES = [
+    "Qaysi yo'nalishni tanlasam bo'ladi?",
+    "Какая цена курса?",
+    "Sertifikat olsam bo'ladimi?",
+    "Payme orqali to'lasa bo'ladimi?",
+    "Кто преподаватели?",
+    "Ob-havo qanday bugun?",
+]
+
+
+class Command(BaseCommand):
+    help = 'Show how the AI assistant ranks FAQs for a question, or benchmark FAQ matching'
+
+    def add_arguments(self, parser):
+        parser.add_argument('question', nargs='*', help='Question to rank FAQs for')
+        parser.add_argument('--benchmark', type=int, metavar='N', help='Time N rounds of the sample queries')
+
+    def handle(self, *args, **options):
+        if options['benchmark']:
+            result = benchmark(SAMPLE_QUERIES, iterations=options['benchmark'])
+            self.stdout.write(f"Index build: {result['build_ms']:.1f} ms")
+            self.stdout.write(f"Indexed match: {result['index_us']:.1f} µs/query")
+            self.stdout.write(f"Linear scan: {result['scan_us']:.1f} µs/query (rows preloaded)")
+            self.stdout.write(f"Linear scan with FAQ query: {result['scan_db_us']:.1f} µs/query (previous behaviour)")
+            return
+
+        question = ' '.join(options['question'])
+        index = FAQIndex.build()
+        results = index.search(question)
+        if not results:
+            self.stdout.write('No FAQ shares a term with the question')
+            return
+        for faq, score, confidence in results:
+            marker = '*' if confidence >= index.MIN_CONFIDENCE else ' '
+            self.stdout.write(f"{marker} {score:6.2f}  {confidence:4.0%}  #{faq.id} {faq.question_uz}")
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from api.services.certificate_storage_service import CertificateStorageService
+
+class Command(BaseCommand):
+    help = 'Delete certificate PDF/QR files that no certificate references anymore'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only list orphaned files')
+
+    def handle(self, *args, **options):
+        orphans = CertificateStorageService.collect_garbage(dry_run=options['dry_run'])
+        for name in orphans:
+            self.stdout.write(name)
+
+        action = 'Found' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(f'{action} {len(orphans)} orphaned certificate files'))
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.models import DomainEvent
+from api.services.event_bus import EventBus
+
+class Command(BaseCommand):
+    help = "Handle stored domain events (EVENT_BUS_MODE='worker')"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200, help='Events handled per batch')
+        parser.add_argument('--watch', type=float, default=0, help='Keep polling for new events every N seconds')
+        parser.add_argument('--retry-failed', action='store_true', help='Queue failed events again first (only their failed handlers run)')
+
+    def handle(self, *args, **options):
+        if options['retry_failed']:
+            count = DomainEvent.objects.filter(status='FAILED').update(status='PENDING', processed_at=None)
+            self.stdout.write(f"Re-queued {count} failed events")
+
+        while True:
+            processed = EventBus.process_stored(batch_size=options['batch_size'])
+            if processed:
+                self.stdout.write(f"Handled {processed} events")
+                continue
+            if not options['watch']:
+                break
+            time.sleep(options['watch'])
+
+        for name, stats in EventBus.metrics.snapshot().items():
+            self.stdout.write(
+                f"{name:<40} n={stats['count']:<6} errors={stats['errors']:<4} "
+                f"mean={stats['mean_ms']}ms p95={stats['p95_ms']}ms"
+            )
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import Profession
+from api.services.career_engine_service import CareerEngineService
+from api.services.profession_service import ProfessionService
+
+class Command(BaseCommand):
+    help = 'Re-evaluate Career Engine levels and roadmap progress for all users of a profession'
+
+    def add_arguments(self, parser):
+        parser.add_argument('professions', nargs='*', help='Profession ids or slugs (default: all active)')
+
+    def handle(self, *args, **options):
+        professions = Profession.objects.filter(is_active=True)
+        if options['professions']:
+            ids = [value for value in options['professions'] if value.isdigit()]
+            slugs = [value for value in options['professions'] if not value.isdigit()]
+            professions = Profession.objects.filter(id__in=ids) | Profession.objects.filter(slug__in=slugs)
+            if not professions.exists():
+                raise CommandError('No matching professions')
+
+        for profession in professions:
+            changed = CareerEngineService.recompute_profession(profession)
+            updated = ProfessionService.recompute_followers(profession)
+            self.stdout.write(self.style.SUCCESS(
+                f'{profession.name}: {changed} users progressed a level, {updated} roadmap progress rows updated'
+            ))
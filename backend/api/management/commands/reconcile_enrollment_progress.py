@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from api.services.learning_service import LearningService
+
+class Command(BaseCommand):
+    help = 'Compare course/module/enrollment progress counters with recounts and report (or repair) drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Write the recounted values back')
+
+    def handle(self, *args, **options):
+        course_drift, enrollment_drift = LearningService.reconcile_progress_counters(fix=options['fix'])
+        module_drift, module_progress_drift = LearningService.reconcile_module_counters(fix=options['fix'])
+
+        for course, stored, actual in course_drift:
+            self.stdout.write(self.style.WARNING(f'Course {course.id}: published_lessons_count={stored} actual={actual}'))
+        for enrollment, stored, actual in enrollment_drift:
+            self.stdout.write(self.style.WARNING(
+                f'Enrollment {enrollment.id} (user={enrollment.user_id} course={enrollment.course_id}): '
+                f'completed_lessons_count={stored} actual={actual}'
+            ))
+
+        for module, stored, actual in module_drift:
+            self.stdout.write(self.style.WARNING(f'Module {module.id}: published_lessons_count={stored} actual={actual}'))
+        for row, stored, actual in module_progress_drift:
+            self.stdout.write(self.style.WARNING(
+                f'Module progress {row.id} (user={row.user_id} module={row.module_id}): '
+                f'completed_lessons_count={stored} actual={actual}'
+            ))
+
+        drifted = len(course_drift) + len(enrollment_drift) + len(module_drift) + len(module_progress_drift)
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS('All progress counters match'))
+        elif options['fix']:
+            self.stdout.write(self.style.SUCCESS(f'Repaired {drifted} counters'))
+        else:
+            self.stdout.write(self.style.ERROR(f'{drifted} counters drifted (run with --fix to repair)'))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from api.services.ledger_service import LedgerService
+
+class Command(BaseCommand):
+    help = 'Compare ledger balances with User.balance / TeacherWallet columns and report drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--init', action='store_true', help='Post opening balances into an empty ledger')
+        parser.add_argument('--checkpoint', action='store_true', help='Store a balance snapshot after reconciling')
+
+    def handle(self, *args, **options):
+        if options['init']:
+            opened = LedgerService.post_opening_balances()
+            self.stdout.write(self.style.SUCCESS(f'Opened {opened} ledger accounts'))
+
+        drift = LedgerService.reconcile()
+        for account, ledger_balance, column_balance in drift:
+            self.stdout.write(self.style.WARNING(
+                f'{account.account_type} owner={account.owner_id}: ledger={ledger_balance} column={column_balance}'
+            ))
+
+        if drift:
+            self.stdout.write(self.style.ERROR(f'{len(drift)} accounts drifted from the ledger'))
+        else:
+            self.stdout.write(self.style.SUCCESS('All balances match the ledger'))
+
+        if options['checkpoint']:
+            checkpoint = LedgerService.create_checkpoint()
+            self.stdout.write(self.style.SUCCESS(f'Checkpoint {checkpoint.id} at entry {checkpoint.last_entry_id}'))
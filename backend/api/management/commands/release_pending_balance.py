@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from api.services.wallet_service import WalletService
+
+class Command(BaseCommand):
+    help = 'Move teacher earnings older than PENDING_BALANCE_DAYS from pending to available balance'
+
+    def handle(self, *args, **options):
+        count = WalletService.release_pending_balance()
+        self.stdout.write(self.style.SUCCESS(f'Released pending balance for {count} wallets'))
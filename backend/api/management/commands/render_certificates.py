@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from api.models import Certificate
+from api.services.certificate_render_service import CertificateRenderService
+
+class Command(BaseCommand):
+    help = 'Render queued certificate PDF/QR files with a process pool (resumable)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: CPU count)')
+        parser.add_argument('--missing', action='store_true', help='Queue every verified certificate without a PDF')
+        parser.add_argument('--retry-failed', action='store_true', help='Resume jobs that finished with failures')
+        parser.add_argument('--watch', type=int, default=0, help='Keep polling for new jobs every N seconds')
+        parser.add_argument('--benchmark', type=int, default=0, help='Render N synthetic certificates and report throughput')
+        parser.add_argument('--worker-counts', default='1,2,4', help='Worker counts for --benchmark (comma separated)')
+
+    def handle(self, *args, **options):
+        if options['benchmark']:
+            worker_counts = [int(n) for n in options['worker_counts'].split(',') if n.strip()]
+            self.stdout.write(f"Rendering {options['benchmark']} certificates per run...")
+            for workers, seconds, per_second in CertificateRenderService.benchmark(options['benchmark'], worker_counts):
+                self.stdout.write(f"workers={workers:<3} {seconds:8.2f}s  {per_second:8.1f} certificates/sec")
+            return
+
+        if options['missing']:
+            ids = Certificate.objects.filter(status='VERIFIED').filter(
+                Q(pdf_file='') | Q(pdf_file__isnull=True)
+            ).values_list('id', flat=True)
+            job = CertificateRenderService.enqueue(ids)
+            if job:
+                self.stdout.write(f"Queued job {job.id} with {len(job.certificate_ids)} certificates")
+
+        while True:
+            jobs = CertificateRenderService.run_pending_jobs(
+                workers=options['workers'], include_failed=options['retry_failed']
+            )
+            for job in jobs:
+                job.refresh_from_db()
+                style = self.style.SUCCESS if job.status == 'COMPLETED' else self.style.WARNING
+                self.stdout.write(style(
+                    f"Job {job.id}: {job.status}, rendered {job.rendered_count}/{len(job.certificate_ids)}, "
+                    f"failed {len(job.failed_ids)}"
+                ))
+
+            if not options['watch']:
+                break
+            options['retry_failed'] = False
+            time.sleep(options['watch'])
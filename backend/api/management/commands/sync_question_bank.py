@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.services.question_bank_service import QuestionBankService
+
+
+class Command(BaseCommand):
+    help = 'Link olympiad questions that have no question bank item yet (deduplicating their content)'
+
+    def handle(self, *args, **options):
+        linked, created = QuestionBankService.sync()
+        self.stdout.write(self.style.SUCCESS(f'{linked} questions linked, {created} bank items created'))
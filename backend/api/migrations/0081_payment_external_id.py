@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-19 17:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0080_testresult_feedback'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='external_id',
+            field=models.CharField(blank=True, help_text='Bank message / provider ID used to confirm this payment', max_length=100, null=True, unique=True),
+        ),
+    ]
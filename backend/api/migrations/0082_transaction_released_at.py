@@ -0,0 +1,35 @@
+# Generated by Django 6.0.1 on 2026-10-19 17:40
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+from django.utils import timezone
+
+
+def mark_processed_sales_released(apps, schema_editor):
+    # Sales older than the pending window were already moved to available
+    # balance by the previous release job, so they must not be released again.
+    Transaction = apps.get_model('api', 'Transaction')
+    cutoff = timezone.now() - timedelta(days=getattr(settings, 'PENDING_BALANCE_DAYS', 7))
+    Transaction.objects.filter(
+        transaction_type='COURSE_SALE',
+        created_at__lte=cutoff
+    ).update(released_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0081_payment_external_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='released_at',
+            field=models.DateTimeField(blank=True, db_index=True, help_text='When sale earnings moved from pending to available balance', null=True),
+        ),
+        migrations.RunPython(mark_processed_sales_released, migrations.RunPython.noop),
+    ]
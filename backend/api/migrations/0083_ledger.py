@@ -0,0 +1,59 @@
+# Generated by Django 6.0.1 on 2026-10-19 18:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0082_transaction_released_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_entry_id', models.BigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'ledger_checkpoints',
+                'ordering': ['-id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('journal_id', models.UUIDField(db_index=True)),
+                ('account_type', models.CharField(choices=[('USER_BALANCE', 'User AC Balance'), ('TEACHER_PENDING', 'Teacher Pending Balance'), ('TEACHER_AVAILABLE', 'Teacher Available Balance'), ('PLATFORM', 'Platform'), ('EXTERNAL', 'External (cash in/out)')], max_length=20)),
+                ('amount', models.DecimalField(decimal_places=2, help_text='Signed: positive credits the account, negative debits it', max_digits=14)),
+                ('entry_type', models.CharField(help_text='TOPUP, PURCHASE, COURSE_SALE, RELEASE, PAYOUT, ...', max_length=30)),
+                ('reference', models.CharField(blank=True, max_length=100)),
+                ('description', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('owner', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'ledger_entries',
+                'indexes': [models.Index(fields=['account_type', 'owner', 'id'], name='ledger_entr_account_e79187_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='LedgerSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('account_type', models.CharField(choices=[('USER_BALANCE', 'User AC Balance'), ('TEACHER_PENDING', 'Teacher Pending Balance'), ('TEACHER_AVAILABLE', 'Teacher Available Balance'), ('PLATFORM', 'Platform'), ('EXTERNAL', 'External (cash in/out)')], max_length=20)),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('checkpoint', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='api.ledgercheckpoint')),
+                ('owner', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'ledger_snapshots',
+                'indexes': [models.Index(fields=['account_type', 'owner', 'checkpoint'], name='ledger_snap_account_3368a1_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 6.0.1 on 2026-10-19 18:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0083_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyEnrollmentStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('enrollments', models.IntegerField(default=0)),
+                ('olympiad_registrations', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'analytics_daily_enrollments',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyUserStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('new_users', models.IntegerField(default=0)),
+                ('new_students', models.IntegerField(default=0)),
+                ('new_teachers', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'analytics_daily_users',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyRevenue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(db_index=True)),
+                ('payment_type', models.CharField(max_length=20)),
+                ('product_id', models.CharField(blank=True, default='', help_text='Payment.reference_id for COURSE/OLYMPIAD', max_length=50)),
+                ('product_name', models.CharField(blank=True, max_length=255)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('payments_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'analytics_daily_revenue',
+                'unique_together': {('date', 'payment_type', 'product_id')},
+            },
+        ),
+    ]
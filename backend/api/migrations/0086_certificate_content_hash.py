@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-19 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0085_certificate_render_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='certificate',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, help_text='Hash of the rendering inputs of the stored PDF/QR', max_length=64),
+        ),
+    ]
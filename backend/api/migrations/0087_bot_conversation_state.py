@@ -0,0 +1,27 @@
+# Generated by Django 6.0.1 on 2026-10-19 14:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0086_certificate_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BotConversationState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chat_id', models.BigIntegerField(unique=True)),
+                ('state', models.PositiveSmallIntegerField(default=0)),
+                ('data', models.JSONField(blank=True, default=dict)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'bot_conversation_states',
+            },
+        ),
+    ]
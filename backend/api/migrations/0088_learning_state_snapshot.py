@@ -0,0 +1,37 @@
+# Generated by Django 6.0.1 on 2026-10-19 14:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0087_bot_conversation_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='structure_version',
+            field=models.PositiveIntegerField(default=0, help_text='Bumped on module/lesson changes (learning-state cache key)'),
+        ),
+        migrations.CreateModel(
+            name='LearningStateSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('structure_key', models.CharField(help_text='Course structure version and lock strategy it was built for', max_length=50)),
+                ('completed', models.BinaryField(default=b'')),
+                ('locked', models.BinaryField(default=b'')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='learning_snapshots', to='api.course')),
+                ('current_lesson', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.lesson')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='learning_snapshots', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'learning_state_snapshots',
+                'unique_together': {('user', 'course')},
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 6.0.1 on 2026-10-19 15:10
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_progress_counters(apps, schema_editor):
+    Course = apps.get_model('api', 'Course')
+    Enrollment = apps.get_model('api', 'Enrollment')
+    LessonProgress = apps.get_model('api', 'LessonProgress')
+
+    published = Course.objects.filter(pk=OuterRef('pk')).annotate(
+        n=Count('lessons', filter=Q(lessons__is_published=True))
+    ).values('n')
+    Course.objects.update(published_lessons_count=Coalesce(Subquery(published), 0))
+
+    completed = LessonProgress.objects.filter(
+        user=OuterRef('user'), lesson__course=OuterRef('course'), lesson__is_published=True, is_completed=True
+    ).values('user').annotate(n=Count('id')).values('n')
+    Enrollment.objects.update(completed_lessons_count=Coalesce(Subquery(completed), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0089_domain_event'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='published_lessons_count',
+            field=models.IntegerField(default=0, help_text='Maintained by the Lesson signals; denominator of enrollment progress'),
+        ),
+        migrations.AddField(
+            model_name='enrollment',
+            name='completed_lessons_count',
+            field=models.IntegerField(default=0, help_text='Completed published lessons, incremented on completion'),
+        ),
+        migrations.RunPython(backfill_progress_counters, migrations.RunPython.noop),
+    ]
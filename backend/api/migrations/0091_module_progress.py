@@ -0,0 +1,72 @@
+# Generated by Django 6.0.1 on 2026-10-19 15:35
+
+import re
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_module_progress(apps, schema_editor):
+    Module = apps.get_model('api', 'Module')
+    LessonProgress = apps.get_model('api', 'LessonProgress')
+    ModuleProgress = apps.get_model('api', 'ModuleProgress')
+    ActivityLog = apps.get_model('api', 'ActivityLog')
+
+    published = Module.objects.filter(pk=OuterRef('pk')).annotate(
+        n=Count('lessons', filter=Q(lessons__is_published=True))
+    ).values('n')
+    Module.objects.update(published_lessons_count=Coalesce(Subquery(published), 0))
+
+    rows = {}
+    completed = LessonProgress.objects.filter(
+        is_completed=True, lesson__is_published=True, lesson__module__isnull=False
+    ).values_list('user_id', 'lesson__module_id').annotate(n=Count('id'))
+    for user_id, module_id, count in completed:
+        rows[(user_id, module_id)] = ModuleProgress(user_id=user_id, module_id=module_id, completed_lessons_count=count)
+
+    # Modules already rewarded were marked by "(Module ID: <id>)" in the activity log
+    module_ids = set(Module.objects.values_list('id', flat=True))
+    rewarded = ActivityLog.objects.filter(activity_type='MODULE_COMPLETE').values_list('user_id', 'description', 'created_at')
+    for user_id, description, created_at in rewarded.iterator():
+        match = re.search(r'Module ID: (\d+)', description)
+        if not match or int(match.group(1)) not in module_ids:
+            continue
+        key = (user_id, int(match.group(1)))
+        row = rows.setdefault(key, ModuleProgress(user_id=key[0], module_id=key[1]))
+        row.completed_at = created_at
+
+    ModuleProgress.objects.bulk_create(rows.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0090_progress_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='module',
+            name='published_lessons_count',
+            field=models.IntegerField(default=0, help_text='Maintained by the Lesson signals'),
+        ),
+        migrations.CreateModel(
+            name='ModuleProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('completed_lessons_count', models.IntegerField(default=0, help_text='Completed published lessons, incremented on completion')),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('module', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='user_progress', to='api.module')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='module_progress', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'module_progress',
+                'unique_together': {('user', 'module')},
+            },
+        ),
+        migrations.RunPython(backfill_module_progress, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-19 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0091_module_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profession',
+            name='graph_version',
+            field=models.PositiveIntegerField(default=0, help_text='Bumped on level/node changes (compiled career graph cache key)'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 6.0.1 on 2026-10-19 18:12
+
+import re
+import uuid
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def fill_message_uids(apps, schema_editor):
+    AIMessage = apps.get_model('api', 'AIMessage')
+    messages = list(AIMessage.objects.only('id'))
+    for message in messages:
+        message.uid = uuid.uuid4()
+    AIMessage.objects.bulk_update(messages, ['uid'], batch_size=1000)
+
+
+def fill_question_keys(apps, schema_editor):
+    # Same normalization as AILogBuffer.question_key
+    AIUnansweredQuestion = apps.get_model('api', 'AIUnansweredQuestion')
+    questions = list(AIUnansweredQuestion.objects.only('id', 'question', 'created_at'))
+    for question in questions:
+        text = re.sub(r"[ʻʼ‘’`´]", "'", question.question.lower()).replace('ё', 'е')
+        question.question_key = ' '.join(re.sub(r"[^\w']+", ' ', text).split())[:255]
+        question.last_asked_at = question.created_at
+    AIUnansweredQuestion.objects.bulk_update(questions, ['question_key', 'last_asked_at'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0092_profession_graph_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aimessage',
+            name='uid',
+            field=models.UUIDField(null=True, editable=False),
+        ),
+        migrations.RunPython(fill_message_uids, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='aimessage',
+            name='uid',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='aimessage',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='aiunansweredquestion',
+            name='count',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='aiunansweredquestion',
+            name='last_asked_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='aiunansweredquestion',
+            name='question_key',
+            field=models.CharField(blank=True, db_index=True, max_length=255),
+        ),
+        migrations.RunPython(fill_question_keys, migrations.RunPython.noop),
+    ]
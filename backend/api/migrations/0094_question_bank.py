@@ -0,0 +1,46 @@
+# Generated by Django 6.0.1 on 2026-10-19 19:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0093_ai_log_buffer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BankQuestion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64, unique=True)),
+                ('type', models.CharField(choices=[('MCQ', 'Multiple Choice'), ('NUMERIC', 'Numeric Answer'), ('TEXT', 'Text Answer'), ('CODE', 'Code Submission')], default='MCQ', max_length=10)),
+                ('text', models.TextField()),
+                ('options', models.JSONField(blank=True, null=True)),
+                ('correct_answer', models.TextField()),
+                ('answer_key', models.TextField(blank=True)),
+                ('explanation', models.TextField(blank=True)),
+                ('code_template', models.TextField(blank=True, null=True)),
+                ('difficulty', models.CharField(choices=[('EASY', 'Oson'), ('MEDIUM', "O'rta"), ('HARD', 'Qiyin')], default='MEDIUM', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('subject', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='bank_questions', to='api.subject')),
+            ],
+            options={
+                'db_table': 'question_bank',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='bank_item',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='links', to='api.bankquestion'),
+        ),
+        migrations.AddIndex(
+            model_name='bankquestion',
+            index=models.Index(fields=['subject', 'difficulty'], name='question_ba_subject_90a378_idx'),
+        ),
+    ]
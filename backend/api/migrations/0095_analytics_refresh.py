@@ -0,0 +1,24 @@
+# Generated by Django 6.0.1 on 2026-10-19 19:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0094_question_bank'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalyticsRefresh',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('refreshed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'analytics_refresh',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-19 20:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0095_analytics_refresh'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='olympiad',
+            name='questions_version',
+            field=models.PositiveIntegerField(default=0, help_text='Bumped on question changes (answer key cache key)'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 6.0.1 on 2026-10-19 20:45
+
+from django.db import migrations, models
+
+
+def backfill_daily_facts(apps, schema_editor):
+    # The fact tables (0084) were created empty: build them once for existing data.
+    # Uses the live service, so it is skipped on empty databases (fresh installs,
+    # where later schema changes could break it) and when facts already exist.
+    User = apps.get_model('api', 'User')
+    Payment = apps.get_model('api', 'Payment')
+    DailyRevenue = apps.get_model('api', 'DailyRevenue')
+    DailyUserStats = apps.get_model('api', 'DailyUserStats')
+    if DailyRevenue.objects.exists() or DailyUserStats.objects.exists():
+        return
+    if not (User.objects.exists() or Payment.objects.exists()):
+        return
+    from api.services.analytics_service import AnalyticsService
+    AnalyticsService.backfill()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0096_olympiad_questions_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalyticsDirtyDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'analytics_dirty_days',
+            },
+        ),
+        migrations.RunPython(backfill_daily_facts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-19 21:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0097_analytics_dirty_days'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='domainevent',
+            name='failed_handlers',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -1,5 +1,7 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils import timezone
+import uuid
 
 
 class User(AbstractUser):
@@ -258,6 +260,7 @@ class Course(models.Model):
     subject = models.ForeignKey('Subject', on_delete=models.SET_NULL, null=True, related_name='courses')
     duration = models.CharField(max_length=50, blank=True, null=True, help_text="Duration in HH:MM:SS or minutes") # Modified duration
     lessons_count = models.IntegerField(default=0)
+    published_lessons_count = models.IntegerField(default=0, help_text="Maintained by the Lesson signals; denominator of enrollment progress")
     rating = models.DecimalField(max_digits=3, decimal_places=2, default=0)
     students_count = models.IntegerField(default=0)
     is_featured = models.BooleanField(default=False)
@@ -299,6 +302,7 @@ class Course(models.Model):
     creation_fee_transaction = models.ForeignKey('Transaction', on_delete=models.SET_NULL, null=True, blank=True, related_name='course_creation_fees')
     
     is_internal = models.BooleanField(default=False, help_text="Platformaning o'z kursi")
+    structure_version = models.PositiveIntegerField(default=0, help_text="Bumped on module/lesson changes (learning-state cache key)")
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -344,6 +348,7 @@ class Module(models.Model):
     description = models.TextField(blank=True)
     order = models.IntegerField(default=0)
     xp_reward = models.IntegerField(default=30, help_text="XP awarded for completing all lessons in this module")
+    published_lessons_count = models.IntegerField(default=0, help_text="Maintained by the Lesson signals")
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -534,11 +539,43 @@ class LessonProgress(models.Model):
         unique_together = ['user', 'lesson']
 
 
+class ModuleProgress(models.Model):
+    """Per-user module completion; completed_at is set once, together with the module XP reward"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='module_progress')
+    module = models.ForeignKey(Module, on_delete=models.CASCADE, related_name='user_progress')
+    completed_lessons_count = models.IntegerField(default=0, help_text="Completed published lessons, incremented on completion")
+    completed_at = models.DateTimeField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'module_progress'
+        unique_together = ['user', 'module']
+
+
+class LearningStateSnapshot(models.Model):
+    """
+    Precomputed learning state of a user in a course (see LearningService).
+    Bit i of each bitmap refers to the i-th lesson of the cached course structure.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='learning_snapshots')
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='learning_snapshots')
+    structure_key = models.CharField(max_length=50, help_text="Course structure version and lock strategy it was built for")
+    completed = models.BinaryField(default=b'')
+    locked = models.BinaryField(default=b'')
+    current_lesson = models.ForeignKey(Lesson, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'learning_state_snapshots'
+        unique_together = ['user', 'course']
+
+
 class Enrollment(models.Model):
     """Course Enrollment"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='enrollments')
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='enrollments')
     progress = models.DecimalField(max_digits=5, decimal_places=2, default=0)
+    completed_lessons_count = models.IntegerField(default=0, help_text="Completed published lessons, incremented on completion")
     completed_at = models.DateTimeField(blank=True, null=True)
     current_lesson = models.ForeignKey(Lesson, on_delete=models.SET_NULL, null=True, blank=True, related_name='current_learners')
     last_accessed_at = models.DateTimeField(auto_now=True)
@@ -657,6 +694,7 @@ class Olympiad(models.Model):
         ('FAILED', 'Xatolik'),
     ]
     reward_distribution_status = models.CharField(max_length=20, choices=DISTRIBUTION_STATUS_CHOICES, default='PENDING')
+    questions_version = models.PositiveIntegerField(default=0, help_text="Bumped on question changes (answer key cache key)")
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -754,8 +792,44 @@ class OlympiadPrize(models.Model):
         return f"{self.olympiad.title} - {self.name}"
 
 
+class BankQuestion(models.Model):
+    """
+    Deduplicated question content shared by olympiads (QuestionBankService).
+    Content is immutable: editing a Question links it to another item.
+    """
+    TYPE_CHOICES = [
+        ('MCQ', 'Multiple Choice'),
+        ('NUMERIC', 'Numeric Answer'),
+        ('TEXT', 'Text Answer'),
+        ('CODE', 'Code Submission'),
+    ]
+
+    content_hash = models.CharField(max_length=64, unique=True)
+    type = models.CharField(max_length=10, choices=TYPE_CHOICES, default='MCQ')
+    text = models.TextField()
+    options = models.JSONField(blank=True, null=True)
+    correct_answer = models.TextField()
+    # correct_answer normalized for grading, compiled once per item
+    answer_key = models.TextField(blank=True)
+    explanation = models.TextField(blank=True)
+    code_template = models.TextField(blank=True, null=True)
+
+    subject = models.ForeignKey('Subject', on_delete=models.SET_NULL, null=True, blank=True, related_name='bank_questions')
+    difficulty = models.CharField(max_length=20, choices=Olympiad.DIFFICULTY_CHOICES, default='MEDIUM')
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'question_bank'
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['subject', 'difficulty'])]
+
+    def __str__(self):
+        return self.text[:80]
+
+
 class Question(models.Model):
-    """Olympiad Question"""
+    """Olympiad Question: an ordered link to a bank item, with a copy of its content"""
     TYPE_CHOICES = [
         ('MCQ', 'Multiple Choice'),
         ('NUMERIC', 'Numeric Answer'),
@@ -773,6 +847,7 @@ class Question(models.Model):
     time_limit = models.IntegerField(default=0, help_text="Seconds for this specific question (0=none)")
     code_template = models.TextField(blank=True, null=True, help_text="Starter code for CODE questions")
     order = models.IntegerField(default=0)
+    bank_item = models.ForeignKey(BankQuestion, on_delete=models.PROTECT, null=True, blank=True, related_name='links')
     
     class Meta:
         db_table = 'questions'
@@ -902,6 +977,7 @@ class Certificate(models.Model):
     # Files
     qr_code = models.ImageField(upload_to='certificates/qr/', blank=True, null=True)
     pdf_file = models.FileField(upload_to='certificates/pdf/', blank=True, null=True)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True, help_text="Hash of the rendering inputs of the stored PDF/QR")
     
     class Meta:
         db_table = 'certificates'
@@ -953,6 +1029,56 @@ class Certificate(models.Model):
         return f"/certificate/verify/{self.cert_number}"
 
 
+class CertificateRenderJob(models.Model):
+    """Queued batch of certificates whose PDF/QR files are rendered by a worker pool"""
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('COMPLETED', 'Completed'),
+        ('FAILED', 'Failed'),
+    ]
+
+    certificate_ids = models.JSONField(default=list)
+    status = models.CharField(max_length=15, choices=STATUS_CHOICES, default='PENDING', db_index=True)
+    rendered_count = models.IntegerField(default=0)
+    failed_ids = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'certificate_render_jobs'
+        ordering = ['created_at']
+
+    def __str__(self):
+        return f"Render job {self.id} ({len(self.certificate_ids)} certificates, {self.status})"
+
+
+class DomainEvent(models.Model):
+    """Published domain event waiting for the process_domain_events worker (EVENT_BUS_MODE='worker')"""
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+    ]
+
+    name = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING', db_index=True)
+    # Handlers that failed on a FAILED event; a retry runs only these
+    failed_handlers = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'domain_events'
+        ordering = ['id']
+
+    def __str__(self):
+        return f"{self.name} {self.payload} ({self.status})"
+
+
 class SupportTicket(models.Model):
     """Support Ticket"""
     STATUS_CHOICES = [
@@ -1022,6 +1148,7 @@ class Payment(models.Model):
     method = models.CharField(max_length=20)  # PAYME, CLICK, UZCARD
     status = models.CharField(max_length=15, choices=STATUS_CHOICES, default='PENDING')
     transaction_id = models.CharField(max_length=100, blank=True, null=True)
+    external_id = models.CharField(max_length=100, unique=True, blank=True, null=True, help_text="Bank message / provider ID used to confirm this payment")
     receipt_image = models.ImageField(upload_to='payment_receipts/', blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     completed_at = models.DateTimeField(blank=True, null=True)
@@ -1086,6 +1213,21 @@ class BotConfig(models.Model):
         return f"Bot Config ({'Active' if self.is_active else 'Inactive'})"
 
 
+class BotConversationState(models.Model):
+    """Persisted runbot conversation state per chat (see BotStateStore)"""
+    chat_id = models.BigIntegerField(unique=True)
+    state = models.PositiveSmallIntegerField(default=0)
+    data = models.JSONField(default=dict, blank=True)
+    expires_at = models.DateTimeField(db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'bot_conversation_states'
+
+    def __str__(self):
+        return f"Chat {self.chat_id}: state {self.state}"
+
+
 class LevelReward(models.Model):
     """Rewards for reaching specific levels"""
     level = models.IntegerField(unique=True)
@@ -1481,6 +1623,7 @@ class Transaction(models.Model):
     payment_id = models.CharField(max_length=255, null=True, blank=True, help_text="External payment ID")
     description = models.TextField(blank=True)
     metadata = models.JSONField(default=dict, blank=True, help_text="Additional transaction data")
+    released_at = models.DateTimeField(null=True, blank=True, db_index=True, help_text="When sale earnings moved from pending to available balance")
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -1525,6 +1668,137 @@ class Payout(models.Model):
     def __str__(self):
         return f"Payout {self.id} - {self.teacher.username} - {self.amount} - {self.status}"
 
+class LedgerEntry(models.Model):
+    """
+    Append-only double-entry ledger line.
+    Every movement of money is a journal of entries that sum to zero;
+    User.balance and TeacherWallet balances are materialized from it.
+    """
+    ACCOUNT_TYPES = [
+        ('USER_BALANCE', 'User AC Balance'),
+        ('TEACHER_PENDING', 'Teacher Pending Balance'),
+        ('TEACHER_AVAILABLE', 'Teacher Available Balance'),
+        ('PLATFORM', 'Platform'),
+        ('EXTERNAL', 'External (cash in/out)'),
+    ]
+
+    journal_id = models.UUIDField(db_index=True)
+    account_type = models.CharField(max_length=20, choices=ACCOUNT_TYPES)
+    owner = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='ledger_entries')
+    amount = models.DecimalField(max_digits=14, decimal_places=2, help_text="Signed: positive credits the account, negative debits it")
+    entry_type = models.CharField(max_length=30, help_text="TOPUP, PURCHASE, COURSE_SALE, RELEASE, PAYOUT, ...")
+    reference = models.CharField(max_length=100, blank=True)
+    description = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'ledger_entries'
+        indexes = [
+            models.Index(fields=['account_type', 'owner', 'id']),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.pk:
+            raise ValueError("Ledger entries are append-only")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError("Ledger entries are append-only")
+
+    def __str__(self):
+        return f"{self.account_type}:{self.owner_id} {self.amount} ({self.entry_type})"
+
+class LedgerCheckpoint(models.Model):
+    """Balances of all ledger accounts up to (and including) last_entry_id"""
+    last_entry_id = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'ledger_checkpoints'
+        ordering = ['-id']
+
+    def __str__(self):
+        return f"Checkpoint {self.id} @ entry {self.last_entry_id}"
+
+class LedgerSnapshot(models.Model):
+    """Balance of one ledger account at a checkpoint"""
+    checkpoint = models.ForeignKey(LedgerCheckpoint, on_delete=models.CASCADE, related_name='snapshots')
+    account_type = models.CharField(max_length=20, choices=LedgerEntry.ACCOUNT_TYPES)
+    owner = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    balance = models.DecimalField(max_digits=14, decimal_places=2)
+
+    class Meta:
+        db_table = 'ledger_snapshots'
+        indexes = [
+            models.Index(fields=['account_type', 'owner', 'checkpoint']),
+        ]
+
+    def __str__(self):
+        return f"{self.account_type}:{self.owner_id} = {self.balance}"
+
+class DailyRevenue(models.Model):
+    """Pre-aggregated completed payments per day, payment type and product"""
+    date = models.DateField(db_index=True)
+    payment_type = models.CharField(max_length=20)
+    product_id = models.CharField(max_length=50, blank=True, default='', help_text="Payment.reference_id for COURSE/OLYMPIAD")
+    product_name = models.CharField(max_length=255, blank=True)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    payments_count = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'analytics_daily_revenue'
+        unique_together = ['date', 'payment_type', 'product_id']
+
+    def __str__(self):
+        return f"{self.date} {self.payment_type} {self.product_id}: {self.revenue}"
+
+class DailyUserStats(models.Model):
+    """New registrations per day"""
+    date = models.DateField(unique=True)
+    new_users = models.IntegerField(default=0)
+    new_students = models.IntegerField(default=0)
+    new_teachers = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'analytics_daily_users'
+
+    def __str__(self):
+        return f"{self.date}: +{self.new_users} users"
+
+class DailyEnrollmentStats(models.Model):
+    """Course enrollments and olympiad registrations per day"""
+    date = models.DateField(unique=True)
+    enrollments = models.IntegerField(default=0)
+    olympiad_registrations = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'analytics_daily_enrollments'
+
+    def __str__(self):
+        return f"{self.date}: {self.enrollments} enrollments, {self.olympiad_registrations} registrations"
+
+class AnalyticsRefresh(models.Model):
+    """Lock row serializing fact rebuilds; refreshed_at is when today's facts were last rebuilt"""
+    name = models.CharField(max_length=50, unique=True)
+    refreshed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'analytics_refresh'
+
+    def __str__(self):
+        return f"{self.name} @ {self.refreshed_at}"
+
+class AnalyticsDirtyDay(models.Model):
+    """Closed day whose facts changed after they were built (rebuilt by AnalyticsService.rebuild_dirty)"""
+    date = models.DateField(unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'analytics_dirty_days'
+
+    def __str__(self):
+        return str(self.date)
+
 class NotificationTemplate(models.Model):
     """Reusable message templates for common notifications"""
     name = models.CharField(max_length=100)
@@ -1633,6 +1907,7 @@ class Profession(models.Model):
     prestige_only = models.BooleanField(default=False)
     primary_subject = models.ForeignKey('Subject', on_delete=models.SET_NULL, null=True, blank=True, related_name='professions_featured')
     required_xp = models.IntegerField(default=0, help_text="Kasbni ochish uchun kerakli XP")
+    graph_version = models.PositiveIntegerField(default=0, help_text="Bumped on level/node changes (compiled career graph cache key)")
     total_required_xp = models.IntegerField(default=0, help_text="Kasb uchun umumiy talab qilingan XP")
     
     # Roadmap / Career Info
@@ -1940,8 +2215,10 @@ class AIMessage(models.Model):
     
     rating = models.IntegerField(null=True, blank=True, help_text="1 for Up, -1 for Down")
     feedback = models.TextField(blank=True, null=True)
-    
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Rows are written in batches after the reply (AILogBuffer): clients rate by uid
+    uid = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+
+    created_at = models.DateTimeField(default=timezone.now)
 
     class Meta:
         db_table = 'ai_messages'
@@ -1950,10 +2227,14 @@ class AIMessage(models.Model):
 class AIUnansweredQuestion(models.Model):
     """Captures questions where AI failed or was rated poorly"""
     question = models.TextField()
+    # Normalized question: repeats of an unresolved question increase its count
+    question_key = models.CharField(max_length=255, blank=True, db_index=True)
+    count = models.PositiveIntegerField(default=1)
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
     context_url = models.CharField(max_length=255, blank=True, null=True)
     is_resolved = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    last_asked_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         db_table = 'ai_unanswered_questions'
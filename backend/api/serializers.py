@@ -3,7 +3,7 @@ from django.db.models import Sum
 from django.contrib.auth.hashers import make_password
 from .models import (
     OlympiadRegistration, TestResult, Certificate, SupportTicket,
-    TicketMessage, Payment, BotConfig, LevelReward, User, Course, Lesson, Enrollment, Olympiad, Question,
+    TicketMessage, Payment, BotConfig, LevelReward, User, Course, Lesson, Enrollment, Olympiad, Question, BankQuestion,
     HomePageConfig, HomeStat, HomeStep, HomeAdvantage, FreeCourseSection, FreeCourseLessonCard, Subject, TeacherProfile, Notification,
     Profession, ProfessionSubject, ProfessionRoadmapStep, UserProfessionProgress,
     ProfessionLevel, ProfessionNode, UserProfessionState, UserNodeProgress, # Added new models
@@ -422,6 +422,16 @@ class QuestionAdminSerializer(serializers.ModelSerializer):
         model = Question
         fields = ['id', 'olympiad', 'text', 'options', 'correct_answer', 'explanation', 'points', 'order', 'time_limit', 'code_template'] # Full admin fields
 
+class BankQuestionSerializer(serializers.ModelSerializer):
+    """Question bank item for teachers (includes correct_answer)"""
+    subject_name = serializers.CharField(source='subject.name', read_only=True, default=None)
+    usage_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = BankQuestion
+        fields = ['id', 'type', 'text', 'options', 'correct_answer', 'explanation', 'code_template',
+                  'subject', 'subject_name', 'difficulty', 'usage_count', 'created_at']
+
 class LessonTestSerializer(serializers.ModelSerializer):
     questions = QuestionAdminSerializer(many=True, required=False)
     
@@ -0,0 +1,179 @@
+import atexit
+import logging
+import threading
+from collections import Counter
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from ..models import AIConversation, AIMessage, AIUnansweredQuestion
+from .faq_index import normalize
+
+logger = logging.getLogger(__name__)
+
+
+def question_key(question):
+    """Normalized form under which repeats of an unanswered question are counted"""
+    return ' '.join(normalize(question).split())[:255]
+
+
+class AILogBuffer:
+    """
+    Write-behind log of the AI assistant, so a query is answered from the
+    matcher alone. LLM replies are the exception: clients rate them by uid,
+    possibly on another worker, so AIService writes them directly.
+
+    Messages, conversation activity and unanswered questions are kept in
+    memory and written by flush(): messages with one bulk_create, activity
+    with one bulk_update per field, and each distinct unanswered question as
+    one row whose count grows with repeats. A background thread flushes every
+    flush_interval seconds, and as soon as batch_size entries are pending;
+    without an interval (flush_interval=None) the caller that fills the batch
+    flushes it. Entries still pending when the process dies are lost.
+    """
+
+    def __init__(self, batch_size=200, flush_interval=1.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._reset()
+
+    def _reset(self):
+        self._messages = []
+        self._activity = {}  # conversation_id -> (last_active, context_url)
+        self._unanswered = {}  # question_key -> [question, user_id, context_url, last_asked_at]
+        self._repeats = Counter()
+        self._pending = 0
+
+    # --- RECORDING ---
+
+    def add_message(self, conversation_id, role, content, source='FAQ', faq_id=None):
+        """Queue an AIMessage; returns its uid"""
+        message = AIMessage(
+            conversation_id=conversation_id, role=role, content=content, source=source, faq_id=faq_id,
+            created_at=timezone.now()
+        )
+        with self._lock:
+            self._messages.append(message)
+        self._added()
+        return message.uid
+
+    def touch_conversation(self, conversation_id, context_url=None):
+        with self._lock:
+            previous = self._activity.get(conversation_id)
+            if not context_url and previous:
+                context_url = previous[1]
+            self._activity[conversation_id] = (timezone.now(), context_url)
+        self._added()
+
+    def add_unanswered(self, question, user_id=None, context_url=None):
+        key = question_key(question)
+        with self._lock:
+            entry = self._unanswered.get(key)
+            if entry:
+                entry[1:] = [user_id or entry[1], context_url or entry[2], timezone.now()]
+            else:
+                self._unanswered[key] = [question, user_id, context_url, timezone.now()]
+            self._repeats[key] += 1
+        self._added()
+
+    def _added(self):
+        with self._lock:
+            self._pending += 1
+            full = self._pending >= self.batch_size
+        if self.flush_interval is None:
+            if full:
+                self.flush()
+            return
+        self._ensure_thread()
+        if full:
+            self._wake.set()
+
+    # --- FLUSHING ---
+
+    def flush(self):
+        """Write everything pending; returns the number of messages written"""
+        with self._flush_lock:
+            with self._lock:
+                messages, activity = self._messages, self._activity
+                unanswered, repeats = self._unanswered, self._repeats
+                self._reset()
+            if not (messages or activity or unanswered):
+                return 0
+            try:
+                with transaction.atomic():
+                    return self._write(messages, activity, unanswered, repeats)
+            except Exception:
+                logger.exception(
+                    f"AI log flush failed: dropped {len(messages)} messages, {len(unanswered)} unanswered questions"
+                )
+                return 0
+
+    def _write(self, messages, activity, unanswered, repeats):
+        # Conversations an admin deleted meanwhile would fail the whole batch
+        conversation_ids = {message.conversation_id for message in messages} | activity.keys()
+        existing = set(
+            AIConversation.objects.filter(id__in=conversation_ids).order_by().values_list('id', flat=True)
+        )
+        messages = [message for message in messages if message.conversation_id in existing]
+        AIMessage.objects.bulk_create(messages)
+
+        touched = [
+            AIConversation(id=conversation_id, last_active=last_active, context_url=context_url)
+            for conversation_id, (last_active, context_url) in activity.items() if conversation_id in existing
+        ]
+        AIConversation.objects.bulk_update(touched, ['last_active'])
+        AIConversation.objects.bulk_update([conv for conv in touched if conv.context_url], ['context_url'])
+
+        if unanswered:
+            known = {}
+            for row in AIUnansweredQuestion.objects.filter(
+                question_key__in=unanswered.keys(), is_resolved=False
+            ).order_by('id').only('id', 'question_key'):
+                known.setdefault(row.question_key, row.id)
+            new_rows = []
+            for key, (question, user_id, context_url, asked_at) in unanswered.items():
+                if key in known:
+                    AIUnansweredQuestion.objects.filter(id=known[key]).update(
+                        count=F('count') + repeats[key], last_asked_at=asked_at
+                    )
+                else:
+                    new_rows.append(AIUnansweredQuestion(
+                        question=question, question_key=key, count=repeats[key], user_id=user_id,
+                        context_url=context_url, last_asked_at=asked_at
+                    ))
+            AIUnansweredQuestion.objects.bulk_create(new_rows)
+        return len(messages)
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='ai-log', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+
+@lru_cache(maxsize=None)
+def ai_log_buffer():
+    """Process-wide buffer, configured by AI_LOG_BATCH_SIZE and AI_LOG_FLUSH_INTERVAL"""
+    buffer = AILogBuffer(
+        batch_size=getattr(settings, 'AI_LOG_BATCH_SIZE', 200),
+        flush_interval=getattr(settings, 'AI_LOG_FLUSH_INTERVAL', 1.0),
+    )
+    atexit.register(buffer.flush)
+    return buffer
@@ -1,8 +1,15 @@
 import logging
 import random
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import cache
 from django.utils import timezone
 from ..models import AIAssistantFAQ, AIConversation, AIMessage, AIUnansweredQuestion
 from django.db.models import Q
+from .ai_log_buffer import ai_log_buffer
+from .faq_embeddings import FAQEmbeddingIndex
+from .faq_index import FAQIndex
 
 logger = logging.getLogger(__name__)
 
@@ -11,9 +18,26 @@ class AIService:
     Hybrid AI Engine: FAQ Matching + LLM Fallback
     """
 
+    CONVERSATION_CACHE_TTL = 60 * 60 * 24
+
     @staticmethod
     def get_or_create_conversation(user=None, session_id=None, context_url=None):
-        if user and user.is_authenticated:
+        """
+        Conversation of the user (or anonymous session). Its id is cached, so
+        repeat queries skip the database: the returned instance is then not
+        loaded from it and must not be saved. Activity is logged through
+        AILogBuffer.
+        """
+        authenticated = bool(user and user.is_authenticated)
+        key = f"ai_conversation:user:{user.id}" if authenticated else f"ai_conversation:session:{session_id}"
+        cached = cache.get(key)
+        if cached:
+            conversation_id, known_url = cached
+            conv = AIConversation(
+                id=conversation_id, user=user if authenticated else None, session_id=session_id or '',
+                context_url=context_url or known_url
+            )
+        elif authenticated:
             conv, created = AIConversation.objects.get_or_create(
                 user=user,
                 defaults={'context_url': context_url}
@@ -23,11 +47,10 @@ class AIService:
                 session_id=session_id,
                 defaults={'context_url': context_url}
             )
-        
-        if not created and context_url:
-            conv.context_url = context_url
-            conv.save(update_fields=['context_url', 'last_active'])
-        
+
+        if not cached or (context_url and context_url != cached[1]):
+            cache.set(key, (conv.id, context_url or conv.context_url), AIService.CONVERSATION_CACHE_TTL)
+        ai_log_buffer().touch_conversation(conv.id, context_url)
         return conv
 
     @staticmethod
@@ -36,14 +59,10 @@ class AIService:
         Main logic for processing user query
         1. Find best FAQ match
         2. If no match, use LLM (Fallback)
-        3. Log both query and response
+        3. Log both query and response (written behind by AILogBuffer)
         """
-        # Log user message
-        AIMessage.objects.create(
-            conversation=conversation,
-            role='user',
-            content=question
-        )
+        log = ai_log_buffer()
+        log.add_message(conversation.id, 'user', question)
 
         # 1. Try to find match in FAQ
         faq_match = AIService.find_faq_match(question, language)
@@ -56,13 +75,7 @@ class AIService:
             } if faq_match.action_link else None
 
             # Log bot response
-            AIMessage.objects.create(
-                conversation=conversation,
-                role='assistant',
-                content=answer,
-                source='FAQ',
-                faq=faq_match
-            )
+            log.add_message(conversation.id, 'assistant', answer, source='FAQ', faq_id=faq_match.id)
             
             return {
                 'type': 'FAQ',
@@ -74,50 +87,58 @@ class AIService:
         # 2. Fallback to LLM (Mocked for now, easily pluggable)
         llm_response = AIService.call_llm(question, conversation.context_url, language)
         
-        # Log bot response
-        msg = AIMessage.objects.create(
-            conversation=conversation,
-            role='assistant',
-            content=llm_response,
-            source='LLM'
+        # Written at once, unlike the rest of the log: it can be rated right away, possibly on another worker
+        message = AIMessage.objects.create(
+            conversation_id=conversation.id, role='assistant', content=llm_response, source='LLM'
         )
 
-        # Log as unanswered for admin review
-        AIUnansweredQuestion.objects.create(
-            question=question,
-            user=conversation.user,
-            context_url=conversation.context_url
-        )
+        # Log as unanswered for admin review (repeats are counted on one row)
+        log.add_unanswered(question, conversation.user_id, conversation.context_url)
 
         return {
             'type': 'LLM',
             'content': llm_response,
-            'message_id': msg.id
+            'message_id': str(message.uid)
         }
 
     @staticmethod
     def find_faq_match(question, language):
         """
-        Simple keyword based matching. Can be improved with trigram search or vector embeddings.
+        Best FAQ for the question, or None when nothing is confident enough.
+
+        Only FAQs whose keyword confidence (FAQIndex) clears MIN_CONFIDENCE
+        can match. Embedding similarity (FAQEmbeddingIndex) re-ranks those
+        candidates, blended in with AI_FAQ_SEMANTIC_WEIGHT, but never accepts
+        a match on its own: n-gram similarity also rewards questions that
+        merely share a word with an FAQ. The semantic stage is skipped while
+        its index is not built or once the keyword stage has used up
+        AI_FAQ_LATENCY_BUDGET_MS.
         """
-        question = question.lower().strip()
-        words = question.split()
-        
-        # Priority 1: Exact matches or very close matches in search_tags
-        faqs = AIAssistantFAQ.objects.filter(is_active=True)
-        
-        for faq in faqs:
-            tags = [t.strip().lower() for t in faq.search_tags.split(',')] if faq.search_tags else []
-            # Check if all words or major words are in tags
-            if any(word in tags for word in words):
-                return faq
-            
-            # Simple substring match in questions
-            q_text = faq.question_uz.lower() if language == 'uz' else faq.question_ru.lower()
-            if question in q_text or q_text in question:
-                return faq
+        start = time.perf_counter()
+        index = FAQIndex.get()
+        candidates = [
+            (faq, score, confidence) for faq, score, confidence in index.search(question)
+            if confidence >= index.MIN_CONFIDENCE
+        ]
+        if not candidates:
+            return None
+
+        weight = getattr(settings, 'AI_FAQ_SEMANTIC_WEIGHT', 0)
+        budget_ms = getattr(settings, 'AI_FAQ_LATENCY_BUDGET_MS', 25)
+        if len(candidates) == 1 or not weight or (time.perf_counter() - start) * 1000 > budget_ms:
+            return candidates[0][0]
+        # Only now: get() stats the embedding files
+        semantic_index = FAQEmbeddingIndex.get()
+        if semantic_index is None:
+            return candidates[0][0]
 
-        return None
+        semantic = dict(semantic_index.search(question, limit=len(index.faqs)))
+
+        def blended(candidate):
+            faq, score, confidence = candidate
+            return (1 - weight) * confidence + weight * semantic.get(faq.id, 0.0), score
+
+        return max(candidates, key=blended)[0]
 
     @staticmethod
     def call_llm(question, context_url, language='uz'):
@@ -149,8 +170,20 @@ class AIService:
 
     @staticmethod
     def rate_response(message_id, rating, feedback=None):
+        """Rate a message by uid (or by id, as returned before uids existed)"""
+        if str(message_id).isdigit():
+            lookup = {'id': message_id}
+        else:
+            try:
+                lookup = {'uid': uuid.UUID(str(message_id))}
+            except ValueError:
+                return False
+
+        # Rateable (LLM) replies are written at once; the user's question may still be pending in this process
+        log = ai_log_buffer()
+        log.flush()
         try:
-            msg = AIMessage.objects.get(id=message_id)
+            msg = AIMessage.objects.select_related('conversation').get(**lookup)
             msg.rating = rating
             if feedback:
                 msg.feedback = feedback
@@ -158,10 +191,12 @@ class AIService:
             
             # If rejected, maybe flag for admin review
             if rating == -1:
-                AIUnansweredQuestion.objects.create(
-                    question=f"LOW RATING for: {msg.content} | Original query: {msg.conversation.messages.filter(role='user').last().content}",
-                    user=msg.conversation.user,
-                    context_url=msg.conversation.context_url
+                # ...or in another worker's buffer
+                original = msg.conversation.messages.filter(role='user').last()
+                log.add_unanswered(
+                    f"LOW RATING for: {msg.content} | Original query: {original.content if original else ''}",
+                    msg.conversation.user_id,
+                    msg.conversation.context_url
                 )
             
             return True
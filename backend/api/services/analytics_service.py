@@ -0,0 +1,217 @@
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Sum, Count, Q
+from django.db.models.functions import TruncDate, Coalesce
+from django.utils import timezone
+
+from ..models import (
+    Payment, User, Enrollment, OlympiadRegistration, Course, Olympiad,
+    DailyRevenue, DailyUserStats, DailyEnrollmentStats, AnalyticsRefresh, AnalyticsDirtyDay
+)
+
+
+class AnalyticsService:
+    """
+    Daily fact tables behind the admin analytics endpoints.
+
+    Closed days are built by the nightly build_analytics command; today's rows
+    are rebuilt at most every TODAY_REFRESH_SECONDS on read, so dashboards
+    only ever query the small fact tables. Rebuilds of all workers and the
+    command are serialized by a row lock on the AnalyticsRefresh marker,
+    which also records when today was last rebuilt. Changes to records of
+    earlier days (refunds, deletions) mark those days dirty; they are
+    rebuilt with the next refresh of today.
+    """
+
+    TODAY_REFRESH_SECONDS = 300
+    LOCK_NAME = 'daily_facts'
+    PRODUCT_TYPES = ('COURSE', 'OLYMPIAD')
+
+    @staticmethod
+    def _day_range(start_date, end_date):
+        """Aware datetime bounds [start_date 00:00, end_date+1 00:00) in local time"""
+        tz = timezone.get_current_timezone()
+        start = timezone.make_aware(datetime.combine(start_date, time.min), tz)
+        end = timezone.make_aware(datetime.combine(end_date + timedelta(days=1), time.min), tz)
+        return start, end
+
+    @classmethod
+    @transaction.atomic
+    def rebuild(cls, start_date, end_date):
+        """Recompute all fact rows for days in [start_date, end_date]"""
+        marker = cls._lock()
+        start, end = cls._day_range(start_date, end_date)
+
+        # Revenue by day/type/product (bucketed by completion time)
+        revenue_rows = Payment.objects.filter(status='COMPLETED').annotate(
+            paid_at=Coalesce('completed_at', 'created_at')
+        ).filter(paid_at__gte=start, paid_at__lt=end).annotate(
+            date=TruncDate('paid_at')
+        ).values('date', 'type', 'reference_id').annotate(
+            revenue=Sum('amount'), payments_count=Count('id')
+        ).order_by()
+
+        revenue_rows = list(revenue_rows)
+        names = cls._product_names(revenue_rows)
+
+        facts = {}
+        for row in revenue_rows:
+            product_id = (row['reference_id'] or '') if row['type'] in cls.PRODUCT_TYPES else ''
+            key = (row['date'], row['type'], product_id)
+            fact = facts.get(key)
+            if fact is None:
+                fact = facts[key] = DailyRevenue(
+                    date=row['date'], payment_type=row['type'], product_id=product_id,
+                    product_name=names.get((row['type'], product_id), '')
+                )
+            fact.revenue += row['revenue'] or 0
+            fact.payments_count += row['payments_count']
+
+        users = User.objects.filter(date_joined__gte=start, date_joined__lt=end).annotate(
+            date=TruncDate('date_joined')
+        ).values('date').annotate(
+            new_users=Count('id'),
+            new_students=Count('id', filter=Q(role='STUDENT')),
+            new_teachers=Count('id', filter=Q(role='TEACHER')),
+        ).order_by()
+
+        enrollments = dict(
+            Enrollment.objects.filter(created_at__gte=start, created_at__lt=end).annotate(
+                date=TruncDate('created_at')
+            ).values('date').annotate(count=Count('id')).order_by().values_list('date', 'count')
+        )
+        registrations = dict(
+            OlympiadRegistration.objects.filter(registered_at__gte=start, registered_at__lt=end).annotate(
+                date=TruncDate('registered_at')
+            ).values('date').annotate(count=Count('id')).order_by().values_list('date', 'count')
+        )
+
+        DailyRevenue.objects.filter(date__gte=start_date, date__lte=end_date).delete()
+        DailyUserStats.objects.filter(date__gte=start_date, date__lte=end_date).delete()
+        DailyEnrollmentStats.objects.filter(date__gte=start_date, date__lte=end_date).delete()
+
+        DailyRevenue.objects.bulk_create(facts.values(), batch_size=1000)
+        DailyUserStats.objects.bulk_create([DailyUserStats(**row) for row in users], batch_size=1000)
+        DailyEnrollmentStats.objects.bulk_create([
+            DailyEnrollmentStats(date=date, enrollments=enrollments.get(date, 0), olympiad_registrations=registrations.get(date, 0))
+            for date in set(enrollments) | set(registrations)
+        ], batch_size=1000)
+
+        if end_date >= timezone.localdate():
+            marker.refreshed_at = timezone.now()
+            marker.save(update_fields=['refreshed_at'])
+        return len(facts)
+
+    @classmethod
+    def _lock(cls):
+        """Marker row, locked until the surrounding transaction ends"""
+        marker, _ = AnalyticsRefresh.objects.select_for_update().get_or_create(name=cls.LOCK_NAME)
+        return marker
+
+    @staticmethod
+    def _product_names(revenue_rows):
+        """Titles for all products in revenue_rows: one query per product type"""
+        ids = {'COURSE': set(), 'OLYMPIAD': set()}
+        for row in revenue_rows:
+            if row['type'] in ids and (row['reference_id'] or '').isdigit():
+                ids[row['type']].add(int(row['reference_id']))
+
+        names = {}
+        for product_id, title in Course.objects.filter(id__in=ids['COURSE']).values_list('id', 'title'):
+            names[('COURSE', str(product_id))] = title
+        for product_id, title in Olympiad.objects.filter(id__in=ids['OLYMPIAD']).values_list('id', 'title'):
+            names[('OLYMPIAD', str(product_id))] = title
+        return names
+
+    @staticmethod
+    def mark_dirty(*moments):
+        """Queue the local days of these datetimes (None ignored) for a rebuild; today is refreshed anyway"""
+        today = timezone.localdate()
+        dates = {timezone.localtime(moment).date() for moment in moments if moment} - {today}
+        if dates:
+            AnalyticsDirtyDay.objects.bulk_create(
+                [AnalyticsDirtyDay(date=date) for date in dates], ignore_conflicts=True
+            )
+
+    @classmethod
+    @transaction.atomic
+    def rebuild_dirty(cls):
+        """Rebuild every day marked dirty, one rebuild per run of consecutive days; returns the number of days"""
+        cls._lock()
+        dates = list(AnalyticsDirtyDay.objects.order_by('date').values_list('date', flat=True))
+        # Cleared before rebuilding: a change committed meanwhile marks its day again
+        AnalyticsDirtyDay.objects.filter(date__in=dates).delete()
+        start = None
+        for i, date in enumerate(dates):
+            start = start or date
+            if i + 1 == len(dates) or dates[i + 1] != date + timedelta(days=1):
+                cls.rebuild(start, date)
+                start = None
+        return len(dates)
+
+    @classmethod
+    def refresh_today(cls, force=False):
+        """Rebuild today's facts, throttled so concurrent dashboard reads share one rebuild"""
+        fresh_since = timezone.now() - timedelta(seconds=cls.TODAY_REFRESH_SECONDS)
+        if not force and AnalyticsRefresh.objects.filter(name=cls.LOCK_NAME, refreshed_at__gte=fresh_since).exists():
+            return
+        with transaction.atomic():
+            marker = cls._lock()
+            # Another worker may have rebuilt while this one waited for the lock
+            if force or not marker.refreshed_at or marker.refreshed_at < fresh_since:
+                today = timezone.localdate()
+                cls.rebuild(today, today)
+                cls.rebuild_dirty()
+
+    @classmethod
+    def backfill(cls, start_date=None, end_date=None, chunk_days=31):
+        """Build facts from the first payment/user (or start_date) up to end_date, month by month"""
+        end_date = end_date or timezone.localdate()
+        if start_date is None:
+            first = User.objects.order_by('date_joined').values_list('date_joined', flat=True).first()
+            first_payment = Payment.objects.order_by('created_at').values_list('created_at', flat=True).first()
+            candidates = [timezone.localtime(value).date() for value in (first, first_payment) if value]
+            start_date = min(candidates) if candidates else end_date
+
+        days = 0
+        chunk_start = start_date
+        while chunk_start <= end_date:
+            chunk_end = min(chunk_start + timedelta(days=chunk_days - 1), end_date)
+            cls.rebuild(chunk_start, chunk_end)
+            days += (chunk_end - chunk_start).days + 1
+            chunk_start = chunk_end + timedelta(days=1)
+        return days
+
+    # --- READS ---
+
+    @classmethod
+    def revenue_totals(cls, **ranges):
+        """
+        Revenue sums for several date ranges in one query.
+        ranges: name=(start_date or None, payment_type or None)
+        """
+        cls.refresh_today()
+        aggregates = {}
+        for name, (start_date, payment_type) in ranges.items():
+            condition = Q()
+            if start_date:
+                condition &= Q(date__gte=start_date)
+            if payment_type:
+                condition &= Q(payment_type=payment_type)
+            aggregates[name] = Sum('revenue', filter=condition or None)
+        totals = DailyRevenue.objects.aggregate(**aggregates)
+        return {name: value or 0 for name, value in totals.items()}
+
+    @classmethod
+    def new_users_totals(cls, **ranges):
+        """New user counts for several (start_date, end_date) ranges in one query"""
+        cls.refresh_today()
+        aggregates = {}
+        for name, (start_date, end_date) in ranges.items():
+            condition = Q(date__gte=start_date)
+            if end_date:
+                condition &= Q(date__lt=end_date)
+            aggregates[name] = Sum('new_users', filter=condition)
+        totals = DailyUserStats.objects.aggregate(**aggregates)
+        return {name: value or 0 for name, value in totals.items()}
@@ -0,0 +1,597 @@
+import logging
+import time
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.core.files.base import ContentFile
+from django.utils import timezone
+
+from ..models import BotConfig, User, Payment, WinnerPrize, PrizeAddress
+from ..models_settings import PlatformSettings, PaymentProviderConfig
+from .bot_state_service import BotStateStore
+from .bot_update_core import pooled_session
+from .payment_service import PaymentService
+
+logger = logging.getLogger(__name__)
+
+# STATES
+STATE_NONE = 0
+STATE_WAIT_PHONE = 1 # Not used if contact is shared directly
+STATE_WAIT_AMOUNT = 2
+STATE_WAIT_RECEIPT = 3
+STATE_WAIT_ADDRESS = 4
+
+MAIN_MENU = {
+    "keyboard": [
+        [{"text": "💰 Hisobim"}, {"text": "➕ Hisob to'ldirish"}],
+        [{"text": "🏆 Mening Olimpiadalarim"}, {"text": "📚 Mening Kurslarim"}],
+        [{"text": "📊 Natijalarim"}, {"text": "👤 Profil"}],
+        [{"text": "🎥 Meetinglar"}, {"text": "❓ Yordam"}]
+    ],
+    "resize_keyboard": True
+}
+
+HELP_TEXT = """
+❓ <b>Yordam markazi</b>
+
+Bot orqali siz:
+• Olimpiada va darslar haqida eslatmalar olasiz
+• Kurslaringiz progressini kuzatasiz
+• Imtihon natijalarini ko'rasiz
+• Hisobingizni to'ldirasiz
+
+Agar savollaringiz bo'lsa, @admin_user ga murojaat qiling yoki platformadagi "Yordam" bo'limidan foydalaning.
+"""
+
+
+class BotUpdateHandler:
+    """
+    Command, menu and callback handling of the Telegram bot.
+
+    One instance is registered with BotUpdateCore by each entry point: the
+    polling bot (runbot) and the webhook (webhook_core). Without a token the
+    active BotConfig is read on every call, so the webhook follows config changes.
+    """
+
+    def __init__(self, token=None, session=None, states=None):
+        self._token = token
+        self.session = session or pooled_session(8)
+        self.states = states or BotStateStore()
+
+    @property
+    def bot_token(self):
+        if self._token:
+            return self._token
+        config = BotConfig.objects.filter(is_active=True).first()
+        return config.bot_token if config else None
+
+    # --- TELEGRAM API ---
+
+    def send_request(self, method, payload=None, token=None):
+        """Helper to send requests to Telegram API"""
+        token = token or self.bot_token
+        if not token:
+            logger.error("Bot configuration missing or inactive")
+            return None
+        url = f"https://api.telegram.org/bot{token}/{method}"
+        try:
+            if payload:
+                # remove None values
+                payload = {k: v for k, v in payload.items() if v is not None}
+                response = self.session.post(url, json=payload, timeout=20)
+            else:
+                response = self.session.get(url, timeout=20)
+            return response.json()
+        except Exception as e:
+            logger.error(f"Request Error ({method}): {e}")
+            return None
+
+    def send_message(self, chat_id, text, reply_markup=None):
+        payload = {
+            "chat_id": chat_id,
+            "text": text,
+            "parse_mode": "HTML",
+            "reply_markup": reply_markup
+        }
+        return self.send_request("sendMessage", payload)
+
+    def send_photo(self, chat_id, photo_url_or_id, caption=None, reply_markup=None):
+        payload = {
+            "chat_id": chat_id,
+            "photo": photo_url_or_id,
+            "caption": caption,
+            "parse_mode": "HTML",
+            "reply_markup": reply_markup
+        }
+        return self.send_request("sendPhoto", payload)
+
+    def show_main_menu(self, chat_id, text="Nima bilan yordam bera olaman?"):
+        return self.send_message(chat_id, text, reply_markup=MAIN_MENU)
+
+    def get_admin_ids(self):
+        """Fetch current admin IDs from DB to ensure hot-reload"""
+        config = BotConfig.objects.filter(is_active=True).first()
+        if config and config.admin_chat_id:
+            return [chat_id.strip() for chat_id in config.admin_chat_id.split(',') if chat_id.strip()]
+        return []
+
+    def send_to_admins(self, text):
+        for admin_id in self.get_admin_ids():
+            self.send_message(admin_id, text)
+
+    def get_rate(self):
+        """Get current ArdCoin exchange rate from settings"""
+        settings = PlatformSettings.objects.first()
+        if settings and settings.ardcoin_exchange_rate:
+            return float(settings.ardcoin_exchange_rate)
+        return 1.0  # Default to 1 so'm if not set
+
+    def get_manual_provider(self):
+        return PaymentProviderConfig.objects.filter(type='MANUAL', is_active=True).first()
+
+    # --- UPDATES ---
+
+    def handle_update(self, update):
+        """Process one update; registered with BotUpdateCore by runbot and the webhook"""
+        # Handle Callback Queries (Admin Actions)
+        if 'callback_query' in update:
+            self.handle_callback(update['callback_query'])
+            return
+
+        # Handle Messages
+        if 'message' not in update:
+            return
+
+        message = update['message']
+        chat_id = message['chat']['id']
+        text = (message.get('text') or '').strip()
+
+        # Check Active State
+        state_data = self.states.get(chat_id)
+        state = state_data["state"]
+
+        # Handle Location specifically for prizes
+        if message.get('location'):
+            self.handle_location(chat_id, message['location'])
+            return
+
+        if message.get('contact'):
+            phone = message['contact'].get('phone_number')
+            if phone:
+                self.handle_contact_login(chat_id, phone)
+            return
+
+        # --- COMMANDS ---
+
+        if text.startswith('/start'):
+            self.handle_start(chat_id, text)
+            return
+
+        if text in ('/cancel', '❌ Bekor qilish'):
+            self.states.clear(chat_id)
+            self.show_main_menu(chat_id, "❌ Bekor qilindi.")
+            return
+
+        # Verify User Login for everything below
+        user = User.objects.filter(telegram_id=chat_id).first()
+        if not user:
+            if state == STATE_NONE:
+                self.send_message(chat_id, "⚠️ Iltimos, /start ni bosib telefon raqamingizni yuboring.")
+            return
+
+        # Handle Photos (Payment Receipts)
+        if 'photo' in message:
+            if state == STATE_WAIT_RECEIPT:
+                self.handle_receipt(chat_id, user, state_data['data'], message['photo'][-1]['file_id'])
+            return
+
+        # --- MENU ---
+
+        menu_handler = self.MENU.get(text)
+        if menu_handler:
+            getattr(self, menu_handler)(chat_id, user)
+            return
+
+        # --- STATE HANDLERS ---
+
+        if state == STATE_WAIT_AMOUNT:
+            self.handle_amount(chat_id, text)
+            return
+
+        if state == STATE_WAIT_RECEIPT:
+            self.send_message(chat_id, "⚠️ Iltimos, chek rasmini yuboring yoki /cancel ni bosing.")
+            return
+
+        # Free text is an address while a prize is waiting for one
+        if text and not text.startswith('/'):
+            self.handle_address_text(chat_id, user, text, requested=state == STATE_WAIT_ADDRESS)
+
+    MENU = {
+        "👤 Profil": 'show_profile',
+        "💰 Hisobim": 'show_balance',
+        "➕ Hisob to'ldirish": 'start_topup',
+        "🏆 Mening Olimpiadalarim": 'show_olympiads',
+        "📚 Mening Kurslarim": 'show_courses',
+        "📊 Natijalarim": 'show_results',
+        "🎥 Meetinglar": 'show_meetings',
+        "❓ Yordam": 'show_help',
+    }
+
+    def handle_start(self, chat_id, text):
+        parts = text.split()
+        argument = parts[1] if len(parts) > 1 else ''
+
+        if argument.startswith('pay_'):
+            self.start_payment(chat_id, argument[len('pay_'):])
+        elif argument.startswith('topup_'):
+            self.start_topup_amount(chat_id, argument[len('topup_'):])
+        elif argument:
+            # Account linking: /start <token> from the platform profile
+            from ..bot_service import BotService
+            user = BotService.link_user(chat_id, argument)
+            if user:
+                self.states.clear(chat_id)
+                self.show_main_menu(chat_id, f"✅ <b>Tabriklaymiz, {user.first_name}!</b>\n\nSizning platformadagi hisobingiz muvaffaqiyatli bog'landi.")
+            else:
+                self.send_message(chat_id, "❌ <b>Xatolik!</b>\n\nToken yaroqsiz yoki muddati o'tgan. Iltimos, platformadan qaytadan urinib ko'ring.")
+        else:
+            # Reset state
+            self.states.clear(chat_id)
+
+            user = User.objects.filter(telegram_id=chat_id).first()
+            if user:
+                self.show_main_menu(chat_id, f"👋 Salom, <b>{user.first_name}</b>!\n\nPlatforma botiga xush kelibsiz.")
+            else:
+                welcome_text = (
+                    "👋 <b>Assalomu alaykum!</b>\n\n"
+                    "Bu <b>Ardent Olimpiada</b> rasmiy boti.\n"
+                    "Hisobingizga kirish uchun telefon raqamingizni yuboring:"
+                )
+                keyboard = {
+                    "keyboard": [
+                        [{"text": "📱 Telefon raqamni yuborish", "request_contact": True}]
+                    ],
+                    "resize_keyboard": True,
+                    "one_time_keyboard": True
+                }
+                self.send_message(chat_id, welcome_text, reply_markup=keyboard)
+
+    def payment_details(self, coins, total_sum, card_number, holder):
+        return (
+            f"💳 <b>To'lov uchun ma'lumot:</b>\n\n"
+            f"🪙 <b>Miqdor:</b> {coins} AC\n"
+            f"💵 <b>To'lanadigan summa:</b> {total_sum:,.0f} so'm\n\n"
+            f"🏦 <b>Karta:</b> <code>{card_number}</code>\n"
+            f"👤 <b>Ega:</b> {holder}\n\n"
+            f"❗️ Iltimos, to'lovni amalga oshirib, <b>CHEK RASMINI</b> shu yerga yuboring."
+        )
+
+    def start_payment(self, chat_id, payment_id):
+        """/start pay_<id>: card details for a pending platform payment"""
+        try:
+            payment = Payment.objects.filter(id=int(payment_id), status='PENDING').first()
+        except ValueError:
+            payment = None
+        if not payment:
+            self.send_message(chat_id, "❌ To'lov topilmadi yoki allaqachon yakunlangan.")
+            return
+
+        manual_config = self.get_manual_provider()
+        card_number = manual_config.config.get('card_number', '----') if manual_config else "Admin so'rang"
+        card_holder = manual_config.config.get('holder_name', '') if manual_config else ""
+
+        msg = (
+            f"🆔 <b>To'lov ID:</b> #{payment.id}\n"
+            f"💰 <b>Summa:</b> {int(payment.amount):,} UZS\n\n"
+            f"💳 <b>Karta:</b> <code>{card_number}</code>\n"
+            f"👤 <b>Ega:</b> {card_holder}\n\n"
+            f"📸 Iltimos, to'lovni amalga oshirib, <b>chekni (skrinshot)</b> ushbu botga yuboring."
+        )
+        self.send_message(chat_id, msg)
+        self.states.set(chat_id, STATE_WAIT_RECEIPT, {"payment_id": payment.id})
+
+    def start_topup_amount(self, chat_id, amount):
+        """/start topup_<so'm>: top-up with the amount chosen on the platform"""
+        try:
+            amount_uzs = int(amount)
+        except ValueError:
+            self.send_message(chat_id, "❌ Noto'g'ri summa formati.")
+            return
+
+        coins = int(amount_uzs / self.get_rate())
+        if coins < 10:
+            self.send_message(chat_id, "⚠️ Minimal miqdor: 10 Coin")
+            return
+
+        manual_config = self.get_manual_provider()
+        if not manual_config:
+            self.send_message(chat_id, "⚠️ Tachim to'lov tizimida xatolik. Admin bilan bog'laning.")
+            return
+
+        self.states.set(chat_id, STATE_WAIT_RECEIPT, {"amount": coins, "sum": amount_uzs})
+        self.send_message(chat_id, self.payment_details(
+            coins, amount_uzs, manual_config.config.get('card_number', '----'), manual_config.config.get('holder_name', '')
+        ))
+
+    def handle_amount(self, chat_id, text):
+        try:
+            coins = int(text)
+        except ValueError:
+            self.send_message(chat_id, "⚠️ Iltimos, faqat raqam kiriting (masalan: 100).")
+            return
+        if coins < 10:
+            self.send_message(chat_id, "⚠️ Minimal miqdor: 10 Coin")
+            return
+
+        total_sum = coins * self.get_rate()
+        provider_config = self.get_manual_provider()
+        if not provider_config:
+            self.send_message(chat_id, "⚠️ Hozircha karta orqali to'lov ishlamayapti. Keyinroq urinib ko'ring.")
+            self.states.clear(chat_id)
+            return
+
+        self.states.update(chat_id, STATE_WAIT_RECEIPT, amount=coins, sum=total_sum)
+        self.send_message(chat_id, self.payment_details(
+            coins, total_sum, provider_config.config.get('card_number', "ADMIN SO'RANG"), provider_config.config.get('holder_name', '')
+        ))
+
+    def handle_receipt(self, chat_id, user, data, file_id):
+        coins = data.get("amount")
+        total_sum = data.get("sum")
+        if not coins or not total_sum:
+            self.send_message(chat_id, "❌ Ma'lumotlar eskirgan. Iltimos qaytadan /start bosib urinib ko'ring.")
+            self.states.clear(chat_id)
+            return
+        self.create_payment_request(chat_id, user, coins, total_sum, file_id)
+
+    def create_payment_request(self, chat_id, user, coins, total_sum, file_id):
+        try:
+            # 1. Download Photo
+            file_info = self.send_request("getFile", {"file_id": file_id})
+            if not file_info or not file_info.get('ok'):
+                logger.error(f"getFile Failed. Info: {file_info}")
+                self.send_message(chat_id, "⚠️ Telegram fayl ma'lumotlarini bermadi. Qaytadan urinib ko'ring.")
+                return
+
+            file_path = file_info['result']['file_path']
+            r = self.session.get(f"https://api.telegram.org/file/bot{self.bot_token}/{file_path}", timeout=30)
+            if r.status_code != 200:
+                logger.error(f"Image Download Failed. Status: {r.status_code}")
+                self.send_message(chat_id, f"⚠️ Image Download Failed. Status: {r.status_code}")
+                return
+
+            # Save Payment DB
+            payment = Payment.objects.create(
+                user=user,
+                amount=total_sum, # Final Amount in UZS
+                original_amount=total_sum,
+                type='TOPUP',
+                method='BOT',
+                status='PENDING',
+                transaction_id=f"BOT-{int(time.time())}"
+            )
+            payment.receipt_image.save(f"receipt_{payment.id}.jpg", ContentFile(r.content))
+
+            # Notify User
+            self.send_message(chat_id, "✅ <b>To'lov qabul qilindi!</b>\n\nAdmin tasdiqlashini kuting. Tasdiqlangach hisobingiz to'ldiriladi.")
+            self.states.clear(chat_id)
+            self.show_main_menu(chat_id, "Bosh menyu:")
+
+            # Notify Admins
+            self.notify_admins(payment, coins, total_sum, file_id, user)
+
+        except Exception as e:
+            logger.exception(f"Payment Creation Error: {e}")
+            self.send_message(chat_id, f"❌ Tizim xatosi: {str(e)[:50]}")
+
+    def notify_admins(self, payment, coins, total_sum, file_id, user):
+        msg = (
+            f"🔔 <b>Yangi To'lov!</b>\n\n"
+            f"👤 <b>User:</b> {user.first_name} ({user.phone})\n"
+            f"🪙 <b>Coin:</b> {coins} AC\n"
+            f"💵 <b>Summa:</b> {total_sum:,.0f} so'm\n"
+            f"📅 <b>Sana:</b> {timezone.localtime(payment.created_at).strftime('%d.%m.%Y %H:%M')}\n"
+        )
+        keyboard = {
+            "inline_keyboard": [
+                [
+                    {"text": "✅ Tasdiqlash", "callback_data": f"confirm_{payment.id}"},
+                    {"text": "❌ Rad etish", "callback_data": f"reject_{payment.id}"}
+                ]
+            ]
+        }
+
+        admin_messages = []
+        for admin_id in self.get_admin_ids():
+            try:
+                sent_msg = self.send_photo(admin_id, file_id, caption=msg, reply_markup=keyboard)
+                if sent_msg and sent_msg.get('ok'):
+                    msg_data = sent_msg.get('result')
+                    admin_messages.append({
+                        'chat_id': str(msg_data['chat']['id']),
+                        'message_id': str(msg_data['message_id'])
+                    })
+            except Exception as e:
+                logger.error(f"Failed to send to admin {admin_id}: {e}")
+
+        if admin_messages:
+            payment.admin_message_ids = admin_messages
+            payment.save()
+
+    def handle_callback(self, callback):
+        data = callback.get('data')
+        msg = callback.get('message')
+        if not data or not msg:
+            return
+        chat_id = msg['chat']['id']
+        message_id = msg['message_id']
+
+        try:
+            action, payment_id = data.split('_')
+            payment = Payment.objects.get(id=payment_id)
+
+            if payment.status != 'PENDING':
+                self.send_request("answerCallbackQuery", {"callback_query_id": callback['id'], "text": "Bu to'lov allaqachon yakunlangan."})
+                return
+
+            user = payment.user
+            rate = Decimal(str(self.get_rate()))
+            # Safe Decimal calc with rounding
+            coins_amount = (Decimal(payment.amount) / rate).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+            new_caption = msg.get('caption', '') + "\n\n"
+
+            if action == 'confirm':
+                payment, confirmed = PaymentService.confirm_payment(payment.id, credit_amount=coins_amount)
+                if not confirmed:
+                    self.send_request("answerCallbackQuery", {"callback_query_id": callback['id'], "text": "Bu to'lov allaqachon yakunlangan."})
+                    return
+
+                logger.info(f"💰 [PAYMENT CONFIRM] User ID: {user.id} | Username: {user.username} (+{coins_amount})")
+                new_caption += "✅ <b>TASDIQLANDI</b>"
+                if user.telegram_id:
+                    self.send_message(user.telegram_id, f"✅ <b>To'lov tasdiqlandi!</b>\n\nHisobingizga {int(coins_amount)} Coin qo'shildi.")
+
+            elif action == 'reject':
+                payment.status = 'FAILED'
+                payment.save()
+                new_caption += "❌ <b>RAD ETILDI</b>"
+                if user.telegram_id:
+                    self.send_message(user.telegram_id, "❌ <b>To'lov rad etildi.</b>\n\nChekda muammo bo'lishi mumkin. Qayta urinib ko'ring.")
+
+            # Update Admin Message
+            self.send_request("editMessageCaption", {
+                "chat_id": chat_id,
+                "message_id": message_id,
+                "caption": new_caption,
+                "parse_mode": "HTML",
+                "reply_markup": {"inline_keyboard": []} # Properly remove buttons
+            })
+            self.send_request("answerCallbackQuery", {"callback_query_id": callback['id'], "text": "Bajarildi"})
+
+        except Exception as e:
+            logger.exception(f"Callback Error: {e}")
+            self.send_request("answerCallbackQuery", {"callback_query_id": callback['id'], "text": f"Xatolik: {str(e)[:50]}"})
+
+    # --- MENU ---
+
+    def show_profile(self, chat_id, user):
+        self.send_message(chat_id, (
+            f"👤 <b>Profil:</b> {user.first_name} {user.last_name or ''}\n"
+            f"📞 <b>Tel:</b> {user.phone}\n"
+            f"🆔 <b>ID:</b> {user.username}\n"
+            f"📅 <b>Ro'yxatdan o'tgan:</b> {user.date_joined.strftime('%d.%m.%Y')}"
+        ))
+
+    def show_balance(self, chat_id, user):
+        self.send_message(chat_id, (
+            f"💰 <b>Sizning Hisobingiz:</b>\n\n"
+            f"🪙 <b>Coin:</b> {int(user.balance)} AC\n"
+            f"💵 <b>Tahminiy qiymat:</b> {int(user.balance * Decimal(str(self.get_rate())))} so'm"
+        ))
+
+    def start_topup(self, chat_id, user):
+        self.states.set(chat_id, STATE_WAIT_AMOUNT)
+        msg = (
+            f"💸 <b>Hisobni to'ldirish</b>\n\n"
+            f"Joriy kurs: <b>1 AC = {self.get_rate()} so'm</b>\n\n"
+            f"Necha Coin sotib olmoqchisiz? (Raqam yozing):"
+        )
+        keyboard = {
+            "keyboard": [[{"text": "❌ Bekor qilish"}]],
+            "resize_keyboard": True
+        }
+        self.send_message(chat_id, msg, reply_markup=keyboard)
+
+    def show_olympiads(self, chat_id, user):
+        registrations = user.olympiad_registrations.select_related('olympiad')[:5]
+        if not registrations:
+            self.send_message(chat_id, "Siz hali hech qanday olimpiadaga ro'yxatdan o'tmagansiz.")
+            return
+        resp = "🏆 <b>Sizning olimpiadalaringiz:</b>\n\n"
+        for reg in registrations:
+            status_emoji = "⏳" if reg.olympiad.status == 'UPCOMING' else "🚀"
+            resp += f"{status_emoji} <b>{reg.olympiad.title}</b>\n"
+            resp += f"📅 {reg.olympiad.start_date.strftime('%d.%m %H:%M')}\n\n"
+        self.send_message(chat_id, resp)
+
+    def show_courses(self, chat_id, user):
+        enrollments = user.enrollments.select_related('course')[:5]
+        if not enrollments:
+            self.send_message(chat_id, "Siz hali hech qanday kursga yozilmagansiz.")
+            return
+        resp = "📚 <b>Sizning kurslaringiz:</b>\n\n"
+        for enr in enrollments:
+            resp += f"📘 <b>{enr.course.title}</b>\n"
+            resp += f"📈 Progress: {float(enr.progress):.0f}%\n\n"
+        self.send_message(chat_id, resp)
+
+    def show_results(self, chat_id, user):
+        results = user.test_results.select_related('olympiad').order_by('-submitted_at')[:5]
+        if not results:
+            self.send_message(chat_id, "Siz hali olimpiadalarda qatnashmagansiz.")
+            return
+        resp = "📊 <b>Sizning so'nggi natijalaringiz:</b>\n\n"
+        for res in results:
+            resp += f"📝 <b>{res.olympiad.title}</b>\n"
+            resp += f"✅ Ball: {res.score} ({float(res.percentage):.1f}%)\n"
+            resp += f"📅 {res.submitted_at.strftime('%d.%m.%Y')}\n\n"
+        self.send_message(chat_id, resp)
+
+    def show_meetings(self, chat_id, user):
+        self.send_message(chat_id, "📅 <b>Yaqinlashayotgan meetinglar:</b>\n\nHozircha rejalashtirilgan meetinglar yo'q.")
+
+    def show_help(self, chat_id, user):
+        self.send_message(chat_id, HELP_TEXT)
+
+    # --- ACCOUNT & PRIZES ---
+
+    def handle_contact_login(self, chat_id, phone):
+        """Handle contact sharing for quick login"""
+        # Normalize phone
+        phone = phone.replace('+', '').replace(' ', '')
+        if len(phone) == 9:
+            phone = "998" + phone
+
+        user = User.objects.filter(phone__icontains=phone[-9:]).first() # Loose match
+        if user:
+            user.telegram_id = chat_id
+            user.telegram_connected_at = timezone.now()
+            user.save()
+            self.show_main_menu(chat_id, f"✅ <b>Hisob topildi va ulandi!</b>\n\nXush kelibsiz, {user.first_name}!")
+        else:
+            self.send_message(chat_id, f"❌ <b>Bunday raqam topilmadi ({phone}).</b>\n\nIltimos, avval saytdan ro'yxatdan o'ting.")
+
+    def save_prize_address(self, chat_id, user, prize, kind, **address):
+        PrizeAddress.objects.update_or_create(prize=prize, defaults=address)
+        prize.status = 'ADDRESS_RECEIVED'
+        prize.save()
+
+        self.states.clear(chat_id)
+        self.show_main_menu(chat_id, "✅ <b>Manzilingiz qabul qilindi!</b>\n\nSovrinni yetkazib berish jarayoni boshlandi. Adminlarimiz siz bilan bog'lanishadi.")
+        self.send_to_admins(f"📦 <b>Yangi manzil!</b>\nStudent: {user.get_full_name()}\nOlimpiada: {prize.olympiad.title}\nTur: {kind}")
+
+    def handle_location(self, chat_id, location):
+        """Handle incoming location message for prizes"""
+        user = User.objects.filter(telegram_id=chat_id).first()
+        if not user:
+            return
+
+        prize = WinnerPrize.objects.filter(student=user, status__in=['PENDING', 'CONTACTED']).order_by('-awarded_at').first()
+        if not prize:
+            self.send_message(chat_id, "Manzil uchun rahmat!")
+            return
+        self.save_prize_address(
+            chat_id, user, prize, "Lokatsiya",
+            latitude=Decimal(str(location['latitude'])), longitude=Decimal(str(location['longitude']))
+        )
+
+    def handle_address_text(self, chat_id, user, text, requested=False):
+        """Text address for a prize the winner was contacted about"""
+        prize = WinnerPrize.objects.filter(
+            student=user, status__in=['PENDING', 'CONTACTED'] if requested else ['CONTACTED']
+        ).order_by('-awarded_at').first()
+        if prize:
+            self.save_prize_address(chat_id, user, prize, f"Matn: {text}", address_text=text)
+        elif requested:
+            self.send_message(chat_id, "⚠️ Hozirda sizdan manzil so'ralmagan.")
+            self.states.clear(chat_id)
@@ -0,0 +1,111 @@
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from ..models import BotConversationState
+
+
+class DatabaseStateStore:
+    """Conversation state rows in bot_conversation_states (shared by all bot workers)"""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+
+    def get(self, chat_id):
+        return BotConversationState.objects.filter(
+            chat_id=chat_id, expires_at__gt=timezone.now()
+        ).values_list('state', 'data').first()
+
+    def set(self, chat_id, state, data):
+        BotConversationState.objects.update_or_create(
+            chat_id=chat_id,
+            defaults={'state': state, 'data': data, 'expires_at': timezone.now() + timedelta(seconds=self.ttl)}
+        )
+
+    def clear(self, chat_id):
+        BotConversationState.objects.filter(chat_id=chat_id).delete()
+
+    def purge_expired(self):
+        deleted, _ = BotConversationState.objects.filter(expires_at__lte=timezone.now()).delete()
+        return deleted
+
+
+class CacheStateStore:
+    """Conversation state in a Django cache backend; expiry is the cache timeout"""
+
+    KEY = 'botstate:{}'
+
+    def __init__(self, ttl, alias='default'):
+        self.ttl = ttl
+        self.cache = caches[alias]
+
+    def get(self, chat_id):
+        raw = self.cache.get(self.KEY.format(chat_id))
+        if raw is None:
+            return None
+        state, data = json.loads(raw)
+        return state, data
+
+    def set(self, chat_id, state, data):
+        raw = json.dumps([state, data], separators=(',', ':'))
+        self.cache.set(self.KEY.format(chat_id), raw, self.ttl)
+
+    def clear(self, chat_id):
+        self.cache.delete(self.KEY.format(chat_id))
+
+    def purge_expired(self):
+        return 0
+
+
+class BotStateStore:
+    """
+    Conversation state of the Telegram bot, keyed by chat id.
+
+    Replaces the per-process dict in runbot so conversations survive restarts
+    and several polling workers can share them. The backend is chosen with
+    settings.BOT_STATE_BACKEND ('db' or 'cache'; 'cache' needs a shared
+    cache such as Redis). Idle chats expire after BOT_STATE_TTL seconds and
+    finished flows delete their entry, so storage stays bounded.
+    """
+
+    DEFAULT_TTL = 24 * 60 * 60
+    BACKENDS = {
+        'db': DatabaseStateStore,
+        'cache': CacheStateStore,
+    }
+
+    def __init__(self, backend=None, ttl=None):
+        backend = backend or getattr(settings, 'BOT_STATE_BACKEND', 'db')
+        ttl = ttl or getattr(settings, 'BOT_STATE_TTL', self.DEFAULT_TTL)
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Unknown bot state backend: {backend}")
+        self.backend = self.BACKENDS[backend](ttl)
+
+    def get(self, chat_id):
+        """Returns {"state": int, "data": dict}; state 0 (none) if nothing is stored"""
+        stored = self.backend.get(chat_id)
+        if stored is None:
+            return {"state": 0, "data": {}}
+        state, data = stored
+        return {"state": state, "data": data or {}}
+
+    def set(self, chat_id, state, data=None):
+        if not state and not data:
+            self.backend.clear(chat_id)
+        else:
+            self.backend.set(chat_id, state, data or {})
+
+    def update(self, chat_id, state, **data):
+        """Merge data into the stored dict and switch to state"""
+        merged = self.get(chat_id)["data"]
+        merged.update(data)
+        self.set(chat_id, state, merged)
+
+    def clear(self, chat_id):
+        self.backend.clear(chat_id)
+
+    def purge_expired(self):
+        return self.backend.purge_expired()
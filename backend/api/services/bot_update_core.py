@@ -0,0 +1,270 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.core.cache import cache
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+def update_chat_id(update):
+    """Chat an update belongs to (updates of one chat are handled in order)"""
+    for key in ('message', 'edited_message', 'channel_post'):
+        if key in update:
+            return update[key]['chat']['id']
+    callback = update.get('callback_query')
+    if callback:
+        message = callback.get('message')
+        return message['chat']['id'] if message else callback['from']['id']
+    return None
+
+
+def update_kind(update):
+    """Metrics label of an update: command name, callback_query, photo, location, text..."""
+    message = update.get('message')
+    if message is None:
+        return next((key for key in update if key != 'update_id'), 'unknown')
+    text = message.get('text') or ''
+    if text.startswith('/'):
+        return f"command:{text.split()[0].split('@')[0]}"
+    for key in ('photo', 'location', 'contact'):
+        if key in message:
+            return key
+    return 'text' if text else 'message'
+
+
+def pooled_session(pool_size):
+    """requests.Session whose connection pool is shared by all bot workers"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class HandlerMetrics:
+    """Per-kind handler latency: count, errors, mean/max and p50/p95 over recent calls"""
+
+    WINDOW = 500
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: {'count': 0, 'errors': 0, 'total': 0.0, 'max': 0.0,
+                                           'recent': deque(maxlen=self.WINDOW)})
+
+    def record(self, kind, seconds, failed=False):
+        with self._lock:
+            stats = self._stats[kind]
+            stats['count'] += 1
+            stats['errors'] += int(failed)
+            stats['total'] += seconds
+            stats['max'] = max(stats['max'], seconds)
+            stats['recent'].append(seconds)
+
+    def snapshot(self):
+        """{kind: {count, errors, mean_ms, max_ms, p50_ms, p95_ms}}"""
+        with self._lock:
+            result = {}
+            for kind, stats in sorted(self._stats.items()):
+                recent = sorted(stats['recent'])
+                result[kind] = {
+                    'count': stats['count'],
+                    'errors': stats['errors'],
+                    'mean_ms': round(stats['total'] / stats['count'] * 1000, 1),
+                    'max_ms': round(stats['max'] * 1000, 1),
+                    'p50_ms': round(recent[len(recent) // 2] * 1000, 1),
+                    'p95_ms': round(recent[max(int(len(recent) * 0.95) - 1, 0)] * 1000, 1),
+                }
+            return result
+
+
+class BotUpdateCore:
+    """
+    Update-handling pipeline shared by the polling bot (runbot) and the webhook.
+
+    submit() is thread-safe and returns at once: the update is deduplicated by
+    update_id, then handed to an asyncio loop running in a background thread.
+    Updates of the same chat are drained in order by one task; different
+    chats run in parallel on a pool of `workers` threads (handlers are
+    synchronous Django code). At most max_pending updates are queued or
+    running; beyond that submit() blocks, or returns BUSY with block=False.
+    """
+
+    ACCEPTED = 'accepted'
+    DUPLICATE = 'duplicate'
+    BUSY = 'busy'
+
+    DEDUP_TTL = 24 * 60 * 60
+
+    def __init__(self, handler, workers=8, max_pending=200, name='bot'):
+        self.handler = handler
+        self.name = name
+        self.metrics = HandlerMetrics()
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._pending = 0
+        self._chats = {}
+
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'{name}-update')
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name=f'{name}-loop', daemon=True)
+        self._thread.start()
+
+    def _dedup_key(self, update):
+        return f"{self.name}:update:{update.get('update_id')}"
+
+    def submit(self, update, block=True):
+        """Queue an update; returns ACCEPTED, DUPLICATE or BUSY"""
+        if update.get('update_id') is not None and not cache.add(self._dedup_key(update), True, self.DEDUP_TTL):
+            return self.DUPLICATE
+
+        if not self._slots.acquire(blocking=block):
+            # Let the sender's retry through
+            cache.delete(self._dedup_key(update))
+            return self.BUSY
+
+        with self._lock:
+            self._pending += 1
+        self._loop.call_soon_threadsafe(self._enqueue, update)
+        return self.ACCEPTED
+
+    def _enqueue(self, update):
+        key = update_chat_id(update)
+        queue = self._chats.get(key)
+        if queue is not None:
+            # A drain task for this chat is running and will pick it up
+            queue.append(update)
+            return
+        self._chats[key] = deque([update])
+        self._loop.create_task(self._drain(key))
+
+    async def _drain(self, key):
+        queue = self._chats[key]
+        while queue:
+            update = queue.popleft()
+            try:
+                await self._loop.run_in_executor(self._executor, self._call, update)
+            finally:
+                self._slots.release()
+                with self._lock:
+                    self._pending -= 1
+                    if not self._pending:
+                        self._idle.notify_all()
+        del self._chats[key]
+
+    def _call(self, update):
+        kind = update_kind(update)
+        start = time.perf_counter()
+        failed = False
+        try:
+            self.handler(update)
+        except Exception:
+            failed = True
+            logger.exception(f"Error processing update {update.get('update_id')} ({kind})")
+            # Forget the update so a redelivery is handled instead of dropped as a duplicate
+            if update.get('update_id') is not None:
+                cache.delete(self._dedup_key(update))
+        finally:
+            self.metrics.record(kind, time.perf_counter() - start, failed)
+            close_old_connections()
+
+    def join(self, timeout=None):
+        """Wait until every submitted update has been handled"""
+        with self._lock:
+            return self._idle.wait_for(lambda: not self._pending, timeout=timeout)
+
+    def shutdown(self, timeout=None):
+        self.join(timeout)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+        self._executor.shutdown(wait=False)
+
+
+@lru_cache(maxsize=None)
+def webhook_core():
+    """Process-wide core behind the webhook endpoint"""
+    from .bot_handler_service import BotUpdateHandler
+    return BotUpdateCore(BotUpdateHandler().handle_update, name='webhook')
+
+
+# --- BENCHMARK ---
+
+class _FakeTelegramHandler(BaseHTTPRequestHandler):
+    """Answers every Bot API call with ok=true after a fixed delay"""
+    delay = 0.02
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.rfile.read(length)
+        time.sleep(self.delay)
+        body = json.dumps({'ok': True, 'result': {'message_id': 1}}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST
+
+    def log_message(self, format, *args):
+        pass
+
+
+def benchmark(count=500, worker_counts=(1, 8, 32), chats=50, api_delay=0.02):
+    """
+    Throughput/latency of update handling against a local fake Telegram API.
+    Each update sends two API calls (like a reply plus a follow-up menu).
+    Returns: list of (workers, updates_per_second, p50_ms, p95_ms)
+    """
+    handler_class = type('FakeTelegramHandler', (_FakeTelegramHandler,), {'delay': api_delay})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler_class)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    api_url = f"http://127.0.0.1:{server.server_address[1]}/botTEST"
+
+    results = []
+    try:
+        for workers in worker_counts:
+            session = pooled_session(workers)
+            latencies = []
+            enqueued = {}
+
+            def handle(update):
+                chat_id = update['message']['chat']['id']
+                for method in ('sendMessage', 'sendMessage'):
+                    session.post(f"{api_url}/{method}", json={'chat_id': chat_id, 'text': 'pong'}, timeout=10)
+                latencies.append(time.perf_counter() - enqueued[update['message']['message_id']])
+
+            # No update_id: benchmark updates skip deduplication
+            updates = [
+                {'message': {'message_id': i, 'chat': {'id': i % chats}, 'text': 'ping'}}
+                for i in range(count)
+            ]
+            core = BotUpdateCore(handle, workers=workers, max_pending=max(100, workers * 4), name='benchmark')
+            start = time.perf_counter()
+            for update in updates:
+                enqueued[update['message']['message_id']] = time.perf_counter()
+                core.submit(update)
+            core.join()
+            elapsed = time.perf_counter() - start
+            core.shutdown()
+            session.close()
+
+            latencies.sort()
+            p50 = latencies[len(latencies) // 2] * 1000
+            p95 = latencies[int(len(latencies) * 0.95) - 1] * 1000
+            results.append((workers, count / elapsed, p50, p95))
+    finally:
+        server.shutdown()
+        server.server_close()
+    return results
@@ -1,10 +1,132 @@
+import logging
+from collections import defaultdict
+
+from django.core.cache import cache
 from django.utils import timezone
 from api.models import (
     Profession, ProfessionLevel, ProfessionNode,
     UserProfessionState, UserNodeProgress, User, Notification
 )
 
+logger = logging.getLogger(__name__)
+
+
+def _has_prestige(user):
+    # Depending on how prestige is tracked on User model, e.g. user.roles contains 'prestige' or user is in some vip logic
+    return hasattr(user, 'teacher_type') and user.teacher_type in ['VIP', 'INTERNAL']
+
+
+class CareerGraph:
+    """
+    Compiled levels and nodes of one profession.
+
+    Every node has a bit (nodes of other professions referenced by
+    unlock_condition get bits after the profession's own), so a user's
+    completed nodes are one int and unlock/progression checks are masks:
+    prerequisites[i] holds the earlier required nodes of the same level plus
+    unlock_condition["required_nodes"] of node i.
+    """
+
+    def __init__(self, levels, nodes):
+        # levels: [(id, order, unlock_xp, is_prestige_only, title)] sorted; nodes: [(id, level_id, order, is_required, node_type, reference_id, unlock_condition)]
+        self.levels = [level[0] for level in levels]
+        self.level_info = {level[0]: level[1:] for level in levels}
+        self.node_ids = [node[0] for node in nodes]
+        self.index = {node_id: i for i, node_id in enumerate(self.node_ids)}
+
+        external = []
+        for node in nodes:
+            condition = node[6] if isinstance(node[6], dict) else {}
+            for node_id in condition.get('required_nodes', []):
+                if node_id not in self.index:
+                    self.index[node_id] = len(self.index)
+                    external.append(node_id)
+        self.external_ids = external
+
+        self.level_required = defaultdict(int)
+        self.prerequisites = []
+        self.by_reference = defaultdict(list)
+        for i, (node_id, level_id, order, is_required, node_type, reference_id, condition) in enumerate(nodes):
+            if is_required:
+                self.level_required[level_id] |= 1 << i
+            mask = 0
+            for j, other in enumerate(nodes):
+                if other[1] == level_id and other[2] < order and other[3]:
+                    mask |= 1 << j
+            if isinstance(condition, dict):
+                for required_id in condition.get('required_nodes', []):
+                    mask |= 1 << self.index[required_id]
+            self.prerequisites.append(mask)
+            self.by_reference[(node_type, reference_id)].append((level_id, node_id))
+
+    @classmethod
+    def build(cls, profession_id):
+        levels = list(ProfessionLevel.objects.filter(profession_id=profession_id).order_by(
+            'order', 'level_number', 'id'
+        ).values_list('id', 'order', 'unlock_xp', 'is_prestige_only', 'title'))
+        nodes = list(ProfessionNode.objects.filter(level__profession_id=profession_id).order_by(
+            'level__order', 'level__level_number', 'level_id', 'order', 'id'
+        ).values_list('id', 'level_id', 'order', 'is_required', 'node_type', 'reference_id', 'unlock_condition'))
+        return cls(levels, nodes)
+
+    @property
+    def all_node_ids(self):
+        return self.node_ids + self.external_ids
+
+    def completion_mask(self, node_ids):
+        mask = 0
+        for node_id in node_ids:
+            i = self.index.get(node_id)
+            if i is not None:
+                mask |= 1 << i
+        return mask
+
+    def can_unlock(self, node_id, completed):
+        i = self.index.get(node_id)
+        if i is None or i >= len(self.prerequisites):
+            return True
+        return completed & self.prerequisites[i] == self.prerequisites[i]
+
+    def nodes_for(self, node_type, reference_id, level_id):
+        """Node ids of a course/olympiad reference within a level"""
+        return [node_id for node_level, node_id in self.by_reference.get((node_type, reference_id), ()) if node_level == level_id]
+
+    def next_step(self, level_id, completed, total_xp, has_prestige):
+        """
+        Progression from level_id: ('level', next_level_id), ('completed', None)
+        or None when the level is not finished or the next one needs prestige.
+        """
+        if level_id not in self.level_info:
+            return None
+        required = self.level_required[level_id]
+        order, unlock_xp = self.level_info[level_id][:2]
+        if completed & required != required or total_xp < unlock_xp:
+            return None
+        next_level = next((lid for lid in self.levels if self.level_info[lid][0] > order), None)
+        if next_level is None:
+            return ('completed', None)
+        if self.level_info[next_level][2] and not has_prestige:
+            # User needs prestige to unlock next level
+            return None
+        return ('level', next_level)
+
+
 class CareerEngineService:
+    GRAPH_CACHE_TTL = 24 * 60 * 60
+
+    @staticmethod
+    def get_graph(profession):
+        """Compiled graph of a profession, cached per graph_version"""
+        key = f"career_graph:{profession.id}:{profession.graph_version}"
+        return cache.get_or_set(key, lambda: CareerGraph.build(profession.id), CareerEngineService.GRAPH_CACHE_TTL)
+
+    @staticmethod
+    def completed_mask(user, graph):
+        """The user's completed nodes of a graph as a bitset (one query)"""
+        return graph.completion_mask(UserNodeProgress.objects.filter(
+            user=user, node_id__in=graph.all_node_ids, status='completed'
+        ).values_list('node_id', flat=True))
+
     @staticmethod
     def get_or_create_state(user, profession):
         state, created = UserProfessionState.objects.get_or_create(
@@ -32,7 +154,9 @@ class CareerEngineService:
             return progress, False # Already completed
             
         # Check if node can be unlocked
-        if not CareerEngineService.can_unlock_node(user, node):
+        graph = CareerEngineService.get_graph(state.profession)
+        completed = CareerEngineService.completed_mask(user, graph)
+        if not CareerEngineService.can_unlock_node(user, node, graph, completed):
             raise ValueError("Tugunni ochish uchun shartlar bajarilmagan.")
             
         progress.status = 'completed'
@@ -43,9 +167,7 @@ class CareerEngineService:
         # Grant XP
         xp_reward = node.xp_reward
         # Give prestige users 20% bonus XP
-        # Depending on how prestige is tracked on User model, e.g. user.roles contains 'prestige' or user is in some vip logic
-        has_prestige = hasattr(user, 'teacher_type') and user.teacher_type in ['VIP', 'INTERNAL']
-        if has_prestige:
+        if _has_prestige(user):
             xp_reward = int(xp_reward * 1.2)
             
         if xp_reward > 0:
@@ -57,85 +179,120 @@ class CareerEngineService:
                 user.save()
             
         # Check level progression
-        CareerEngineService.check_level_progression(user, state)
+        CareerEngineService.check_level_progression(user, state, graph, completed | graph.completion_mask([node.id]))
         
         return progress, True
         
     @staticmethod
-    def can_unlock_node(user, node):
-        """Evaluates JSON condition to check if node can be unlocked"""
-        # If order > 0, check if previous nodes in the same level are completed (basic linearity)
-        previous_nodes = ProfessionNode.objects.filter(
-            level=node.level, order__lt=node.order, is_required=True
+    def can_unlock_node(user, node, graph=None, completed=None):
+        """
+        Previous required nodes of the same level (basic linearity) and
+        unlock_condition {"required_nodes": [id1, id2]} must be completed
+        """
+        graph = graph or CareerEngineService.get_graph(node.level.profession)
+        if completed is None:
+            completed = CareerEngineService.completed_mask(user, graph)
+        return graph.can_unlock(node.id, completed)
+
+    @staticmethod
+    def _profession_link(profession):
+        return f"/profession/{profession.slug}" if getattr(profession, 'slug', None) else f"/profession/{profession.id}"
+
+    @staticmethod
+    def _apply_step(user, state, step, graph):
+        """Move a state along a next_step() result; returns the notification to send, or None"""
+        kind, next_level = step
+        if kind == 'level':
+            state.current_level_id = next_level
+            return Notification(
+                user=user,
+                title="Yangi bosqich! 🚀",
+                message=f"{state.profession.name} kasbida '{graph.level_info[next_level][3]}' bosqichiga o'tdingiz!",
+                notification_type='SYSTEM',
+                link=CareerEngineService._profession_link(state.profession)
+            )
+        # No more levels = Profession Completed
+        if state.status == 'completed':
+            return None
+        state.status = 'completed'
+        return Notification(
+            user=user,
+            title="Kasb to'liq o'zlashtirildi! 🏆",
+            message=f"Tabriklaymiz! Siz {state.profession.name} kasbini to'liq tugatdingiz.",
+            notification_type='ACHIEVEMENT',
+            link=CareerEngineService._profession_link(state.profession)
         )
-        for p_node in previous_nodes:
-            is_completed = UserNodeProgress.objects.filter(
-                user=user, node=p_node, status='completed'
-            ).exists()
-            if not is_completed:
-                return False
-                
-        # Custom JSON conditions (e.g. {"required_nodes": [id1, id2]})
-        if node.unlock_condition and isinstance(node.unlock_condition, dict):
-            req_nodes = node.unlock_condition.get('required_nodes', [])
-            for n_id in req_nodes:
-                is_completed = UserNodeProgress.objects.filter(
-                    user=user, node_id=n_id, status='completed'
-                ).exists()
-                if not is_completed:
-                    return False
-                    
-        return True
 
     @staticmethod
-    def check_level_progression(user, state):
-        current_level = state.current_level
-        if not current_level:
+    def check_level_progression(user, state, graph=None, completed=None):
+        if not state.current_level_id:
             return
-            
-        # Check if all required nodes in current level are completed
-        required_nodes = current_level.nodes.filter(is_required=True)
-        all_completed = True
-        for node in required_nodes:
-            is_completed = UserNodeProgress.objects.filter(
-                user=user, node=node, status='completed'
-            ).exists()
-            if not is_completed:
-                all_completed = False
-                break
-                
-        if all_completed and state.total_xp >= current_level.unlock_xp:
-            # Unlock next level
-            next_level = ProfessionLevel.objects.filter(
-                profession=state.profession, 
-                order__gt=current_level.order
-            ).order_by('order').first()
-            
-            if next_level:
-                # Check prestige condition
-                has_prestige = hasattr(user, 'teacher_type') and user.teacher_type in ['VIP', 'INTERNAL']
-                if next_level.is_prestige_only and not has_prestige:
-                    # User needs prestige to unlock next level
-                    pass
-                else:
-                    state.current_level = next_level
-                    state.save()
-                    Notification.objects.create(
-                        user=user,
-                        title="Yangi bosqich! 🚀",
-                        message=f"{state.profession.name} kasbida '{next_level.title}' bosqichiga o'tdingiz!",
-                        notification_type='SYSTEM',
-                        link=f"/profession/{state.profession.slug}" if getattr(state.profession, 'slug', None) else f"/profession/{state.profession.id}"
-                    )
-            else:
-                # No more levels = Profession Completed
-                if state.status != 'completed':
-                    state.status = 'completed'
-                    state.save()
-                    Notification.objects.create(
-                        user=user,
-                        title="Kasb to'liq o'zlashtirildi! 🏆",
-                        message=f"Tabriklaymiz! Siz {state.profession.name} kasbini to'liq tugatdingiz.",
-                        notification_type='ACHIEVEMENT',
-                        link=f"/profession/{state.profession.slug}" if getattr(state.profession, 'slug', None) else f"/profession/{state.profession.id}"
-                    )
+        graph = graph or CareerEngineService.get_graph(state.profession)
+        if completed is None:
+            completed = CareerEngineService.completed_mask(user, graph)
+
+        step = graph.next_step(state.current_level_id, completed, state.total_xp, _has_prestige(user))
+        if step is None:
+            return
+        notification = CareerEngineService._apply_step(user, state, step, graph)
+        if notification is not None:
+            state.save()
+            notification.save()
+
+    @staticmethod
+    def complete_reference_nodes(user, node_type, reference_id, score):
+        """
+        Complete the course/olympiad nodes of the user's current levels
+        (one query for states, graphs from cache, one query for the nodes)
+        """
+        states = UserProfessionState.objects.filter(
+            user=user, status='active', current_level__isnull=False
+        ).select_related('profession')
+        node_ids = []
+        for state in states:
+            graph = CareerEngineService.get_graph(state.profession)
+            node_ids.extend(graph.nodes_for(node_type, reference_id, state.current_level_id))
+
+        for node in ProfessionNode.objects.filter(id__in=node_ids).select_related('level__profession').order_by('order', 'id'):
+            try:
+                CareerEngineService.complete_node(user, node, score=score)
+            except Exception:
+                logger.exception(f"CareerEngine error completing {node_type} node {node.id} for user {user.id}")
+
+    @staticmethod
+    def recompute_profession(profession):
+        """
+        Re-evaluate level progression of every active user of a profession with
+        one completion query; users advance as many levels as they qualify for.
+        Returns the number of states that changed.
+        """
+        graph = CareerEngineService.get_graph(profession)
+        completed = defaultdict(list)
+        for user_id, node_id in UserNodeProgress.objects.filter(
+            node_id__in=graph.all_node_ids, status='completed'
+        ).values_list('user_id', 'node_id').iterator():
+            completed[user_id].append(node_id)
+
+        changed, notifications = [], []
+        states = UserProfessionState.objects.filter(
+            profession=profession, status='active', current_level__isnull=False
+        ).select_related('user')
+        for state in states.iterator():
+            state.profession = profession
+            mask = graph.completion_mask(completed.get(state.user_id, ()))
+            has_prestige = _has_prestige(state.user)
+            moved = False
+            while state.status == 'active':
+                step = graph.next_step(state.current_level_id, mask, state.total_xp, has_prestige)
+                if step is None:
+                    break
+                notification = CareerEngineService._apply_step(state.user, state, step, graph)
+                if notification is not None:
+                    notifications.append(notification)
+                moved = True
+            if moved:
+                changed.append(state)
+
+        UserProfessionState.objects.bulk_update(changed, ['current_level', 'status'], batch_size=500)
+        Notification.objects.bulk_create(notifications, batch_size=500)
+        return len(changed)
@@ -0,0 +1,209 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import connections
+from django.db.models import F, Q
+from django.utils import timezone
+
+from ..certificate_generator import render_certificate_files
+from ..models import Certificate, CertificateRenderJob
+from .certificate_storage_service import CertificateStorageService
+
+logger = logging.getLogger(__name__)
+
+_state = threading.local()
+
+
+def _render_files(data):
+    """Pool worker: pure rendering, no database access"""
+    try:
+        pdf_bytes, qr_bytes = render_certificate_files(data)
+        return data['id'], pdf_bytes, qr_bytes, None
+    except Exception as e:
+        return data['id'], None, None, str(e)
+
+
+class CertificateRenderService:
+    """
+    Batch rendering of certificate PDF/QR files.
+
+    Certificate ids are queued as CertificateRenderJob rows and rendered by a
+    process pool of ReportLab workers; the parent process loads render inputs
+    per chunk in one query, writes the files and bulk-updates the file fields.
+    Jobs are resumable: only certificates without a pdf_file are rendered.
+    A runner claims a job by moving it to RUNNING; another runner takes it
+    over only after STALE_AFTER_SECONDS without a finished chunk.
+    """
+
+    CHUNK_SIZE = 200
+    STALE_AFTER_SECONDS = 15 * 60
+
+    RENDER_FIELDS = (
+        'id', 'cert_number', 'cert_type', 'grade', 'issued_at',
+        'user__first_name', 'user__last_name', 'user__username',
+        'course__title', 'olympiad__title',
+        'verified_by__first_name', 'verified_by__last_name', 'verified_by__username',
+    )
+
+    @staticmethod
+    @contextmanager
+    def defer_rendering():
+        """Skip per-save rendering in the post_save signal (batch issuance enqueues a job instead)"""
+        previous = getattr(_state, 'deferred', False)
+        _state.deferred = True
+        try:
+            yield
+        finally:
+            _state.deferred = previous
+
+    @staticmethod
+    def rendering_deferred():
+        return getattr(_state, 'deferred', False)
+
+    @staticmethod
+    def enqueue(certificate_ids):
+        certificate_ids = list(certificate_ids)
+        if not certificate_ids:
+            return None
+        return CertificateRenderJob.objects.create(certificate_ids=certificate_ids)
+
+    @staticmethod
+    def _full_name(first_name, last_name, username):
+        return f"{first_name or ''} {last_name or ''}".strip() or username
+
+    @classmethod
+    def load_render_data(cls, certificate_ids):
+        """Render inputs for certificates without files (one query)"""
+        rows = Certificate.objects.filter(id__in=certificate_ids).filter(
+            Q(pdf_file='') | Q(pdf_file__isnull=True)
+        ).values(*cls.RENDER_FIELDS)
+
+        data = []
+        for row in rows:
+            verifier = None
+            if row['verified_by__username']:
+                verifier = cls._full_name(
+                    row['verified_by__first_name'], row['verified_by__last_name'], row['verified_by__username']
+                )
+            data.append({
+                'id': row['id'],
+                'cert_number': row['cert_number'],
+                'cert_type': row['cert_type'],
+                'recipient': cls._full_name(row['user__first_name'], row['user__last_name'], row['user__username']),
+                'title': row['course__title'] or row['olympiad__title'] or "Sertifikat",
+                'grade': row['grade'],
+                'issued_at': timezone.localtime(row['issued_at']),
+                'verifier': verifier,
+            })
+        return data
+
+    @staticmethod
+    def _store(results):
+        """Write rendered files (content-addressed) and bulk-update the file fields"""
+        updates, failed = [], []
+        for cert_id, key, pdf_bytes, qr_bytes, error in results:
+            if error:
+                logger.error(f"Certificate {cert_id} render failed: {error}")
+                failed.append(cert_id)
+                continue
+            pdf_name, qr_name = CertificateStorageService.store(key, pdf_bytes, qr_bytes)
+            updates.append(Certificate(id=cert_id, pdf_file=pdf_name, qr_code=qr_name, content_hash=key))
+
+        Certificate.objects.bulk_update(updates, ['pdf_file', 'qr_code', 'content_hash'], batch_size=500)
+        return len(updates), failed
+
+    @classmethod
+    def _render_chunks(cls, certificate_ids, workers):
+        """Yield (chunk results) rendered by a pool of `workers` processes (1 = in-process)"""
+        chunks = [certificate_ids[i:i + cls.CHUNK_SIZE] for i in range(0, len(certificate_ids), cls.CHUNK_SIZE)]
+
+        if workers <= 1:
+            for chunk in chunks:
+                data = cls.load_render_data(chunk)
+                keys = {item['id']: CertificateStorageService.content_key(item) for item in data}
+                yield [(cert_id, keys[cert_id], pdf, qr, error) for cert_id, pdf, qr, error in map(_render_files, data)]
+            return
+
+        # Fork the workers before any query so they don't inherit database connections
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pool.submit(int).result()
+            for chunk in chunks:
+                data = cls.load_render_data(chunk)
+                keys = {item['id']: CertificateStorageService.content_key(item) for item in data}
+                results = pool.map(_render_files, data, chunksize=max(1, len(data) // (workers * 4)))
+                yield [(cert_id, keys[cert_id], pdf, qr, error) for cert_id, pdf, qr, error in results]
+
+    @classmethod
+    def run_job(cls, job, workers=None):
+        """Render all not-yet-rendered certificates of a job"""
+        workers = workers or os.cpu_count() or 1
+        # A RUNNING job is only taken over once its runner stopped reporting progress
+        stale = timezone.now() - timedelta(seconds=cls.STALE_AFTER_SECONDS)
+        claimed = CertificateRenderJob.objects.filter(pk=job.pk).filter(
+            Q(status='PENDING') | Q(status='RUNNING', started_at__lt=stale) | Q(status='RUNNING', started_at__isnull=True)
+        ).update(status='RUNNING', started_at=timezone.now())
+        if not claimed:
+            return job
+
+        failed_ids = []
+        try:
+            for results in cls._render_chunks(job.certificate_ids, workers):
+                rendered, failed = cls._store(results)
+                failed_ids.extend(failed)
+                # started_at doubles as the heartbeat of the claim
+                CertificateRenderJob.objects.filter(pk=job.pk).update(
+                    rendered_count=F('rendered_count') + rendered, started_at=timezone.now()
+                )
+        except Exception as e:
+            logger.error(f"Render job {job.id} interrupted: {e}")
+            CertificateRenderJob.objects.filter(pk=job.pk).update(status='FAILED', failed_ids=failed_ids)
+            raise
+
+        CertificateRenderJob.objects.filter(pk=job.pk).update(
+            status='FAILED' if failed_ids else 'COMPLETED',
+            failed_ids=failed_ids,
+            finished_at=timezone.now()
+        )
+        job.refresh_from_db()
+        return job
+
+    @classmethod
+    def run_pending_jobs(cls, workers=None, include_failed=False):
+        """Process queued jobs, resuming ones interrupted mid-run"""
+        if include_failed:
+            CertificateRenderJob.objects.filter(status='FAILED').update(status='PENDING', failed_ids=[])
+        jobs = list(CertificateRenderJob.objects.filter(status__in=['PENDING', 'RUNNING']))
+        for job in jobs:
+            cls.run_job(job, workers=workers)
+        return jobs
+
+    @staticmethod
+    def benchmark(count=200, worker_counts=(1, 2, 4)):
+        """
+        Rendering throughput with synthetic certificates (no DB or storage).
+        Returns: list of (workers, seconds, certificates_per_second)
+        """
+        now = timezone.now()
+        data = [{
+            'id': i, 'cert_number': f"CRT-{i:05d}", 'cert_type': 'OLYMPIAD',
+            'recipient': f"Participant {i}", 'title': "Matematika olimpiadasi",
+            'grade': f"{50 + i % 50}%", 'issued_at': now, 'verifier': None,
+        } for i in range(count)]
+
+        results = []
+        for workers in worker_counts:
+            start = time.perf_counter()
+            if workers <= 1:
+                list(map(_render_files, data))
+            else:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    list(pool.map(_render_files, data, chunksize=max(1, count // (workers * 4))))
+            elapsed = time.perf_counter() - start
+            results.append((workers, elapsed, count / elapsed if elapsed else 0))
+        return results
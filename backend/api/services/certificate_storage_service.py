@@ -0,0 +1,218 @@
+import hashlib
+import json
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils import timezone
+
+from ..certificate_generator import certificate_render_data, render_certificate_files
+from ..models import Certificate
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='certificate-render')
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class CertificateStorageService:
+    """
+    Content-addressed certificate artifacts.
+
+    Files are named by a hash of the rendering inputs, so re-rendering an
+    unchanged certificate reuses the existing file instead of writing a new
+    one. Renders run on a small background pool; concurrent requests for the
+    same artifact wait on the same in-flight render instead of rendering again.
+    """
+
+    # Bump when the certificate design changes so every artifact is re-rendered
+    RENDER_VERSION = 2
+
+    WAIT_SECONDS = 20
+    GC_GRACE = timedelta(hours=1)
+
+    @classmethod
+    def content_key(cls, data):
+        payload = {key: value for key, value in data.items() if key != 'id'}
+        payload['render_version'] = cls.RENDER_VERSION
+        encoded = json.dumps(payload, sort_keys=True, default=str).encode()
+        return hashlib.sha256(encoded).hexdigest()
+
+    @staticmethod
+    def artifact_names(key):
+        pdf_field = Certificate._meta.get_field('pdf_file')
+        qr_field = Certificate._meta.get_field('qr_code')
+        return (
+            pdf_field.generate_filename(None, f"{key[:2]}/{key}.pdf"),
+            qr_field.generate_filename(None, f"{key[:2]}/{key}.png"),
+        )
+
+    @classmethod
+    def store(cls, key, pdf_bytes, qr_bytes):
+        """Save artifacts under their content names (no-op if they already exist)"""
+        names = cls.artifact_names(key)
+        storage = Certificate._meta.get_field('pdf_file').storage
+        for name, content in zip(names, (pdf_bytes, qr_bytes)):
+            if storage.exists(name):
+                continue
+            saved = storage.save(name, ContentFile(content))
+            if saved != name:
+                # Another worker stored the same content first
+                storage.delete(saved)
+        return names
+
+    @classmethod
+    def _render(cls, data, key, force=False):
+        try:
+            names = cls.artifact_names(key)
+            storage = Certificate._meta.get_field('pdf_file').storage
+            if force:
+                for name in names:
+                    storage.delete(name)
+            if not all(storage.exists(name) for name in names):
+                pdf_bytes, qr_bytes = render_certificate_files(data)
+                cls.store(key, pdf_bytes, qr_bytes)
+
+            pdf_name, qr_name = names
+            Certificate.objects.filter(pk=data['id']).update(
+                pdf_file=pdf_name, qr_code=qr_name, content_hash=key
+            )
+            return names
+        finally:
+            close_old_connections()
+
+    @classmethod
+    def render_async(cls, certificate, force=False):
+        """Start (or join) the background render of a certificate's current artifact"""
+        data = certificate_render_data(certificate)
+        key = cls.content_key(data)
+        with _inflight_lock:
+            future = _inflight.get(key)
+            if future is None or (force and future.done()):
+                future = _executor.submit(cls._render, data, key, force)
+                _inflight[key] = future
+                future.add_done_callback(lambda _, key=key: cls._forget(key))
+        return key, future
+
+    @staticmethod
+    def _forget(key):
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+    @classmethod
+    def is_current(cls, certificate):
+        """True if the stored artifact matches the certificate's rendering inputs"""
+        key = cls.content_key(certificate_render_data(certificate))
+        if certificate.content_hash != key or certificate.pdf_file.name != cls.artifact_names(key)[0]:
+            return False
+        return certificate.pdf_file.storage.exists(certificate.pdf_file.name)
+
+    @classmethod
+    def ensure_rendered(cls, certificate, force=False, timeout=None):
+        """
+        Make sure the certificate has an up-to-date artifact, waiting for the
+        shared background render. Raises TimeoutError if it takes too long.
+        """
+        if not force and cls.is_current(certificate):
+            return certificate
+
+        key, future = cls.render_async(certificate, force=force)
+        pdf_name, qr_name = future.result(timeout=timeout or cls.WAIT_SECONDS)
+        certificate.pdf_file.name = pdf_name
+        certificate.qr_code.name = qr_name
+        certificate.content_hash = key
+        return certificate
+
+    @classmethod
+    def schedule_render(cls, certificate):
+        """Render in the background once the current transaction commits"""
+        transaction.on_commit(lambda: cls.render_async(certificate))
+
+    # --- SERVING ---
+
+    @staticmethod
+    def serve(request, certificate):
+        """
+        Stream the PDF with an ETag (the content hash) and single-range support
+        """
+        etag = f'"{certificate.content_hash}"'
+        if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+
+        pdf = certificate.pdf_file
+        size = pdf.size
+        filename = f"certificate_{certificate.cert_number}.pdf"
+
+        match = RANGE_RE.match(request.headers.get('Range', ''))
+        if_range = request.headers.get('If-Range')
+        if match and (not if_range or if_range == etag) and any(match.groups()):
+            start, end = match.groups()
+            if start:
+                start, end = int(start), min(int(end) if end else size - 1, size - 1)
+            else:
+                start, end = max(size - int(end), 0), size - 1
+            if start > end or start >= size:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f"bytes */{size}"
+                return response
+
+            with pdf.open('rb') as f:
+                f.seek(start)
+                chunk = f.read(end - start + 1)
+            response = HttpResponse(chunk, status=206, content_type='application/pdf')
+            response['Content-Range'] = f"bytes {start}-{end}/{size}"
+        else:
+            response = FileResponse(pdf.open('rb'), content_type='application/pdf', filename=filename)
+
+        response['ETag'] = etag
+        response['Accept-Ranges'] = 'bytes'
+        response['Cache-Control'] = 'private, no-cache'
+        response['Content-Disposition'] = f'inline; filename="{filename}"'
+        return response
+
+    # --- GARBAGE COLLECTION ---
+
+    @classmethod
+    def _walk(cls, storage, path):
+        directories, files = storage.listdir(path)
+        for name in files:
+            yield f"{path}/{name}"
+        for directory in directories:
+            yield from cls._walk(storage, f"{path}/{directory}")
+
+    @classmethod
+    def collect_garbage(cls, dry_run=False):
+        """
+        Delete certificate files no Certificate references anymore.
+        Files younger than GC_GRACE are kept (they may belong to a render in flight).
+        Returns: list of orphaned file names
+        """
+        referenced = set()
+        for pdf_name, qr_name in Certificate.objects.values_list('pdf_file', 'qr_code').iterator(chunk_size=5000):
+            referenced.update(name for name in (pdf_name, qr_name) if name)
+
+        cutoff = timezone.now() - cls.GC_GRACE
+        orphans = []
+        for field_name in ('pdf_file', 'qr_code'):
+            field = Certificate._meta.get_field(field_name)
+            storage = field.storage
+            root = field.upload_to.rstrip('/')
+            if not storage.exists(root):
+                continue
+            for name in cls._walk(storage, root):
+                if name in referenced or storage.get_modified_time(name) > cutoff:
+                    continue
+                orphans.append(name)
+                if not dry_run:
+                    storage.delete(name)
+        return orphans
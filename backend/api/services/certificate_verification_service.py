@@ -0,0 +1,144 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.core import signing
+from django.core.serializers.json import DjangoJSONEncoder
+
+from ..models import Certificate
+
+
+class _LRU:
+    """Thread-safe LRU with per-entry expiry"""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class CertificateVerificationService:
+    """
+    Public certificate verification (QR scans, third parties).
+
+    Lookups go through the unique cert_number index and the resulting public
+    payload is kept in an in-process LRU. Unknown numbers are cached in a
+    separate, shorter-lived LRU so enumeration floods neither hit the database
+    nor evict real certificates. Entries are dropped when a certificate is
+    saved or deleted in this process; other processes catch up after the TTL.
+    """
+
+    TTL = 300
+    NEGATIVE_TTL = 60
+    SIGNING_SALT = 'certificate-verify'
+
+    _found = _LRU(max_size=20000, ttl=TTL)
+    _missing = _LRU(max_size=50000, ttl=NEGATIVE_TTL)
+
+    @staticmethod
+    def normalize(cert_number):
+        return (cert_number or '').strip()
+
+    @classmethod
+    def build_payload(cls, certificate):
+        from ..serializers import CertificateVerifySerializer
+
+        data = json.loads(json.dumps(CertificateVerifySerializer(certificate).data, cls=DjangoJSONEncoder))
+        valid = certificate.status == 'VERIFIED'
+        return {
+            'success': True,
+            'valid': valid,
+            'certificate': data,
+            # Tamper-evident copy of the verification result; check with verify_signature()
+            'signature': signing.dumps(
+                {'cert_number': certificate.cert_number, 'valid': valid, 'status': certificate.status},
+                salt=cls.SIGNING_SALT, compress=True
+            ),
+        }
+
+    @staticmethod
+    def etag(payload):
+        encoded = json.dumps(payload, sort_keys=True).encode()
+        return f'"{hashlib.sha256(encoded).hexdigest()[:32]}"'
+
+    @classmethod
+    def lookup(cls, cert_number):
+        """
+        Public payload for a certificate number, or None if it does not exist.
+        """
+        cert_number = cls.normalize(cert_number)
+        max_length = Certificate._meta.get_field('cert_number').max_length
+        if not cert_number or len(cert_number) > max_length:
+            return None
+
+        payload = cls._found.get(cert_number)
+        if payload is not None:
+            return payload
+        if cls._missing.get(cert_number):
+            return None
+
+        certificate = Certificate.objects.select_related('user', 'course', 'olympiad').filter(
+            cert_number=cert_number
+        ).first()
+        if certificate is None:
+            cls._missing.set(cert_number, True)
+            return None
+
+        payload = cls.build_payload(certificate)
+        cls._found.set(cert_number, payload)
+        return payload
+
+    @classmethod
+    def verify_signature(cls, signature):
+        """Decoded signed result, or None if the signature is invalid"""
+        try:
+            return signing.loads(signature, salt=cls.SIGNING_SALT)
+        except signing.BadSignature:
+            return None
+
+    @classmethod
+    def invalidate(cls, cert_number):
+        cert_number = cls.normalize(cert_number)
+        cls._found.delete(cert_number)
+        cls._missing.delete(cert_number)
+
+    @classmethod
+    def invalidate_many(cls, cert_numbers):
+        """For queryset.update() paths, which bypass the post_save signal"""
+        for cert_number in cert_numbers:
+            cls.invalidate(cert_number)
+
+    @classmethod
+    def clear(cls):
+        cls._found.clear()
+        cls._missing.clear()
@@ -0,0 +1,239 @@
+import logging
+import queue
+import threading
+import time
+from collections import defaultdict
+from dataclasses import asdict, dataclass, fields
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .bot_update_core import HandlerMetrics
+
+logger = logging.getLogger(__name__)
+
+
+# --- EVENTS ---
+
+@dataclass(frozen=True)
+class LessonCompleted:
+    user_id: int
+    lesson_id: int
+    course_id: int
+    module_id: int = None
+
+
+@dataclass(frozen=True)
+class CourseCompleted:
+    user_id: int
+    course_id: int
+
+
+@dataclass(frozen=True)
+class OlympiadFinished:
+    user_id: int
+    olympiad_id: int
+    result_id: int
+
+
+EVENT_TYPES = {event_type.__name__: event_type for event_type in (LessonCompleted, CourseCompleted, OlympiadFinished)}
+
+
+def event_from_dict(name, payload):
+    event_type = EVENT_TYPES[name]
+    names = {field.name for field in fields(event_type)}
+    return event_type(**{key: value for key, value in payload.items() if key in names})
+
+
+# --- DISPATCH ---
+
+class EventBus:
+    """
+    Domain events for side effects of a core write (XP, streaks, module
+    rewards, career nodes, certificates, notifications).
+
+    publish() only registers the event for after the current transaction
+    commits, so the request returns after its own write and rolled-back work
+    publishes nothing. Delivery depends on settings.EVENT_BUS_MODE:
+
+    - 'worker': events are stored in domain_events and handled by the
+      process_domain_events command; nothing is lost on restarts (default)
+    - 'thread': handlers run in a background thread of this process.
+      The queue is in memory only: events not yet handled when the process
+      exits or restarts are lost.
+    - 'inline': handlers run right after commit in the publishing thread
+
+    Events are handled in batches. A handler subscribed with a key runs once
+    per key and batch (e.g. one enrollment recount per user and course however
+    many lessons were completed). Each handler's latency is recorded in
+    EventBus.metrics.
+    """
+
+    _handlers = defaultdict(list)
+    metrics = HandlerMetrics()
+
+    @classmethod
+    def subscribe(cls, event_type, key=None):
+        """Decorator registering handler(event) for event_type; stack it for several types"""
+        def decorator(handler):
+            cls._handlers[event_type].append((handler, key))
+            return handler
+        return decorator
+
+    @classmethod
+    def publish(cls, event):
+        transaction.on_commit(lambda: cls._deliver(event))
+
+    @staticmethod
+    def mode():
+        return getattr(settings, 'EVENT_BUS_MODE', 'worker')
+
+    @classmethod
+    def _deliver(cls, event):
+        mode = cls.mode()
+        if mode == 'inline':
+            cls.dispatch([event])
+        elif mode == 'worker':
+            from ..models import DomainEvent
+            DomainEvent.objects.create(name=type(event).__name__, payload=asdict(event))
+        else:
+            background_dispatcher().submit(event)
+
+    @staticmethod
+    def handler_name(handler):
+        return f"{handler.__module__.rsplit('.', 1)[-1]}.{handler.__name__}"
+
+    @classmethod
+    def dispatch(cls, events, only=None):
+        """
+        Run every handler over a batch of events, in subscription order.
+        only: optional {event: handler names} restricting which handlers run
+        for an event (a retry of the handlers that failed on it).
+        Returns {event: names of the handlers that failed on it}.
+        """
+        # handler -> {key: [events]}; insertion order keeps subscription and event order
+        plan = {}
+        for event in events:
+            for handler, key in cls._handlers.get(type(event), ()):
+                if only is not None and event in only and cls.handler_name(handler) not in only[event]:
+                    continue
+                groups = plan.setdefault(handler, {})
+                # Identical events are handled once
+                group_key = key(event) if key else event
+                groups.setdefault(group_key, []).append(event)
+
+        failed = {}
+        for handler, groups in plan.items():
+            name = cls.handler_name(handler)
+            for group in groups.values():
+                # Keyed handlers run once for the latest event of their key
+                event = group[-1]
+                start = time.perf_counter()
+                ok = False
+                try:
+                    handler(event)
+                    ok = True
+                except Exception:
+                    logger.exception(f"Event handler {name} failed on {event}")
+                    for failed_event in group:
+                        failed.setdefault(failed_event, set()).add(name)
+                finally:
+                    cls.metrics.record(name, time.perf_counter() - start, not ok)
+        return failed
+
+    @classmethod
+    def process_stored(cls, batch_size=200):
+        """
+        Handle one batch of stored events (worker mode); returns how many were processed.
+        A failed event records the handlers that failed in failed_handlers; once
+        re-queued (process_domain_events --retry-failed) only those run again, so
+        rewards and notifications of the handlers that succeeded are not repeated.
+        """
+        from ..models import DomainEvent
+
+        with transaction.atomic():
+            rows = list(
+                DomainEvent.objects.select_for_update().filter(status='PENDING').order_by('id')[:batch_size]
+            )
+            if not rows:
+                return 0
+            DomainEvent.objects.filter(id__in=[row.id for row in rows]).update(status='RUNNING')
+
+        events, only = {}, {}
+        for row in rows:
+            try:
+                event = event_from_dict(row.name, row.payload)
+            except (KeyError, TypeError) as e:
+                logger.error(f"Unreadable domain event {row.id} ({row.name}): {e}")
+                continue
+            events[row.id] = event
+            # Identical events share a plan entry: a fresh one runs every handler
+            if not row.failed_handlers or only.get(event, ()) is None:
+                only[event] = None
+            else:
+                only[event] = only.get(event, set()) | set(row.failed_handlers)
+        failed = cls.dispatch(list(events.values()), only={event: names for event, names in only.items() if names is not None})
+
+        now = timezone.now()
+        done_ids = []
+        for row in rows:
+            if row.id not in events:
+                DomainEvent.objects.filter(id=row.id).update(status='FAILED', processed_at=now)
+            elif events[row.id] in failed:
+                DomainEvent.objects.filter(id=row.id).update(
+                    status='FAILED', processed_at=now, failed_handlers=sorted(failed[events[row.id]])
+                )
+            else:
+                done_ids.append(row.id)
+        DomainEvent.objects.filter(id__in=done_ids).update(status='DONE', processed_at=now, failed_handlers=[])
+        return len(rows)
+
+
+class BackgroundDispatcher:
+    """Single daemon thread handling published events in batches of up to batch_size"""
+
+    def __init__(self, batch_size=100, flush_interval=0.05):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='event-bus', daemon=True)
+        self._thread.start()
+
+    def submit(self, event):
+        self._queue.put(event)
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                EventBus.dispatch(batch)
+            except Exception:
+                logger.exception(f"Event batch of {len(batch)} failed")
+            finally:
+                close_old_connections()
+                for _ in batch:
+                    self._queue.task_done()
+
+    def join(self):
+        """Wait until every submitted event has been handled"""
+        self._queue.join()
+
+
+@lru_cache(maxsize=None)
+def background_dispatcher():
+    return BackgroundDispatcher()
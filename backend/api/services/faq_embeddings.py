@@ -0,0 +1,177 @@
+import json
+import os
+import threading
+import zlib
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from ..models import AIAssistantFAQ, AIUnansweredQuestion
+from .faq_index import STOPWORDS, normalize
+
+DIM = 1024
+NGRAMS = (3, 4, 5)
+
+
+def embed(texts):
+    """
+    L2-normalized float32 vectors (len(texts), DIM) of hashed character
+    n-grams. Shared stems and suffix variants (kurs/kursni/курса) land on the
+    same buckets, so paraphrases are close without a language model.
+    """
+    vectors = np.zeros((len(texts), DIM), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for word in normalize(text).split():
+            word = word.strip("'")
+            if word in STOPWORDS:
+                continue
+            word = f"<{word}>"
+            for n in NGRAMS:
+                for i in range(len(word) - n + 1):
+                    # crc32 rather than hash(): stable across processes
+                    vectors[row, zlib.crc32(word[i:i + n].encode()) % DIM] += 1
+    np.log1p(vectors, out=vectors)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+class FAQEmbeddingIndex:
+    """
+    Embedding matrix of FAQs (rows for the question in each language and
+    for the search tags),
+    written by the build_faq_embeddings command to FAQ_EMBEDDING_DIR and
+    memory-mapped read-only by every process, which reloads it when the
+    files are rebuilt. Lookups are one matrix-vector product; FAQs are few
+    enough that brute force beats an ANN structure.
+    """
+
+    VECTORS = 'vectors.npy'
+    META = 'meta.json'
+
+    _current = None
+    _current_stamp = None
+    _lock = threading.Lock()
+
+    def __init__(self, vectors, faq_ids):
+        self.vectors = vectors
+        self.faq_ids = faq_ids
+
+    @staticmethod
+    def directory():
+        return Path(getattr(settings, 'FAQ_EMBEDDING_DIR', settings.BASE_DIR / 'faq_embeddings'))
+
+    @classmethod
+    def build(cls, directory=None):
+        """Embed the active FAQs and atomically replace the files; returns the number of rows"""
+        directory = Path(directory or cls.directory())
+        directory.mkdir(parents=True, exist_ok=True)
+        texts, faq_ids = [], []
+        for faq in AIAssistantFAQ.objects.filter(is_active=True):
+            for text in (faq.question_uz, faq.question_ru, faq.search_tags):
+                if text:
+                    texts.append(text)
+                    faq_ids.append(faq.id)
+
+        vectors_tmp = directory / f'.{cls.VECTORS}.tmp'
+        meta_tmp = directory / f'.{cls.META}.tmp'
+        with open(vectors_tmp, 'wb') as f:
+            np.save(f, embed(texts))
+        with open(meta_tmp, 'w', encoding='utf-8') as f:
+            json.dump({'dim': DIM, 'faq_ids': faq_ids, 'built_at': timezone.now().isoformat()}, f)
+        os.replace(vectors_tmp, directory / cls.VECTORS)
+        # meta is written last: it is what readers watch for changes
+        os.replace(meta_tmp, directory / cls.META)
+        return len(faq_ids)
+
+    @classmethod
+    def load(cls, directory=None):
+        directory = Path(directory or cls.directory())
+        with open(directory / cls.META, encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta['dim'] != DIM:
+            raise ValueError(f"FAQ embeddings were built with dim {meta['dim']}, expected {DIM}; rebuild them")
+        return cls(np.load(directory / cls.VECTORS, mmap_mode='r'), meta['faq_ids'])
+
+    @classmethod
+    def get(cls):
+        """Shared index of this process, or None until build_faq_embeddings has run"""
+        meta = cls.directory() / cls.META
+        try:
+            stamp = (meta, meta.stat().st_mtime_ns)
+        except FileNotFoundError:
+            return None
+        if cls._current is None or cls._current_stamp != stamp:
+            with cls._lock:
+                if cls._current is None or cls._current_stamp != stamp:
+                    cls._current = cls.load(meta.parent)
+                    cls._current_stamp = stamp
+        return cls._current
+
+    def search(self, question, limit=5):
+        """[(faq_id, similarity)] best first, one entry per FAQ"""
+        if not self.faq_ids:
+            return []
+        similarities = self.vectors @ embed([question])[0]
+        best = {}
+        for row in similarities.argsort()[::-1]:
+            faq_id = self.faq_ids[row]
+            if faq_id not in best:
+                best[faq_id] = float(similarities[row])
+                if len(best) == limit:
+                    break
+        return list(best.items())
+
+
+def suggest_faqs(similarity=0.5, min_count=2, limit=2000):
+    """
+    Group the latest unresolved unanswered questions by embedding similarity
+    (each question joins the group whose first question it is most similar
+    to, if at least `similarity`) and
+    return the groups of at least min_count questions that no existing FAQ
+    already answers, largest first:
+    [{'question', 'count', 'examples', 'nearest_faq_id', 'nearest_similarity'}]
+    """
+    questions = list(
+        AIUnansweredQuestion.objects.filter(is_resolved=False)
+        .exclude(question__startswith='LOW RATING')
+        .order_by('-created_at').values_list('question', flat=True)[:limit]
+    )
+    if not questions:
+        return []
+    vectors = embed(questions)
+
+    leaders, groups = [], []
+    for row, vector in enumerate(vectors):
+        if leaders:
+            scores = vectors[leaders] @ vector
+            best = int(scores.argmax())
+            if scores[best] >= similarity:
+                groups[best].append(row)
+                continue
+        leaders.append(row)
+        groups.append([row])
+
+    index = FAQEmbeddingIndex.get()
+    suggestions = []
+    for leader, members in zip(leaders, groups):
+        if len(members) < min_count:
+            continue
+        nearest = index.search(questions[leader], limit=1) if index else []
+        nearest_id, nearest_similarity = nearest[0] if nearest else (None, 0.0)
+        if nearest_similarity >= similarity:
+            continue
+        # The member closest to the others stands for the group
+        centroid = vectors[members].mean(axis=0)
+        representative = members[int((vectors[members] @ centroid).argmax())]
+        suggestions.append({
+            'question': questions[representative],
+            'count': len(members),
+            'examples': [questions[row] for row in members[:5]],
+            'nearest_faq_id': nearest_id,
+            'nearest_similarity': round(nearest_similarity, 3),
+        })
+    suggestions.sort(key=lambda suggestion: -suggestion['count'])
+    return suggestions
@@ -0,0 +1,220 @@
+import math
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.db.models import Count, Max
+
+from ..models import AIAssistantFAQ
+
+_APOSTROPHES = re.compile(r"[ʻʼ‘’`´]")
+_NON_WORD = re.compile(r"[^\w']+")
+
+# Longest first; a suffix is only cut if at least MIN_STEM characters remain
+_UZ_SUFFIXES = sorted([
+    'larimizni', 'laringizni', 'larimiz', 'laringiz', 'larini', 'larning', 'lardan', 'larda', 'larga', 'lari', 'lar',
+    'imizni', 'ingizni', 'imiz', 'ingiz', 'ning', 'dagi', 'dan', 'da', 'ga', 'ka', 'qa', 'ni', 'mi', 'si', 'im', 'ing',
+    'ish', 'ib', 'dim', 'gan', 'kan', 'moq', 'ladi', 'adi', 'di', 'sh', 'aman', 'man', 'iylik', 'lik', 'i',
+], key=len, reverse=True)
+_RU_SUFFIXES = sorted([
+    'ировать', 'ить', 'ать', 'ять', 'еть', 'иться', 'ться', 'ость', 'ение', 'ения', 'ании', 'ание', 'ами', 'ями', 'ого', 'его', 'ому', 'ему',
+    'ыми', 'ими', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ый', 'ий', 'ой', 'ей', 'ов', 'ев', 'ам', 'ям', 'ах', 'ях',
+    'ом', 'ем', 'ть', 'ся', 'сь', 'ют', 'ет', 'ит', 'а', 'я', 'ы', 'и', 'е', 'о', 'у', 'ю', 'ь', 'й',
+], key=len, reverse=True)
+MIN_STEM = 3
+
+# Question words that say nothing about the topic
+STOPWORDS = {
+    'qanday', 'qancha', 'qaysi', 'nima', 'kim', 'bormi', 'mumkin', 'kerak', 'men', 'siz', 'bu', 'va', 'bilan', 'uchun',
+    'qachon', 'necha', 'orqali', "bo'ladi", "bo'ladimi", "bo'lsa", "bo'lsam", 'mumkinmi',
+    'как', 'какой', 'какая', 'какие', 'какова', 'кто', 'что', 'где', 'ли', 'есть', 'можно', 'мне', 'я', 'вы', 'и', 'в', 'на',
+    'с', 'для', 'если', 'нужна', 'нужно', 'наши', 'наш', 'через', 'не',
+}
+
+
+def normalize(text):
+    text = _APOSTROPHES.sub("'", (text or '').lower()).replace('ё', 'е')
+    return _NON_WORD.sub(' ', text)
+
+
+def _strip_suffix(token, suffixes):
+    for suffix in suffixes:
+        if token.endswith(suffix) and len(token) - len(suffix) >= MIN_STEM:
+            return token[:-len(suffix)]
+    return token
+
+
+def stem(token):
+    if re.search('[а-я]', token):
+        return _strip_suffix(token, _RU_SUFFIXES)
+    # Uzbek stacks suffixes (yo'nalish-ni, kurs-lar-i): strip until none is left
+    while True:
+        stemmed = _strip_suffix(token, _UZ_SUFFIXES)
+        if stemmed == token:
+            return token
+        token = stemmed
+
+
+def tokenize(text):
+    """Stemmed content words of a text (Uzbek latin / Russian)"""
+    tokens = []
+    for token in normalize(text).split():
+        token = token.strip("'")
+        if len(token) < 2 or token in STOPWORDS:
+            continue
+        tokens.append(stem(token))
+    return tokens
+
+
+class FAQIndex:
+    """
+    In-memory inverted index over active FAQs (questions in both languages
+    and search tags), ranked with BM25.
+
+    Tags are curated keywords and count TAG_WEIGHT times. Confidence is the
+    share of the query's terms (by idf) that the FAQ covers; a term no FAQ
+    contains weighs as much as one found in a single FAQ. So a question
+    sharing only a generic word with the best FAQ ("Kursni qanday o'chirsam
+    bo'ladi?" vs "Qaysi kursni tanlashim kerak?") stays unanswered and goes
+    to the LLM fallback.
+    """
+
+    K1 = 1.2
+    B = 0.75
+    TAG_WEIGHT = 2
+    MIN_CONFIDENCE = 0.45
+
+    def __init__(self, faqs):
+        self.faqs = {faq.id: faq for faq in faqs}
+        self.postings = defaultdict(dict)  # term -> {faq_id: weighted tf}
+        self.lengths = {}
+        for faq in faqs:
+            terms = Counter(tokenize(faq.question_uz) + tokenize(faq.question_ru))
+            for tag in (faq.search_tags or '').split(','):
+                for term in tokenize(tag):
+                    terms[term] += self.TAG_WEIGHT
+            for term, tf in terms.items():
+                self.postings[term][faq.id] = tf
+            self.lengths[faq.id] = sum(terms.values())
+
+        self.size = len(self.faqs)
+        self.avg_length = (sum(self.lengths.values()) / self.size) if self.size else 0
+
+    @classmethod
+    def build(cls):
+        return cls(list(AIAssistantFAQ.objects.filter(is_active=True)))
+
+    def idf(self, term):
+        df = len(self.postings.get(term, ()))
+        return math.log(1 + (self.size - df + 0.5) / (df + 0.5))
+
+    def search(self, question, limit=5):
+        """[(faq, score, confidence)] best first"""
+        terms = list(dict.fromkeys(tokenize(question)))
+        if not terms or not self.size:
+            return []
+
+        unknown_idf = math.log(1 + (self.size - 0.5) / 1.5)
+        total_idf = sum(self.idf(term) if term in self.postings else unknown_idf for term in terms)
+        scores = defaultdict(float)
+        matched_idf = defaultdict(float)
+        for term in terms:
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf(term)
+            for faq_id, tf in postings.items():
+                norm = self.K1 * (1 - self.B + self.B * self.lengths[faq_id] / self.avg_length)
+                scores[faq_id] += idf * tf * (self.K1 + 1) / (tf + norm)
+                matched_idf[faq_id] += idf
+
+        ranked = sorted(scores, key=lambda faq_id: (-scores[faq_id], -self.faqs[faq_id].priority, self.faqs[faq_id].order))
+        return [(self.faqs[faq_id], scores[faq_id], matched_idf[faq_id] / total_idf) for faq_id in ranked[:limit]]
+
+    def best_match(self, question):
+        results = self.search(question, limit=1)
+        if results and results[0][2] >= self.MIN_CONFIDENCE:
+            return results[0][0]
+        return None
+
+    # --- PROCESS-WIDE INSTANCE ---
+
+    VERSION_CHECK_SECONDS = 5
+    _current = None
+    _current_version = None
+    _checked_at = 0.0
+    _lock = threading.Lock()
+
+    @staticmethod
+    def db_version():
+        """(row count, latest updated_at) of the FAQ table; changes with every save or delete in any process"""
+        stats = AIAssistantFAQ.objects.aggregate(count=Count('id'), updated=Max('updated_at'))
+        return stats['count'], stats['updated']
+
+    @classmethod
+    def get(cls):
+        """
+        Shared index of this process. The table version is read from the
+        database at most every VERSION_CHECK_SECONDS, so FAQ edits made in
+        other processes are picked up within that time, and at once in this one.
+        """
+        index = cls._current
+        if index is not None and time.monotonic() - cls._checked_at < cls.VERSION_CHECK_SECONDS:
+            return index
+        with cls._lock:
+            if cls._current is None or time.monotonic() - cls._checked_at >= cls.VERSION_CHECK_SECONDS:
+                # Read before building: a save in between only causes one more rebuild
+                version = cls.db_version()
+                if cls._current is None or version != cls._current_version:
+                    cls._current = cls.build()
+                    cls._current_version = version
+                cls._checked_at = time.monotonic()
+            return cls._current
+
+    @classmethod
+    def invalidate(cls):
+        cls._current = None
+
+
+def legacy_match(faqs, question, language):
+    """The previous linear scan of find_faq_match (kept for the benchmark)"""
+    question = question.lower().strip()
+    words = question.split()
+    for faq in faqs:
+        tags = [t.strip().lower() for t in faq.search_tags.split(',')] if faq.search_tags else []
+        if any(word in tags for word in words):
+            return faq
+        q_text = faq.question_uz.lower() if language == 'uz' else faq.question_ru.lower()
+        if question in q_text or q_text in question:
+            return faq
+    return None
+
+
+def benchmark(queries, iterations=200):
+    """
+    Per-query latency of the index vs. the legacy scan, both with the rows
+    already loaded and with the per-query FAQ fetch the scan used to do.
+    Returns {'build_ms', 'index_us', 'scan_us', 'scan_db_us'}
+    """
+    def per_query(func, rounds):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for question in queries:
+                func(question)
+        return (time.perf_counter() - start) / (rounds * len(queries)) * 1e6
+
+    start = time.perf_counter()
+    index = FAQIndex.build()
+    build_ms = (time.perf_counter() - start) * 1000
+    faqs = list(index.faqs.values())
+
+    return {
+        'build_ms': build_ms,
+        'index_us': per_query(index.best_match, iterations),
+        'scan_us': per_query(lambda question: legacy_match(faqs, question, 'uz'), iterations),
+        'scan_db_us': per_query(
+            lambda question: legacy_match(AIAssistantFAQ.objects.filter(is_active=True), question, 'uz'),
+            max(iterations // 10, 1)
+        ),
+    }
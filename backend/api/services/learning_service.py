@@ -1,19 +1,150 @@
+from django.core.cache import cache
+from django.db import transaction
 from django.utils import timezone
 from api.models import (
     Course, Module, Lesson, LessonProgress, 
     Enrollment, LessonPractice, LessonTest, User,
-    Certificate
+    Certificate, LearningStateSnapshot, ModuleProgress
 )
 from api.utils import generate_unique_id
 from rest_framework.exceptions import ValidationError
-from django.db.models import Prefetch
+from django.db.models import Count, F, OuterRef, Prefetch, Q, Subquery
+from django.db.models.functions import Coalesce
+from api.services.event_bus import CourseCompleted, EventBus, LessonCompleted
+
+
+def _to_bits(value):
+    return value.to_bytes((value.bit_length() + 7) // 8, 'little')
+
+
+def _from_bits(data):
+    return int.from_bytes(bytes(data or b''), 'little')
+
 
 class LearningService:
+    STRUCTURE_CACHE_TTL = 24 * 60 * 60
+
+    @staticmethod
+    def get_course_structure(course):
+        """
+        Lesson order and lock rules of a course, cached per structure_version.
+        Bit i of every bitmap below (and of a LearningStateSnapshot) is lessons[i].
+        """
+        def build():
+            # One query: module order first, then lesson order within the module
+            lessons = list(
+                Lesson.objects.filter(course=course, module__isnull=False)
+                .order_by('module__order', 'module_id', 'order', 'id')
+                .values_list('id', 'is_free', 'is_locked', 'required_lesson_id')
+            )
+            return {
+                "lesson_ids": [lesson[0] for lesson in lessons],
+                "index": {lesson[0]: i for i, lesson in enumerate(lessons)},
+                "free": sum(1 << i for i, lesson in enumerate(lessons) if lesson[1]),
+                "flagged": sum(1 << i for i, lesson in enumerate(lessons) if lesson[2]),
+                "required": {i: lesson[3] for i, lesson in enumerate(lessons) if lesson[3]},
+            }
+
+        key = f"course_structure:{course.id}:{course.structure_version}"
+        return cache.get_or_set(key, build, LearningService.STRUCTURE_CACHE_TTL)
+
+    @staticmethod
+    def compute_locks(structure, lock_strategy, completed):
+        """Lock bitmap of an enrolled user from the completion bitmap (same rules as get_course_learning_state)"""
+        if lock_strategy == 'free':
+            return 0
+        count = len(structure["lesson_ids"])
+        if lock_strategy == 'sequential':
+            # Locked if the previous lesson is not completed
+            locked = (~(completed << 1) & ((1 << count) - 1)) & ~1
+        elif lock_strategy == 'custom':
+            locked = structure["flagged"]
+            for i, required_id in structure["required"].items():
+                required_index = structure["index"].get(required_id)
+                if locked >> i & 1 and required_index is not None and completed >> required_index & 1:
+                    locked &= ~(1 << i)
+        else:
+            locked = structure["flagged"]
+        # Free lessons are always unlocked
+        return locked & ~structure["free"]
+
+    @staticmethod
+    def _current_lesson_id(structure, completed, locked):
+        """First unlocked lesson not completed yet"""
+        for i, lesson_id in enumerate(structure["lesson_ids"]):
+            if not (completed | locked) >> i & 1:
+                return lesson_id
+        return None
+
+    @staticmethod
+    def get_learning_snapshot(user, course):
+        """
+        Completion/lock bitmaps of an enrolled user, rebuilt from LessonProgress
+        when missing or built for an older course structure / lock strategy.
+        Returns (snapshot, structure).
+        """
+        structure = LearningService.get_course_structure(course)
+        structure_key = f"{course.structure_version}:{course.lock_strategy}"
+        snapshot = LearningStateSnapshot.objects.filter(user=user, course=course).first()
+        if snapshot is not None and snapshot.structure_key == structure_key:
+            return snapshot, structure
+
+        completed_ids = LessonProgress.objects.filter(
+            user=user, lesson__course=course, is_completed=True
+        ).values_list('lesson_id', flat=True)
+        completed = 0
+        for lesson_id in completed_ids:
+            if lesson_id in structure["index"]:
+                completed |= 1 << structure["index"][lesson_id]
+
+        snapshot = LearningService._save_snapshot(user, course, structure, structure_key, completed)
+        return snapshot, structure
+
+    @staticmethod
+    def _save_snapshot(user, course, structure, structure_key, completed):
+        locked = LearningService.compute_locks(structure, course.lock_strategy, completed)
+        snapshot, _ = LearningStateSnapshot.objects.update_or_create(
+            user=user, course=course,
+            defaults={
+                'structure_key': structure_key,
+                'completed': _to_bits(completed),
+                'locked': _to_bits(locked),
+                'current_lesson_id': LearningService._current_lesson_id(structure, completed, locked),
+            }
+        )
+        return snapshot
+
+    @staticmethod
+    def _mark_lesson_completed(user, lesson):
+        """Incrementally set the lesson's completion bit and recompute the locks"""
+        course = lesson.course
+        snapshot, structure = LearningService.get_learning_snapshot(user, course)
+        index = structure["index"].get(lesson.id)
+        if index is None:
+            return snapshot
+        completed = _from_bits(snapshot.completed) | (1 << index)
+        return LearningService._save_snapshot(user, course, structure, snapshot.structure_key, completed)
+
+    @staticmethod
+    def is_lesson_locked(user, lesson):
+        """Lock check for a single lesson without loading the whole course"""
+        course = lesson.course
+        index = LearningService.get_course_structure(course)["index"].get(lesson.id)
+        if index is None:
+            # Lessons outside modules are not part of the learning path
+            return False
+        if not user.is_authenticated or not Enrollment.objects.filter(user=user, course=course).exists():
+            # Guest mode: everything except free lessons is locked
+            return not lesson.is_free
+        snapshot, _ = LearningService.get_learning_snapshot(user, course)
+        return bool(_from_bits(snapshot.locked) >> index & 1)
+
     @staticmethod
     def get_course_learning_state(user, course_id):
         """
         Calculates the complete learning state for a user in a course,
         including which lessons are locked and their progress.
+        Locks of enrolled users come from their LearningStateSnapshot.
         """
         try:
             enrollment = Enrollment.objects.get(user=user, course_id=course_id)
@@ -38,10 +169,9 @@ class LearningService:
 
         modules = Module.objects.filter(course_id=course_id).prefetch_related(
             progress_prefetch
-        ).order_by('order')
+        ).order_by('order', 'id')
 
         course = enrollment.course if enrollment.id else Course.objects.get(id=course_id)
-        lock_strategy = course.lock_strategy
 
         # Flatten lessons and link progress
         flat_lessons = []
@@ -55,53 +185,26 @@ class LearningService:
                 l.progress_data = progress[0] if progress else None
                 flat_lessons.append(l)
 
-        # Iterate and set is_locked based on strategy
         is_enrolled = enrollment.id is not None
-        previous_completed = True # Helper for sequential strategy
-
-        # Build a map for fast lookup of completion status
-        completion_map = {l.id: (l.progress_data.is_completed if l.progress_data else False) for l in flat_lessons}
+        snapshot = None
+        if is_enrolled:
+            snapshot, structure = LearningService.get_learning_snapshot(user, course)
+            locked = _from_bits(snapshot.locked)
 
         for lesson in flat_lessons:
             if not is_enrolled:
                 # Guest mode: Lock everything except free lessons
                 lesson.is_locked = not lesson.is_free
             else:
-                # Enrolled mode: apply lock strategy
-                if lock_strategy == 'free':
-                    lesson.is_locked = False
-                
-                elif lock_strategy == 'sequential':
-                    # Sequential: lock if previous lesson is not completed
-                    lesson.is_locked = not previous_completed
-                
-                elif lock_strategy == 'custom':
-                    # Custom: use required_lesson field and is_locked flag
-                    if lesson.is_locked:
-                        if lesson.required_lesson_id:
-                            # Use completion map to check required lesson
-                            lesson.is_locked = not completion_map.get(lesson.required_lesson_id, False)
-                        else:
-                            # is_locked is True but no specific required_lesson? 
-                            # Interpret as "locked by some unspecified rule", maybe teacher manually unlocks? 
-                            # For now, if is_locked=True but no required_lesson, we keep it locked.
-                            pass
-                    else:
-                        # is_locked is False in custom mode
-                        lesson.is_locked = False
-                
-                # Special cases: free lessons are ALWAYS unlocked
-                if lesson.is_free:
-                    lesson.is_locked = False
-
-                # Update state for next iteration (used by sequential)
-                is_completed = completion_map.get(lesson.id, False)
-                previous_completed = is_completed
+                index = structure["index"].get(lesson.id)
+                if index is not None:
+                    lesson.is_locked = bool(locked >> index & 1)
 
         return {
             "enrollment": enrollment,
             "modules": modules,
-            "flat_lessons": flat_lessons
+            "flat_lessons": flat_lessons,
+            "current_lesson_id": snapshot.current_lesson_id if snapshot else None
         }
 
     @staticmethod
@@ -117,6 +220,7 @@ class LearningService:
             return None
 
     @staticmethod
+    @transaction.atomic
     def update_lesson_progress(user, lesson_id, update_type, data=None):
         """
         Updates specific parts of lesson progress (video, practice, test).
@@ -201,130 +305,139 @@ class LearningService:
             if not progress.is_completed:
                 progress.is_completed = True
                 progress.completed_at = timezone.now()
-                
-                # Update Streak
-                from api.streak_service import StreakService
-                StreakService.record_activity(user, 'LESSON_COMPLETE', f"Completed lesson: {lesson.title}")
-                
-                # Reward Lesson XP
-                if lesson.xp_amount > 0:
-                    user.add_xp(lesson.xp_amount, 'LESSON_COMPLETE', f"Dars yakunlandi: {lesson.title}")
-                
-                # Update Enrollment overall progress
+                # Claim the transition in the database so concurrent requests count the lesson once
+                claimed = LessonProgress.objects.filter(pk=progress.pk, is_completed=False).update(
+                    is_completed=True, completed_at=progress.completed_at
+                )
+                if not claimed:
+                    return
+
+                if lesson.is_published:
+                    Enrollment.objects.filter(user=user, course_id=lesson.course_id).update(
+                        completed_lessons_count=F('completed_lessons_count') + 1
+                    )
+                    if lesson.module_id:
+                        ModuleProgress.objects.get_or_create(user=user, module_id=lesson.module_id)
+                        ModuleProgress.objects.filter(user=user, module_id=lesson.module_id).update(
+                            completed_lessons_count=F('completed_lessons_count') + 1
+                        )
+                LearningService._mark_lesson_completed(user, lesson)
+                # Enrollment progress is part of the core write, so the response already reflects this lesson
                 LearningService.update_enrollment_stats(user, lesson.course)
-                
-                # Check for Module Completion
-                if lesson.module:
-                    LearningService.check_module_completion(user, lesson.module)
+
+                # Streak, XP and module rewards run after commit
+                EventBus.publish(LessonCompleted(
+                    user_id=user.id, lesson_id=lesson.id, course_id=lesson.course_id, module_id=lesson.module_id
+                ))
 
     @staticmethod
     def check_module_completion(user, module):
-        """Check if all published lessons in a module are completed by the user"""
-        total_lessons = Lesson.objects.filter(module=module, is_published=True).count()
-        completed_lessons = LessonProgress.objects.filter(
-            user=user, 
-            lesson__module=module, 
-            is_completed=True
-        ).count()
-        
-        if total_lessons > 0 and completed_lessons >= total_lessons:
-            # All lessons completed - check if already rewarded? 
-            # We can use ActivityLog to prevent double reward or just check if it's the first time
-            # For simplicity, we can log it. 
-            # Better: add a ModuleCompletion model or just check ActivityLog
-            from api.models import ActivityLog
-            if not ActivityLog.objects.filter(user=user, activity_type='MODULE_COMPLETE', description__contains=f"Module ID: {module.id}").exists():
-                user.add_xp(module.xp_reward, 'MODULE_COMPLETE', f"Modul yakunlandi: {module.title} (Module ID: {module.id})")
+        """
+        Reward the module XP once all its published lessons are completed.
+        One indexed lookup of the (user, module) ModuleProgress row; setting
+        completed_at with a conditional update makes the reward idempotent.
+        """
+        row = ModuleProgress.objects.filter(user=user, module=module).first()
+        total_lessons = module.published_lessons_count
+        if row is None or total_lessons <= 0 or row.completed_lessons_count < total_lessons:
+            return False
+
+        claimed = ModuleProgress.objects.filter(pk=row.pk, completed_at__isnull=True).update(completed_at=timezone.now())
+        if claimed:
+            user.add_xp(module.xp_reward, 'MODULE_COMPLETE', f"Modul yakunlandi: {module.title} (Module ID: {module.id})")
+        return bool(claimed)
 
     @staticmethod
+    @transaction.atomic
     def update_enrollment_stats(user, course):
-        """Recalculate total course progress % for an enrollment"""
-        total_lessons = Lesson.objects.filter(course=course, is_published=True).count()
-        completed_lessons = LessonProgress.objects.filter(
-            user=user, 
-            lesson__course=course, 
-            is_completed=True
-        ).count()
-        
-        progress_pct = (completed_lessons / total_lessons * 100) if total_lessons > 0 else 0
-        
+        """
+        Course progress % of an enrollment from its completed_lessons_count
+        and the course's published_lessons_count (both kept up to date incrementally)
+        """
         enrollment = Enrollment.objects.get(user=user, course=course)
-        enrollment.progress = progress_pct
+        total_lessons = course.published_lessons_count
+        progress_pct = min(enrollment.completed_lessons_count / total_lessons * 100, 100) if total_lessons > 0 else 0
+        enrollment.progress = round(progress_pct, 2)
         
         # Use course threshold (default 80%) for completion trigger
         threshold = getattr(course, 'completion_min_progress', 80)
         
-        # PRO UPGRADE: Check Final Exam if it exists
+        # PRO UPGRADE: Check Final Exam if it exists (only once the threshold is reached)
         final_exam_passed = True
-        final_test = LessonTest.objects.filter(lesson__course=course, is_final=True).first()
-        if final_test:
-            final_progress = LessonProgress.objects.filter(user=user, lesson=final_test.lesson).first()
-            required_score = getattr(course, 'required_final_score', 70)
-            if not final_progress or final_progress.test_score is None or final_progress.test_score < required_score:
-                final_exam_passed = False
+        if progress_pct >= threshold and not enrollment.completed_at:
+            final_test = LessonTest.objects.filter(lesson__course=course, is_final=True).first()
+            if final_test:
+                final_progress = LessonProgress.objects.filter(user=user, lesson=final_test.lesson).first()
+                required_score = getattr(course, 'required_final_score', 70)
+                if not final_progress or final_progress.test_score is None or final_progress.test_score < required_score:
+                    final_exam_passed = False
 
         if progress_pct >= threshold and final_exam_passed and not enrollment.completed_at:
             enrollment.completed_at = timezone.now()
-            # Reward XP for course completion
-            user.add_xp(course.xp_reward, 'COURSE_ENROLL', f"Kurs yakunlandi: {course.title}")
-            
-            # Update Career Progress
-            from api.services.profession_service import ProfessionService
-            ProfessionService.update_all_active_professions(user)
-            
-            # 🚀 HOGWARTS CAREER ENGINE HOOK: Auto-complete Course Nodes
-            try:
-                from api.models import ProfessionNode, UserProfessionState
-                from api.services.career_engine_service import CareerEngineService
-                
-                # Get all active profession states for the user
-                active_states = UserProfessionState.objects.filter(user=user, status='active')
-                for state in active_states:
-                    if state.current_level:
-                        # Find if there's a course node in the current level for this course
-                        nodes = state.current_level.nodes.filter(
-                            node_type='course', 
-                            reference_id=course.id
-                        )
-                        for node in nodes:
-                            try:
-                                CareerEngineService.complete_node(user, node, score=100)
-                            except Exception as e:
-                                print(f"CareerEngine Error completing course node: {e}")
-            except Exception as e:
-                print(f"CareerEngine Error: {e}")
-            
-            # Create certificate if not already exists AND it's enabled for course
-            if course.is_certificate_enabled and not Certificate.objects.filter(user=user, course=course).exists():
-                from api.utils import generate_unique_id
-                cert_number = generate_unique_id('CRT')
-                
-                # Calculate average score for certificate
-                from django.db.models import Avg
-                avg_score = LessonProgress.objects.filter(
-                    user=user, 
-                    lesson__course=course, 
-                    test_score__isnull=False
-                ).aggregate(avg=Avg('test_score'))['avg'] or 0
-
-                Certificate.objects.create(
-                    cert_number=cert_number,
-                    user=user,
-                    course=course,
-                    grade=f"{int(avg_score)}%",
-                    score=int(avg_score),
-                    status='PENDING' 
-                )
-            
-            # Send notification to student
-            from api.models import Notification
-            Notification.objects.create(
-                user=user,
-                title="Tabriklaymiz! 🎓",
-                message=f"Siz '{course.title}' kursini muvaffaqiyatli yakunladingiz! Bilimlaringizni amalda qo'llashda omad tilaymiz.",
-                notification_type='ACHIEVEMENT',
-                channel='ALL',
-                link=f"/course/{course.id}"
+            # XP, career progress, certificate and notification run after commit
+            EventBus.publish(CourseCompleted(user_id=user.id, course_id=course.id))
+
+        # completed_lessons_count is only ever changed with F() updates; don't write it back
+        enrollment.save(update_fields=['progress', 'completed_at', 'last_accessed_at', 'updated_at'])
+
+    @staticmethod
+    def reconcile_progress_counters(fix=False):
+        """
+        Compare Course.published_lessons_count and Enrollment.completed_lessons_count
+        with recounts. Returns (course_drift, enrollment_drift), lists of
+        (object, stored, actual); fix=True repairs them and the enrollment progress.
+        """
+        courses = Course.objects.annotate(
+            actual=Count('lessons', filter=Q(lessons__is_published=True))
+        ).only('id', 'title', 'published_lessons_count')
+        course_drift = [(c, c.published_lessons_count, c.actual) for c in courses if c.published_lessons_count != c.actual]
+
+        completed = LessonProgress.objects.filter(
+            user=OuterRef('user'), lesson__course=OuterRef('course'), lesson__is_published=True, is_completed=True
+        ).values('user').annotate(n=Count('id')).values('n')
+        enrollments = Enrollment.objects.annotate(actual=Coalesce(Subquery(completed), 0)).exclude(
+            completed_lessons_count=F('actual')
+        ).select_related('course')
+        enrollment_drift = [(e, e.completed_lessons_count, e.actual) for e in enrollments]
+
+        if fix:
+            for course, _, actual in course_drift:
+                Course.objects.filter(pk=course.pk).update(published_lessons_count=actual)
+            published = {course.pk: actual for course, _, actual in course_drift}
+            for enrollment, _, actual in enrollment_drift:
+                total = published.get(enrollment.course_id, enrollment.course.published_lessons_count)
+                enrollment.completed_lessons_count = actual
+                enrollment.progress = round(min(actual / total * 100, 100), 2) if total > 0 else 0
+            Enrollment.objects.bulk_update(
+                [enrollment for enrollment, _, _ in enrollment_drift], ['completed_lessons_count', 'progress'], batch_size=500
             )
-            
-        enrollment.save()
+        return course_drift, enrollment_drift
+
+    @staticmethod
+    def reconcile_module_counters(fix=False):
+        """
+        Same as reconcile_progress_counters for Module.published_lessons_count
+        and ModuleProgress.completed_lessons_count. Returns (module_drift, progress_drift).
+        """
+        modules = Module.objects.annotate(
+            actual=Count('lessons', filter=Q(lessons__is_published=True))
+        ).only('id', 'title', 'published_lessons_count')
+        module_drift = [(m, m.published_lessons_count, m.actual) for m in modules if m.published_lessons_count != m.actual]
+
+        completed = LessonProgress.objects.filter(
+            user=OuterRef('user'), lesson__module=OuterRef('module'), lesson__is_published=True, is_completed=True
+        ).values('user').annotate(n=Count('id')).values('n')
+        rows = ModuleProgress.objects.annotate(actual=Coalesce(Subquery(completed), 0)).exclude(
+            completed_lessons_count=F('actual')
+        )
+        progress_drift = [(row, row.completed_lessons_count, row.actual) for row in rows]
+
+        if fix:
+            for module, _, actual in module_drift:
+                Module.objects.filter(pk=module.pk).update(published_lessons_count=actual)
+            for row, _, actual in progress_drift:
+                row.completed_lessons_count = actual
+            ModuleProgress.objects.bulk_update(
+                [row for row, _, _ in progress_drift], ['completed_lessons_count'], batch_size=500
+            )
+        return module_drift, progress_drift
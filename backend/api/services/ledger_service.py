@@ -0,0 +1,232 @@
+import uuid
+from collections import namedtuple, defaultdict
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import F, Sum, Max
+
+from ..models import LedgerEntry, LedgerCheckpoint, LedgerSnapshot, User, TeacherWallet
+
+
+Account = namedtuple('Account', ['account_type', 'owner_id'])
+
+
+class InsufficientFunds(ValueError):
+    pass
+
+
+class LedgerService:
+    """
+    Double-entry ledger for AC balances and teacher wallets.
+
+    LedgerEntry rows are the source of truth. Each transfer writes a debit and
+    a credit entry and, in the same transaction, applies the delta to the
+    materialized balance column with an F() UPDATE, so reads keep using
+    User.balance / TeacherWallet.balance without summing the ledger.
+    """
+
+    PLATFORM = Account('PLATFORM', None)
+    EXTERNAL = Account('EXTERNAL', None)
+
+    # account_type -> (model, owner lookup, balance column)
+    MATERIALIZED = {
+        'USER_BALANCE': (User, 'pk', 'balance'),
+        'TEACHER_PENDING': (TeacherWallet, 'teacher_id', 'pending_balance'),
+        'TEACHER_AVAILABLE': (TeacherWallet, 'teacher_id', 'balance'),
+    }
+
+    @staticmethod
+    def user(user_id):
+        return Account('USER_BALANCE', user_id)
+
+    @staticmethod
+    def teacher_pending(teacher_id):
+        return Account('TEACHER_PENDING', teacher_id)
+
+    @staticmethod
+    def teacher_available(teacher_id):
+        return Account('TEACHER_AVAILABLE', teacher_id)
+
+    @classmethod
+    @transaction.atomic
+    def transfer(cls, source, target, amount, entry_type, reference='', description='',
+                 require_funds=False, materialize=True):
+        """
+        Move amount from source to target account.
+
+        require_funds: refuse (InsufficientFunds) if the source's materialized
+        balance is lower than amount at the time of the UPDATE.
+        materialize: False only for opening entries that describe balances
+        already present in the columns.
+
+        Returns: journal id (None for a zero amount, nothing is posted)
+        """
+        amount = Decimal(str(amount))
+        if amount < 0:
+            raise ValueError("Transfer amount must not be negative")
+        if amount == 0:
+            return None
+
+        if materialize:
+            if not cls._apply(source, -amount, require_funds):
+                raise InsufficientFunds("Insufficient balance")
+            cls._apply(target, amount)
+
+        journal_id = uuid.uuid4()
+        LedgerEntry.objects.bulk_create([
+            LedgerEntry(
+                journal_id=journal_id, account_type=account.account_type, owner_id=account.owner_id,
+                amount=signed, entry_type=entry_type, reference=str(reference)[:100],
+                description=description[:255]
+            )
+            for account, signed in ((source, -amount), (target, amount))
+        ])
+        return journal_id
+
+    @classmethod
+    def _apply(cls, account, delta, require_funds=False):
+        """F() update of the materialized column; returns False if funds are missing"""
+        if account.account_type not in cls.MATERIALIZED:
+            return True
+
+        model, lookup, column = cls.MATERIALIZED[account.account_type]
+        if model is TeacherWallet:
+            TeacherWallet.objects.get_or_create(teacher_id=account.owner_id)
+
+        queryset = model.objects.filter(**{lookup: account.owner_id})
+        if require_funds:
+            queryset = queryset.filter(**{f'{column}__gte': -delta})
+        return queryset.update(**{column: F(column) + delta}) == 1
+
+    # --- BALANCES ---
+
+    @classmethod
+    def get_balance(cls, account):
+        """Balance from the latest snapshot plus entries posted after it"""
+        snapshot = LedgerSnapshot.objects.filter(
+            account_type=account.account_type, owner_id=account.owner_id
+        ).select_related('checkpoint').order_by('-checkpoint_id').first()
+
+        balance = snapshot.balance if snapshot else Decimal('0')
+        since = snapshot.checkpoint.last_entry_id if snapshot else 0
+
+        delta = LedgerEntry.objects.filter(
+            account_type=account.account_type, owner_id=account.owner_id, id__gt=since
+        ).aggregate(total=Sum('amount'))['total']
+        return balance + (delta or 0)
+
+    @staticmethod
+    def compute_balances(up_to=None, before_checkpoint=None):
+        """
+        All account balances: latest checkpoint (older than before_checkpoint,
+        if given) + one grouped query over newer entries.
+        Returns: {Account: Decimal}
+        """
+        balances = defaultdict(Decimal)
+        since = 0
+
+        checkpoints = LedgerCheckpoint.objects.all()
+        if before_checkpoint is not None:
+            checkpoints = checkpoints.filter(id__lt=before_checkpoint)
+        checkpoint = checkpoints.first()
+        if checkpoint:
+            since = checkpoint.last_entry_id
+            for account_type, owner_id, balance in checkpoint.snapshots.values_list('account_type', 'owner_id', 'balance'):
+                balances[Account(account_type, owner_id)] += balance
+
+        entries = LedgerEntry.objects.filter(id__gt=since)
+        if up_to is not None:
+            entries = entries.filter(id__lte=up_to)
+        for account_type, owner_id, total in entries.values('account_type', 'owner_id').annotate(
+            total=Sum('amount')
+        ).values_list('account_type', 'owner_id', 'total'):
+            balances[Account(account_type, owner_id)] += total
+
+        return balances
+
+    @classmethod
+    @transaction.atomic
+    def create_checkpoint(cls):
+        """
+        Snapshot every account so later balance reads only replay newer entries.
+
+        Entry ids are assigned at insert, not at commit, so a transfer still in
+        flight could commit an id below Max(id) after it was read and be left
+        out of every later balance. The entries table is therefore locked
+        against writes first: the bound is read once all in-flight transfers
+        have committed, and new ones wait until the checkpoint is written.
+        """
+        # On SQLite this first write takes the database write lock, which has the same effect
+        checkpoint = LedgerCheckpoint.objects.create()
+        cls._lock_entries()
+
+        checkpoint.last_entry_id = LedgerEntry.objects.aggregate(last=Max('id'))['last'] or 0
+        checkpoint.save(update_fields=['last_entry_id'])
+        balances = cls.compute_balances(up_to=checkpoint.last_entry_id, before_checkpoint=checkpoint.id)
+        LedgerSnapshot.objects.bulk_create([
+            LedgerSnapshot(checkpoint=checkpoint, account_type=account.account_type,
+                           owner_id=account.owner_id, balance=balance)
+            for account, balance in balances.items()
+        ], batch_size=1000)
+        return checkpoint
+
+    @staticmethod
+    def _lock_entries():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                # SHARE conflicts with the ROW EXCLUSIVE lock taken by INSERT
+                cursor.execute(f'LOCK TABLE {LedgerEntry._meta.db_table} IN SHARE MODE')
+
+    # --- RECONCILIATION ---
+
+    @classmethod
+    def _materialized_balances(cls):
+        """Non-zero balance columns as {Account: Decimal}"""
+        columns = {}
+        for user_id, balance in User.objects.exclude(balance=0).values_list('id', 'balance').iterator(chunk_size=2000):
+            columns[cls.user(user_id)] = balance
+        for teacher_id, balance, pending in TeacherWallet.objects.values_list(
+            'teacher_id', 'balance', 'pending_balance'
+        ).iterator(chunk_size=2000):
+            if balance:
+                columns[cls.teacher_available(teacher_id)] = balance
+            if pending:
+                columns[cls.teacher_pending(teacher_id)] = pending
+        return columns
+
+    @classmethod
+    def reconcile(cls):
+        """
+        Compare ledger balances with the materialized columns in one pass.
+        Returns: list of (account, ledger_balance, column_balance) that differ
+        """
+        ledger = {
+            account: balance for account, balance in cls.compute_balances().items()
+            if account.account_type in cls.MATERIALIZED
+        }
+        columns = cls._materialized_balances()
+
+        drift = []
+        for account in set(ledger) | set(columns):
+            ledger_balance = ledger.get(account, Decimal('0'))
+            column_balance = columns.get(account, Decimal('0'))
+            if ledger_balance != column_balance:
+                drift.append((account, ledger_balance, column_balance))
+        return sorted(drift, key=lambda row: (row[0].account_type, row[0].owner_id or 0))
+
+    @classmethod
+    @transaction.atomic
+    def post_opening_balances(cls):
+        """
+        Bring existing column balances into an empty ledger (EXTERNAL -> account)
+        without touching the columns. Returns number of accounts opened.
+        """
+        if LedgerEntry.objects.exists():
+            raise ValueError("Ledger already has entries")
+
+        opened = 0
+        for account, balance in cls._materialized_balances().items():
+            source, target = (cls.EXTERNAL, account) if balance > 0 else (account, cls.EXTERNAL)
+            cls.transfer(source, target, abs(balance), 'OPENING', description="Opening balance", materialize=False)
+            opened += 1
+        return opened
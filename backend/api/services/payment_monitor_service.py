@@ -0,0 +1,193 @@
+import asyncio
+import json
+import logging
+import os
+import re
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ImproperlyConfigured
+
+from ..models_settings import PaymentProviderConfig
+from .payment_service import PaymentService
+
+logger = logging.getLogger(__name__)
+
+# Bank notification about an incoming transfer
+INCOMING_RE = re.compile(r'Kirim|Received|Postuplenie|Vipolnen')
+
+# "150 000.00 so'm", "150,000 sum", "150000 UZS": thousands groups, optional decimals, currency
+AMOUNT_RE = re.compile(
+    r"(?<![\d.,])(\d{1,3}(?:[ \u00a0\u202f,]\d{3})+|\d+)(?:[.,]\d{1,2})?\s*(?:so['ʻ‘’`]?m|sum|uzs)\b",
+    re.IGNORECASE
+)
+
+# Telegram app credentials for accounts whose config has no api_id/api_hash
+DEFAULT_API_ID = os.getenv('TELEGRAM_API_ID')
+DEFAULT_API_HASH = os.getenv('TELEGRAM_API_HASH')
+
+
+def parse_amount(text):
+    """Incoming amount (whole so'm) of a bank message, or None"""
+    if not INCOMING_RE.search(text):
+        return None
+    match = AMOUNT_RE.search(text)
+    if not match:
+        return None
+    return int(re.sub(r'[ \u00a0\u202f,]', '', match.group(1)))
+
+
+class PaymentMonitor:
+    """
+    Watches bank notification bots on every active BOT payment config
+    (one Telegram user client per account) and confirms matching payments.
+
+    Parsed amounts go to a queue; a single worker confirms them in batches
+    through PaymentService.confirm_by_amounts. Message ids are remembered in
+    process, and the unique Payment.external_id makes a message confirm at
+    most one payment even across restarts or replays.
+    """
+
+    SEEN_LIMIT = 50000
+
+    def __init__(self, batch_size=50, flush_interval=1.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = asyncio.Queue()
+        self.confirmed = []
+        self._seen = OrderedDict()
+
+    @staticmethod
+    def external_id(account_id, chat_id, message_id):
+        return f"tg:{account_id}:{chat_id}:{message_id}"
+
+    async def handle_message(self, account_id, chat_id, message_id, text):
+        """Parse one bank message and queue its amount; returns the amount or None"""
+        external_id = self.external_id(account_id, chat_id, message_id)
+        if external_id in self._seen:
+            return None
+        self._seen[external_id] = True
+        if len(self._seen) > self.SEEN_LIMIT:
+            self._seen.popitem(last=False)
+
+        amount = parse_amount(text)
+        if amount is None:
+            logger.debug(f"Ignored message {external_id}")
+            return None
+
+        logger.info(f"Detected amount {amount} in {external_id}")
+        await self.queue.put((amount, external_id))
+        return amount
+
+    async def _next_batch(self):
+        batch = [await self.queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def confirm_batch(self, batch):
+        confirmed = await sync_to_async(PaymentService.confirm_by_amounts, thread_sensitive=True)(batch)
+        for payment in confirmed:
+            logger.info(f"💰 Payment {payment.id} PROCESSED SUCCESSFULLY!")
+        self.confirmed.extend(confirmed)
+        return confirmed
+
+    async def confirmation_worker(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self.confirm_batch(batch)
+            except Exception as e:
+                logger.error(f"Batch confirmation failed ({len(batch)} amounts): {e}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    # --- LIVE ---
+
+    @staticmethod
+    def load_accounts():
+        """
+        [(config_id, api_id, api_hash, session, target_usernames)] for active BOT configs.
+        Raises ImproperlyConfigured when an account has no Telegram app credentials.
+        """
+        accounts = []
+        configs = PaymentProviderConfig.objects.filter(type='BOT', is_active=True).order_by('id')
+        for index, config in enumerate(configs):
+            options = config.config or {}
+            target = (options.get('target_username') or '').lstrip('@')
+            if not target:
+                logger.warning(f"Payment config {config.id} has no target_username, skipped")
+                continue
+            # The first account keeps the original session file, so it stays logged in
+            session = options.get('session_name') or (
+                'ardent_userbot_session' if index == 0 else f'ardent_userbot_session_{config.id}'
+            )
+            api_id = options.get('api_id') or DEFAULT_API_ID
+            api_hash = options.get('api_hash') or DEFAULT_API_HASH
+            if not api_id or not api_hash:
+                raise ImproperlyConfigured(
+                    f"Payment config {config.id} has no Telegram api_id/api_hash: "
+                    f"set them in the config or the TELEGRAM_API_ID and TELEGRAM_API_HASH environment variables"
+                )
+            accounts.append((
+                config.id,
+                api_id,
+                api_hash,
+                session,
+                [target],
+            ))
+        return accounts
+
+    async def run_account(self, account):
+        from telethon import TelegramClient, events
+
+        config_id, api_id, api_hash, session, targets = account
+        client = TelegramClient(session, api_id, api_hash)
+
+        @client.on(events.NewMessage(from_users=targets))
+        async def handler(event):
+            try:
+                await self.handle_message(config_id, event.chat_id, event.id, event.raw_text)
+            except Exception as e:
+                logger.error(f"Error handling message on account {config_id}: {e}")
+
+        await client.start()
+        logger.info(f"Account {config_id} listening to {targets}")
+        await client.run_until_disconnected()
+
+    async def run(self, accounts):
+        worker = asyncio.create_task(self.confirmation_worker())
+        try:
+            await asyncio.gather(*(self.run_account(account) for account in accounts))
+        finally:
+            worker.cancel()
+
+    # --- OFFLINE REPLAY ---
+
+    async def replay(self, messages):
+        """
+        Feed recorded messages ({account, chat_id, id, text}) through the same
+        parsing and batching path. Returns the confirmed payments.
+        """
+        worker = asyncio.create_task(self.confirmation_worker())
+        try:
+            for message in messages:
+                await self.handle_message(message['account'], message['chat_id'], message['id'], message['text'])
+            await self.queue.join()
+        finally:
+            worker.cancel()
+        return self.confirmed
+
+    @staticmethod
+    def load_fixture(path):
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
@@ -0,0 +1,224 @@
+import logging
+from collections import defaultdict, deque
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction, IntegrityError
+from django.utils import timezone
+
+from ..models import Payment, Course, Olympiad, Enrollment, OlympiadRegistration
+from .ledger_service import LedgerService, InsufficientFunds
+
+logger = logging.getLogger(__name__)
+
+
+class PaymentService:
+    """
+    Single pipeline for completing payments.
+
+    Every confirmation path (admin panel, mock checkout, wallet purchase,
+    Telegram bot callbacks and the bank message monitor) goes through here so
+    that a payment is completed exactly once and its side effects (balance
+    credit, enrollment, olympiad registration) are applied in the same
+    transaction as the status change.
+    """
+
+    # Payment types that credit the user's AC balance when completed
+    BALANCE_TYPES = ('TOPUP', 'FILL_BALANCE', 'WALLET_TOPUP', 'USERBOT')
+
+    # How long a pending payment can be matched by an incoming bank message
+    MATCH_WINDOW_MINUTES = 15
+
+    @classmethod
+    def is_balance_payment(cls, payment):
+        return payment.type in cls.BALANCE_TYPES
+
+    @staticmethod
+    def credit_balance(user_id, amount, reference=''):
+        """Post a top-up to the ledger (EXTERNAL -> user balance)"""
+        LedgerService.transfer(
+            LedgerService.EXTERNAL, LedgerService.user(user_id), amount, 'TOPUP', reference=reference
+        )
+
+    @staticmethod
+    def debit_balance(user_id, amount, reference=''):
+        """
+        Post a balance purchase to the ledger (user balance -> PLATFORM).
+        Returns False if the balance is insufficient at the time of the UPDATE.
+        """
+        try:
+            LedgerService.transfer(
+                LedgerService.user(user_id), LedgerService.PLATFORM, amount, 'PURCHASE',
+                reference=reference, require_funds=True
+            )
+        except InsufficientFunds:
+            return False
+        return True
+
+    @classmethod
+    def confirm_payment(cls, payment_id, external_id=None, transaction_id=None, method=None, credit_amount=None):
+        """
+        Complete a pending payment and apply its side effects.
+
+        Idempotent: a payment that is no longer PENDING, or an external_id
+        (bank message id, provider transaction id) that was already used,
+        is a no-op.
+
+        Returns: (payment, confirmed) where confirmed is False if nothing changed.
+        """
+        try:
+            with transaction.atomic():
+                if external_id:
+                    existing = Payment.objects.filter(external_id=external_id).first()
+                    if existing:
+                        return existing, False
+
+                payment = Payment.objects.select_for_update().get(pk=payment_id)
+                if payment.status != 'PENDING':
+                    return payment, False
+
+                payment.status = 'COMPLETED'
+                payment.completed_at = timezone.now()
+                update_fields = ['status', 'completed_at']
+                if external_id:
+                    payment.external_id = external_id
+                    update_fields.append('external_id')
+                if transaction_id:
+                    payment.transaction_id = transaction_id
+                    update_fields.append('transaction_id')
+                if method:
+                    payment.method = method
+                    update_fields.append('method')
+                payment.save(update_fields=update_fields)
+
+                cls._fulfill(payment, credit_amount)
+        except IntegrityError:
+            # Another worker stored the same external_id concurrently
+            logger.info(f"Payment {payment_id}: external id {external_id} already processed")
+            return Payment.objects.get(pk=payment_id), False
+
+        return payment, True
+
+    @classmethod
+    def confirm_by_amounts(cls, matches, method='USERBOT'):
+        """
+        Batch-confirm payments from incoming bank messages.
+
+        matches: iterable of (amount, external_id) pairs, e.g. a replayed
+        backlog of bank notifications. Already processed external ids are
+        skipped, and each amount is matched to the oldest pending payment
+        with the same final_amount inside MATCH_WINDOW_MINUTES.
+
+        Returns: list of confirmed payments
+        """
+        matches = [(Decimal(str(amount)), external_id) for amount, external_id in matches]
+        if not matches:
+            return []
+
+        external_ids = [external_id for _, external_id in matches if external_id]
+        processed = set(
+            Payment.objects.filter(external_id__in=external_ids).values_list('external_id', flat=True)
+        )
+
+        # One query for all candidate payments, grouped by amount (oldest first)
+        threshold = timezone.now() - timedelta(minutes=cls.MATCH_WINDOW_MINUTES)
+        candidates = defaultdict(deque)
+        pending = Payment.objects.filter(
+            status='PENDING',
+            created_at__gte=threshold,
+            final_amount__in={amount for amount, _ in matches}
+        ).order_by('created_at').values_list('id', 'final_amount')
+        for payment_id, final_amount in pending:
+            candidates[final_amount].append(payment_id)
+
+        confirmed = []
+        for amount, external_id in matches:
+            if external_id and external_id in processed:
+                continue
+
+            queue = candidates.get(amount)
+            while queue:
+                payment_id = queue.popleft()
+                payment, ok = cls.confirm_payment(
+                    payment_id,
+                    external_id=external_id,
+                    transaction_id=f"BOT-{external_id}" if external_id else None,
+                    method=method
+                )
+                if ok:
+                    confirmed.append(payment)
+                    if external_id:
+                        processed.add(external_id)
+                    break
+            else:
+                logger.warning(f"No matching pending payment found for amount: {amount}")
+
+        return confirmed
+
+    @classmethod
+    @transaction.atomic
+    def pay_with_balance(cls, user, payment_type, item, transaction_id=None):
+        """
+        Buy a course/olympiad with AC balance.
+        Raises ValueError if the balance is insufficient.
+        """
+        price = item.price
+        if not cls.debit_balance(user.pk, price, reference=f"{payment_type}:{item.id}"):
+            raise ValueError("Insufficient balance")
+
+        payment = Payment.objects.create(
+            user=user,
+            amount=price,
+            original_amount=price,
+            final_amount=price,
+            type=payment_type,
+            reference_id=str(item.id),
+            method='WALLET',
+            status='COMPLETED',
+            completed_at=timezone.now(),
+            transaction_id=transaction_id
+        )
+        cls._grant_access(payment, item)
+
+        user.refresh_from_db(fields=['balance'])
+        return payment
+
+    # --- SIDE EFFECTS ---
+
+    @classmethod
+    def _fulfill(cls, payment, credit_amount=None):
+        if cls.is_balance_payment(payment):
+            amount = credit_amount if credit_amount is not None else (payment.original_amount or payment.amount)
+            cls.credit_balance(payment.user_id, amount, reference=f"payment:{payment.id}")
+            return
+
+        item = None
+        if payment.type == 'COURSE':
+            item = Course.objects.filter(id=payment.reference_id).first()
+        elif payment.type == 'OLYMPIAD':
+            item = Olympiad.objects.filter(id=payment.reference_id).first()
+
+        if item is None:
+            if payment.type in ('COURSE', 'OLYMPIAD'):
+                logger.error(f"Payment {payment.id}: {payment.type} {payment.reference_id} not found")
+            return
+
+        cls._grant_access(payment, item)
+
+    @staticmethod
+    def _grant_access(payment, item):
+        if payment.type == 'COURSE':
+            first_lesson = item.lessons.all().order_by('module__order', 'order').first()
+            Enrollment.objects.get_or_create(
+                user_id=payment.user_id,
+                course=item,
+                defaults={'current_lesson': first_lesson}
+            )
+        elif payment.type == 'OLYMPIAD':
+            registration, created = OlympiadRegistration.objects.get_or_create(
+                user_id=payment.user_id,
+                olympiad=item,
+                defaults={'is_paid': True}
+            )
+            if not created and not registration.is_paid:
+                OlympiadRegistration.objects.filter(pk=registration.pk).update(is_paid=True)
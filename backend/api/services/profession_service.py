@@ -1,3 +1,5 @@
+from collections import defaultdict
+
 from django.utils import timezone
 from api.models import (
     Profession, ProfessionRoadmapStep, UserProfessionProgress,
@@ -7,54 +9,59 @@ from django.db.models import Count
 
 class ProfessionService:
     @staticmethod
-    def update_user_profession_progress(user, profession):
+    def mandatory_steps(profession_ids):
         """
-        Recalculates progress for a specific profession roadmap.
-        Progress is based on:
-        1. Mandatory roadmap steps (Courses completed, Olympiads participated)
-        2. Required XP for the profession
+        {profession_id: (step_count, mandatory_count, course_ids, olympiad_ids)} in one query.
+        course_ids/olympiad_ids are the mandatory LEARN/COMPETE steps (a list: a
+        course used by two steps counts twice); other mandatory steps never count
+        as done (PROJECT etc. are marked by other logic).
         """
-        progress_obj, _ = UserProfessionProgress.objects.get_or_create(
-            user=user,
-            profession=profession
+        result = {profession_id: [0, 0, [], []] for profession_id in profession_ids}
+        steps = ProfessionRoadmapStep.objects.filter(profession_id__in=profession_ids).values_list(
+            'profession_id', 'is_mandatory', 'step_type', 'course_id', 'olympiad_id'
         )
-        
-        if progress_obj.status == 'COMPLETED':
-            return progress_obj
+        for profession_id, is_mandatory, step_type, course_id, olympiad_id in steps:
+            entry = result[profession_id]
+            entry[0] += 1
+            if not is_mandatory:
+                continue
+            entry[1] += 1
+            if step_type == 'LEARN' and course_id:
+                entry[2].append(course_id)
+            elif step_type == 'COMPETE' and olympiad_id:
+                entry[3].append(olympiad_id)
+        return {profession_id: tuple(entry) for profession_id, entry in result.items()}
 
-        steps = profession.roadmap_steps.all().order_by('order')
-        if not steps.exists():
-            return progress_obj
+    @staticmethod
+    def completed_activity(user_ids, course_ids=None, olympiad_ids=None):
+        """
+        {user_id: (completed course ids, finished olympiad ids)} with two queries,
+        optionally restricted to the courses/olympiads of interest
+        """
+        enrollments = Enrollment.objects.filter(user_id__in=user_ids, progress__gte=100)
+        results = TestResult.objects.filter(user_id__in=user_ids, status='COMPLETED')
+        if course_ids is not None:
+            enrollments = enrollments.filter(course_id__in=course_ids)
+        if olympiad_ids is not None:
+            results = results.filter(olympiad_id__in=olympiad_ids)
 
-        mandatory_steps = steps.filter(is_mandatory=True)
-        total_mandatory = mandatory_steps.count()
-        completed_mandatory = 0
-        
-        for step in mandatory_steps:
-            if step.step_type == 'LEARN' and step.course:
-                # Check if course is 100% completed
-                is_done = Enrollment.objects.filter(
-                    user=user, 
-                    course=step.course, 
-                    progress__gte=100
-                ).exists()
-                if is_done:
-                    completed_mandatory += 1
-            
-            elif step.step_type == 'COMPETE' and step.olympiad:
-                # Check if participated/finished olympiad
-                is_done = TestResult.objects.filter(
-                    user=user, 
-                    olympiad=step.olympiad, 
-                    status='COMPLETED'
-                ).exists()
-                if is_done:
-                    completed_mandatory += 1
-                    
-            elif step.step_type == 'PROJECT':
-                # For now, just placeholder or check specific project submission
-                # (Assuming manual/other logic marks it done)
-                pass
+        activity = defaultdict(lambda: (set(), set()))
+        for user_id, course_id in enrollments.values_list('user_id', 'course_id').distinct():
+            activity[user_id][0].add(course_id)
+        for user_id, olympiad_id in results.values_list('user_id', 'olympiad_id').distinct():
+            activity[user_id][1].add(olympiad_id)
+        return activity
+
+    @staticmethod
+    def compute_progress(profession, steps, courses_done, olympiads_done, user_xp):
+        """
+        Progress % from:
+        1. Mandatory roadmap steps (Courses completed, Olympiads participated)
+        2. Required XP for the profession
+        """
+        _, total_mandatory, course_ids, olympiad_ids = steps
+        completed_mandatory = sum(1 for course_id in course_ids if course_id in courses_done)
+        completed_mandatory += sum(1 for olympiad_id in olympiad_ids if olympiad_id in olympiads_done)
 
         # Calculate percentage from steps
         step_progress = (completed_mandatory / total_mandatory * 100) if total_mandatory > 0 else 100
@@ -62,23 +69,44 @@ class ProfessionService:
         # Check XP requirement
         xp_progress = 100
         if profession.required_xp > 0:
-            user_xp_in_subject = user.xp # Or filter by subject if we track per-subject XP
+            user_xp_in_subject = user_xp # Or filter by subject if we track per-subject XP
             xp_progress = (user_xp_in_subject / profession.required_xp * 100)
             xp_progress = min(100, xp_progress)
 
         # Final progress is a blend (e.g. 80% steps, 20% total subject XP)
         # Or just min() to ensure both are met
-        final_progress = int(min(step_progress, xp_progress))
-        
-        progress_obj.progress_percent = final_progress
-        
-        if final_progress >= 100 and progress_obj.status != 'COMPLETED':
+        return int(min(step_progress, xp_progress))
+
+    @staticmethod
+    def _apply_progress(progress_obj, percent):
+        """Set the new %, returns True if the roadmap just got completed"""
+        progress_obj.progress_percent = percent
+        if percent >= 100 and progress_obj.status != 'COMPLETED':
             progress_obj.status = 'COMPLETED'
-            progress_obj.save()
+            return True
+        return False
+
+    @staticmethod
+    def update_user_profession_progress(user, profession):
+        """Recalculates progress for a specific profession roadmap"""
+        progress_obj, _ = UserProfessionProgress.objects.get_or_create(
+            user=user,
+            profession=profession
+        )
+        
+        if progress_obj.status == 'COMPLETED':
+            return progress_obj
+
+        steps = ProfessionService.mandatory_steps([profession.id])[profession.id]
+        if not steps[0]:
+            return progress_obj
+
+        courses_done, olympiads_done = ProfessionService.completed_activity([user.id], steps[2], steps[3])[user.id]
+        percent = ProfessionService.compute_progress(profession, steps, courses_done, olympiads_done, user.xp)
+        completed = ProfessionService._apply_progress(progress_obj, percent)
+        progress_obj.save()
+        if completed:
             ProfessionService._on_profession_unlocked(user, profession)
-        else:
-            progress_obj.save()
-            
         return progress_obj
 
     @staticmethod
@@ -97,9 +125,56 @@ class ProfessionService:
             link=f"/profession/{profession.id}"
         )
 
+    @staticmethod
+    def _update_rows(rows, users):
+        """Recompute FOLLOWING progress rows (with profession loaded) for the given {user_id: user}"""
+        rows = list(rows)
+        steps = ProfessionService.mandatory_steps({row.profession_id for row in rows})
+        course_ids = {course_id for entry in steps.values() for course_id in entry[2]}
+        olympiad_ids = {olympiad_id for entry in steps.values() for olympiad_id in entry[3]}
+        activity = ProfessionService.completed_activity(list(users), course_ids, olympiad_ids)
+
+        changed, unlocked = [], []
+        now = timezone.now()
+        for row in rows:
+            profession_steps = steps[row.profession_id]
+            if not profession_steps[0]:
+                continue
+            courses_done, olympiads_done = activity[row.user_id]
+            user = users[row.user_id]
+            percent = ProfessionService.compute_progress(row.profession, profession_steps, courses_done, olympiads_done, user.xp)
+            if percent == row.progress_percent and percent < 100:
+                continue
+            if ProfessionService._apply_progress(row, percent):
+                unlocked.append((user, row.profession))
+            row.updated_at = now
+            changed.append(row)
+
+        UserProfessionProgress.objects.bulk_update(changed, ['progress_percent', 'status', 'updated_at'], batch_size=500)
+        for user, profession in unlocked:
+            ProfessionService._on_profession_unlocked(user, profession)
+        return len(changed)
+
     @staticmethod
     def update_all_active_professions(user):
-        """Update progress for all professions the user is following"""
-        active_professions = UserProfessionProgress.objects.filter(user=user, status='FOLLOWING')
-        for prog in active_professions:
-            ProfessionService.update_user_profession_progress(user, prog.profession)
+        """Update progress for all professions the user is following (four queries in total)"""
+        rows = UserProfessionProgress.objects.filter(user=user, status='FOLLOWING').select_related('profession')
+        return ProfessionService._update_rows(rows, {user.id: user})
+
+    @staticmethod
+    def recompute_followers(profession, chunk_size=1000):
+        """Recompute roadmap progress of every follower of a profession; returns rows changed"""
+        rows = UserProfessionProgress.objects.filter(
+            profession=profession, status='FOLLOWING'
+        ).select_related('user').order_by('id')
+        changed = 0
+        chunk = []
+        for row in rows.iterator(chunk_size=chunk_size):
+            row.profession = profession
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                changed += ProfessionService._update_rows(chunk, {row.user_id: row.user for row in chunk})
+                chunk = []
+        if chunk:
+            changed += ProfessionService._update_rows(chunk, {row.user_id: row.user for row in chunk})
+        return changed
@@ -0,0 +1,186 @@
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Q
+
+from ..models import BankQuestion, Olympiad, Question
+
+CONTENT_FIELDS = ['type', 'text', 'options', 'correct_answer', 'explanation', 'code_template']
+
+
+def content_hash(question):
+    """sha256 of what makes two questions the same (whitespace and case of the text ignored)"""
+    content = [
+        question.type or 'MCQ',
+        ' '.join((question.text or '').split()).lower(),
+        [' '.join(str(option).split()) for option in (question.options or [])],
+        str(question.correct_answer or '').strip(),
+        (question.code_template or '').strip(),
+    ]
+    return hashlib.sha256(json.dumps(content, ensure_ascii=False).encode()).hexdigest()
+
+
+def compile_answer(qtype, correct_answer):
+    """Grading form of a correct answer: MCQ/NUMERIC compare stripped, TEXT/CODE also case-insensitive"""
+    answer = str(correct_answer or '').strip()
+    return answer if qtype in ('MCQ', 'NUMERIC') else answer.lower()
+
+
+class QuestionBankService:
+    """
+    Question bank: every distinct question content is stored once as a
+    BankQuestion (keyed by content_hash, tagged with subject and difficulty)
+    and olympiad Questions link to it in order, keeping points, time limit
+    and a copy of the content for the existing readers.
+
+    Reusing questions is a link copy: no parsing, and the compiled answer
+    key of an item is shared by every olympiad that uses it. An olympiad's
+    answer key is cached per Olympiad.questions_version, which the Question
+    signals and the bulk paths below bump.
+    """
+
+    ANSWER_KEY_TTL = 60 * 60 * 24
+    LINK_BATCH_SIZE = 500
+
+    @staticmethod
+    def link(questions, subject_id=None, difficulty='MEDIUM', created_by=None):
+        """
+        Point each (saved or unsaved) Question at the bank item with its
+        content, creating missing items. Returns the number of items created.
+        """
+        hashes = [content_hash(question) for question in questions]
+        items = dict(
+            BankQuestion.objects.filter(content_hash__in=set(hashes)).values_list('content_hash', 'id')
+        )
+        missing = {}
+        for question, digest in zip(questions, hashes):
+            if digest not in items and digest not in missing:
+                missing[digest] = BankQuestion(
+                    content_hash=digest, answer_key=compile_answer(question.type, question.correct_answer),
+                    subject_id=subject_id, difficulty=difficulty, created_by=created_by,
+                    **{field: getattr(question, field) for field in CONTENT_FIELDS}
+                )
+        if missing:
+            # Another import may create the same content concurrently
+            BankQuestion.objects.bulk_create(missing.values(), ignore_conflicts=True)
+            items.update(
+                BankQuestion.objects.filter(content_hash__in=missing.keys()).values_list('content_hash', 'id')
+            )
+        for question, digest in zip(questions, hashes):
+            question.bank_item_id = items[digest]
+        return len(missing)
+
+    @staticmethod
+    def visible_items(user):
+        """
+        Bank items a user may read (with their answers) and reuse: all of them
+        for admins; for teachers the items used only in their own olympiads,
+        or created by them and not used elsewhere.
+        """
+        items = BankQuestion.objects.all()
+        if user.role == 'ADMIN':
+            return items
+        own = Question.objects.filter(olympiad__teacher=user).values('bank_item_id')
+        foreign = Question.objects.filter(bank_item__isnull=False).exclude(olympiad__teacher=user).values('bank_item_id')
+        return items.filter(Q(id__in=own) | Q(created_by=user)).exclude(id__in=foreign)
+
+    @classmethod
+    def sync(cls, queryset=None):
+        """Link questions created before the bank (or by raw updates); returns (linked, items created)"""
+        queryset = (queryset if queryset is not None else Question.objects.all()).filter(bank_item__isnull=True)
+        linked = created = 0
+        while True:
+            batch = list(queryset.select_related('olympiad').order_by('id')[:cls.LINK_BATCH_SIZE])
+            if not batch:
+                return linked, created
+            with transaction.atomic():
+                for olympiad_id in {question.olympiad_id for question in batch}:
+                    group = [question for question in batch if question.olympiad_id == olympiad_id]
+                    olympiad = group[0].olympiad
+                    created += cls.link(
+                        group,
+                        subject_id=olympiad.subject_id_id if olympiad else None,
+                        difficulty=olympiad.difficulty if olympiad else 'MEDIUM',
+                    )
+                Question.objects.bulk_update(batch, ['bank_item'])
+                cls.bump_questions_version({question.olympiad_id for question in batch})
+            linked += len(batch)
+
+    # --- OLYMPIAD LINKS ---
+
+    @classmethod
+    @transaction.atomic
+    def add_items(cls, olympiad, items, points=1):
+        """Append bank items (in the given order) to an olympiad; returns the new Questions"""
+        order = olympiad.questions.count() + 1
+        questions = Question.objects.bulk_create([
+            Question(
+                olympiad=olympiad, bank_item=item, points=points, order=order + position,
+                **{field: getattr(item, field) for field in CONTENT_FIELDS}
+            )
+            for position, item in enumerate(items)
+        ])
+        cls.bump_questions_version([olympiad.id])
+        return questions
+
+    @classmethod
+    @transaction.atomic
+    def copy_questions(cls, source, target):
+        """Append all questions of source to target, keeping order, points and bank links"""
+        questions = list(source.questions.order_by('order', 'id'))
+        unlinked = [question for question in questions if question.bank_item_id is None]
+        if unlinked:
+            cls.link(unlinked, subject_id=source.subject_id_id, difficulty=source.difficulty)
+            Question.objects.bulk_update(unlinked, ['bank_item'])
+
+        order = target.questions.count() + 1
+        for position, question in enumerate(questions):
+            question.pk = None
+            question.olympiad = target
+            question.order = order + position
+        Question.objects.bulk_create(questions)
+        cls.bump_questions_version([target.id])
+        return questions
+
+    # --- GRADING ---
+
+    @classmethod
+    def answer_key(cls, olympiad):
+        """{question_id: (type, compiled answer, points)} of an olympiad, cached per questions_version"""
+        key = f"olympiad_answer_key:{olympiad.id}:{olympiad.questions_version}"
+        compiled = cache.get(key)
+        if compiled is None:
+            compiled = {}
+            for question_id, qtype, points, bank_key, correct_answer in Question.objects.filter(
+                olympiad_id=olympiad.id
+            ).values_list('id', 'type', 'points', 'bank_item__answer_key', 'correct_answer'):
+                answer = bank_key if bank_key is not None else compile_answer(qtype, correct_answer)
+                compiled[question_id] = (qtype, answer, points)
+            cache.set(key, compiled, cls.ANSWER_KEY_TTL)
+        return compiled
+
+    @staticmethod
+    def bump_questions_version(olympiad_ids):
+        """
+        Retire the cached answer keys of these olympiads in every process; in
+        the transaction that changes the questions, so a reader of the new
+        version also reads the new questions
+        """
+        Olympiad.objects.filter(pk__in=[pk for pk in olympiad_ids if pk]).update(
+            questions_version=F('questions_version') + 1
+        )
+
+    @classmethod
+    def grade(cls, olympiad, answers):
+        """(score, total_points) of {question_id: answer}; MCQ and NUMERIC questions are auto-graded"""
+        score = total = 0
+        for question_id, (qtype, answer, points) in cls.answer_key(olympiad).items():
+            total += points
+            given = answers.get(str(question_id))
+            if not given or qtype not in ('MCQ', 'NUMERIC'):
+                continue
+            if str(given).strip() == answer:
+                score += points
+        return score, total
@@ -0,0 +1,238 @@
+import os
+
+import numpy as np
+import pandas as pd
+from django.db import transaction
+
+from ..models import Question
+from .question_bank_service import QuestionBankService
+
+COLUMN_ALIASES = {'savol': 'text', 'variantlar': 'options', 'javob': 'correct_answer'}
+COLUMNS = ['text', 'type', 'options', 'correct_answer', 'points', 'time_limit', 'explanation', 'a', 'b', 'c', 'd']
+TYPES = {'MCQ', 'TEXT', 'NUMERIC', 'CODE'}
+
+
+class QuestionImportError(Exception):
+    """The upload cannot be read at all (unsupported format, broken CSV)"""
+
+
+class QuestionImportService:
+    """
+    Olympiad question import from .xlsx/.csv (streamed in chunks) and .docx.
+
+    Each chunk is validated column-wise with pandas; valid rows are linked
+    to the question bank and created with bulk_create inside one
+    transaction, invalid ones reported by sheet row number. With strict=True any invalid row rolls the whole
+    import back.
+    """
+
+    CHUNK_SIZE = 1000
+    MAX_REPORTED_ERRORS = 200
+
+    @classmethod
+    def import_file(cls, olympiad, file, strict=False):
+        """
+        Returns {'created', 'skipped', 'errors': [{'row', 'error'}], 'error_count'}.
+        Raises QuestionImportError for unreadable files.
+        """
+        ext = os.path.splitext(file.name)[1].lower()
+        if ext == '.csv':
+            chunks = cls._csv_chunks(file)
+        elif ext == '.xlsx':
+            chunks = cls._xlsx_chunks(file)
+        elif ext == '.xls':
+            # Legacy format: no streaming reader, loaded in one go
+            chunks = [(cls._prepare(pd.read_excel(file, dtype=str).fillna('')), 2)]
+        elif ext == '.docx':
+            chunks = [(cls._prepare(cls._docx_frame(file)), 1)]
+        else:
+            raise QuestionImportError('Unsupported file format. Use .xlsx, .csv or .docx')
+
+        created = 0
+        errors = []
+        with transaction.atomic():
+            order = olympiad.questions.count() + 1
+            for frame, first_row in chunks:
+                questions, chunk_errors = cls._validate(frame, first_row)
+                errors.extend(chunk_errors)
+                if strict and errors:
+                    continue
+                for question in questions:
+                    question.olympiad = olympiad
+                    question.order = order
+                    order += 1
+                QuestionBankService.link(questions, subject_id=olympiad.subject_id_id, difficulty=olympiad.difficulty)
+                Question.objects.bulk_create(questions)
+                created += len(questions)
+
+            if strict and errors:
+                transaction.set_rollback(True)
+                created = 0
+            elif created:
+                QuestionBankService.bump_questions_version([olympiad.id])
+
+        return {
+            'created': created,
+            'skipped': len(errors),
+            'errors': errors[:cls.MAX_REPORTED_ERRORS],
+            'error_count': len(errors),
+        }
+
+    # --- READING ---
+
+    @classmethod
+    def _csv_chunks(cls, file):
+        reader = pd.read_csv(
+            file, encoding='utf-8-sig', dtype=str, keep_default_na=False, chunksize=cls.CHUNK_SIZE,
+            skipinitialspace=True
+        )
+        first_row = 2
+        try:
+            for frame in reader:
+                yield cls._prepare(frame), first_row
+                first_row += len(frame)
+        except pd.errors.ParserError as e:
+            raise QuestionImportError(f"CSV error: {e}")
+
+    @classmethod
+    def _xlsx_chunks(cls, file):
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(file, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            header = [str(cell) if cell is not None else f'_{i}' for i, cell in enumerate(header)]
+            batch = []
+            first_row = 2
+            for values in rows:
+                batch.append(values[:len(header)])
+                if len(batch) == cls.CHUNK_SIZE:
+                    yield cls._prepare(pd.DataFrame(batch, columns=header)), first_row
+                    first_row += len(batch)
+                    batch = []
+            if batch:
+                yield cls._prepare(pd.DataFrame(batch, columns=header)), first_row
+        finally:
+            workbook.close()
+
+    @staticmethod
+    def _docx_frame(file):
+        """Numbered questions, A)-E) options and 'Javob:/Answer:' lines of a Word file"""
+        from docx import Document
+
+        records = []
+        current = None
+        for para in Document(file).paragraphs:
+            line = para.text.strip()
+            if not line:
+                continue
+
+            # New question: digits followed by '.' or ')'
+            digits = len(line) - len(line.lstrip('0123456789'))
+            if len(line) > 2 and 0 < digits < len(line) and line[digits] in '.)':
+                current = {'text': line[digits + 1:].strip(), 'type': 'MCQ', 'options': [], 'correct_answer': ''}
+                records.append(current)
+            elif current:
+                first_word = line.split(' ')[0].replace('.', '').replace(')', '').upper()
+                if len(first_word) == 1 and first_word in 'ABCDE':
+                    option = line[len(first_word) + 1:].strip().replace(')', '', 1).replace('.', '', 1)
+                    current['options'].append(option.strip())
+                elif line.lower().startswith(('javob:', 'answer:')):
+                    current['correct_answer'] = line.split(':', 1)[1].strip()
+
+        for record in records:
+            record['options'] = '|'.join(record['options'])
+        return pd.DataFrame(records, columns=['text', 'type', 'options', 'correct_answer'])
+
+    @staticmethod
+    def _prepare(frame):
+        """Lower-case headers, Uzbek aliases, every known column present as stripped strings"""
+        frame = frame.reset_index(drop=True).rename(columns=lambda column: str(column).lower().strip())
+        for alias, column in COLUMN_ALIASES.items():
+            if alias in frame.columns:
+                if column in frame.columns:
+                    frame[column] = frame[column].where(frame[column].astype(str).str.strip() != '', frame[alias])
+                else:
+                    frame = frame.rename(columns={alias: column})
+        frame = frame.reindex(columns=COLUMNS)
+        # Excel cells arrive as numbers/None: 2.0 -> '2'
+        frame = frame.map(lambda value: '' if value is None or (isinstance(value, float) and np.isnan(value))
+                          else str(int(value)) if isinstance(value, float) and value.is_integer() else str(value))
+        return frame.apply(lambda column: column.str.strip())
+
+    # --- VALIDATION ---
+
+    @classmethod
+    def _validate(cls, frame, first_row):
+        """Returns ([unsaved Question], [{'row', 'error'}]) for one chunk"""
+        frame = frame[(frame != '').any(axis=1)]  # blank lines are not errors
+        if frame.empty:
+            return [], []
+        rows = frame.index.to_series() + first_row
+
+        qtype = frame['type'].str.upper().replace('', 'MCQ')
+
+        # Options: '|' separated if any '|', else comma separated; A-D columns as fallback
+        separator = np.where(frame['options'].str.contains('|', regex=False), '|', ',')
+        options = [
+            [option.strip() for option in raw.split(sep) if option.strip()]
+            for raw, sep in zip(frame['options'], separator)
+        ]
+        columns = frame[['a', 'b', 'c', 'd']].values.tolist()
+        options = pd.Series([
+            opts if len(opts) >= 2 or kind != 'MCQ' or not any(cols) else [col for col in cols if col]
+            for opts, cols, kind in zip(options, columns, qtype)
+        ], index=frame.index)
+        option_count = options.str.len()
+
+        # MCQ answers: letter, option text (any case) or index
+        answer = frame['correct_answer']
+        is_mcq = qtype == 'MCQ'
+        letter = answer.str.upper().str.fullmatch('[A-E]')
+        index = pd.Series(np.nan, index=frame.index)
+        index[letter] = answer[letter].str.upper().map(lambda char: ord(char) - ord('A'))
+        by_text = is_mcq & ~letter
+        index[by_text] = [
+            next((i for i, option in enumerate(opts) if option.lower() == value.lower()), np.nan)
+            for opts, value in zip(options[by_text], answer[by_text])
+        ]
+        digit = by_text & index.isna() & answer.str.fullmatch(r'\d+')
+        index[digit] = pd.to_numeric(answer[digit])
+        resolved = answer.where(~is_mcq, index.astype('Int64').astype(str))
+
+        points = pd.to_numeric(frame['points'].replace('', '1'), errors='coerce')
+        time_limit = pd.to_numeric(frame['time_limit'].replace('', '0'), errors='coerce')
+
+        checks = [
+            (frame['text'] == '', "text is required"),
+            (~qtype.isin(TYPES), "type must be one of MCQ, TEXT, NUMERIC, CODE"),
+            (is_mcq & (option_count < 2), "MCQ needs at least 2 options"),
+            (answer == '', "correct_answer is required"),
+            (is_mcq & (answer != '') & (option_count >= 2) & ~(index < option_count),
+             "correct_answer does not match an option"),
+            ((qtype == 'NUMERIC') & (answer != '') & pd.to_numeric(answer, errors='coerce').isna(),
+             "correct_answer must be a number"),
+            (points.isna() | (points <= 0) | (points % 1 != 0), "points must be a positive whole number"),
+            (time_limit.isna() | (time_limit < 0) | (time_limit % 1 != 0), "time_limit must be a whole number of seconds"),
+        ]
+        messages = pd.Series('', index=frame.index)
+        for failed, message in checks:
+            messages[failed] = messages[failed] + '; ' + message
+        invalid = messages != ''
+
+        errors = [{'row': int(row), 'error': message[2:]} for row, message in zip(rows[invalid], messages[invalid])]
+        valid = ~invalid
+        questions = [
+            Question(
+                text=text, type=kind, options=opts, correct_answer=correct, points=int(point),
+                time_limit=int(limit), explanation=explanation
+            )
+            for text, kind, opts, correct, point, limit, explanation in zip(
+                frame['text'][valid], qtype[valid], options[valid], resolved[valid],
+                points[valid], time_limit[valid], frame['explanation'][valid]
+            )
+        ]
+        return questions, errors
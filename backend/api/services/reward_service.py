@@ -13,6 +13,7 @@ from ..models import (
     PrizeAddress
 )
 from ..bot_service import BotService
+from .ledger_service import LedgerService
 
 logger = logging.getLogger(__name__)
 
@@ -117,8 +118,11 @@ class RewardService:
     def _award_coin(user, amount, olympiad):
         """Add balance and record transaction"""
         amount = Decimal(str(amount))
-        user.balance += amount
-        user.save()
+        LedgerService.transfer(
+            LedgerService.PLATFORM, LedgerService.user(user.id), amount,
+            'OLYMPIAD_REWARD', reference=f"olympiad:{olympiad.id}"
+        )
+        user.refresh_from_db(fields=['balance'])
 
         Transaction.objects.create(
             user=user,
@@ -1,10 +1,12 @@
 from django.conf import settings
 from django.utils import timezone
 from django.db import transaction
+from django.db.models import F, Sum, Case, When, DecimalField
 from datetime import timedelta
 from decimal import Decimal
 
 from ..models import TeacherWallet, Transaction, Payout, Course, User
+from .ledger_service import LedgerService
 
 
 class WalletService:
@@ -38,12 +40,12 @@ class WalletService:
         Add amount to teacher's pending balance after course sale
         Funds will be locked for PENDING_BALANCE_DAYS before becoming available
         """
-        wallet = WalletService.get_or_create_wallet(teacher)
-        
         amount = Decimal(str(amount))
-        wallet.pending_balance += amount
-        wallet.total_earned += amount
-        wallet.save()
+        LedgerService.transfer(
+            LedgerService.PLATFORM, LedgerService.teacher_pending(teacher.id), amount,
+            'COURSE_SALE', reference=f"course:{course.id}", description=description
+        )
+        TeacherWallet.objects.filter(teacher=teacher).update(total_earned=F('total_earned') + amount)
         
         # Create transaction record
         trans = Transaction.objects.create(
@@ -64,30 +66,47 @@ class WalletService:
         Cron job: Move pending balance to available balance
         after PENDING_BALANCE_DAYS have passed
         
+        Only sales not yet released are touched, so runtime depends on new
+        sales rather than total history. Wallets get one ledger transfer each.
+        
         Returns: Number of wallets updated
         """
         pending_days = getattr(settings, 'PENDING_BALANCE_DAYS', 7)
         cutoff_date = timezone.now() - timedelta(days=pending_days)
+        released_at = timezone.now()
         
-        # Find transactions that are old enough
-        old_transactions = Transaction.objects.filter(
+        # Claim unreleased sales that are old enough in one UPDATE, so each sale
+        # is released exactly once even if two cron runs overlap
+        claimed = Transaction.objects.filter(
             transaction_type='COURSE_SALE',
             status='SUCCESS',
+            released_at__isnull=True,
             created_at__lte=cutoff_date
-        ).select_related('user', 'user__teacher_wallet')
+        ).update(released_at=released_at)
         
-        updated_count = 0
+        if not claimed:
+            return 0
+        
+        # Teacher share per wallet (teacher_earnings when the sale recorded the split,
+        # otherwise amount is already the teacher share)
+        releasable = Transaction.objects.filter(
+            transaction_type='COURSE_SALE',
+            released_at=released_at
+        ).values('user_id').annotate(
+            total=Sum(Case(
+                When(teacher_earnings__gt=0, then=F('teacher_earnings')),
+                default=F('amount'),
+                output_field=DecimalField(max_digits=12, decimal_places=2)
+            ))
+        )
         
-        for trans in old_transactions:
-            if hasattr(trans.user, 'teacher_wallet'):
-                wallet = trans.user.teacher_wallet
-                
-                # Move from pending to available
-                if wallet.pending_balance >= trans.amount:
-                    wallet.pending_balance -= trans.amount
-                    wallet.balance += trans.amount
-                    wallet.save()
-                    updated_count += 1
+        updated_count = 0
+        for row in releasable:
+            LedgerService.transfer(
+                LedgerService.teacher_pending(row['user_id']), LedgerService.teacher_available(row['user_id']),
+                row['total'], 'RELEASE', reference=released_at.isoformat(), description="Pending balance released"
+            )
+            updated_count += 1
         
         return updated_count
     
@@ -95,24 +114,14 @@ class WalletService:
     @transaction.atomic
     def process_payout(payout_id, admin):
         """
-        Process payout request - deduct from teacher balance
-        and mark payout as approved
+        Approve a payout request. The amount already left the teacher's
+        available balance when the payout was requested (PayoutViewSet.perform_create)
         """
         payout = Payout.objects.select_for_update().get(id=payout_id)
         
         if payout.status != 'REQUESTED':
             raise ValueError(f"Payout is already {payout.status}")
         
-        wallet = WalletService.get_or_create_wallet(payout.teacher)
-        
-        if wallet.balance < payout.amount:
-            raise ValueError("Insufficient balance")
-        
-        # Deduct from balance
-        wallet.balance -= payout.amount
-        wallet.total_withdrawn += payout.amount
-        wallet.save()
-        
         # Update payout status
         payout.status = 'APPROVED'
         payout.approved_by = admin
@@ -131,12 +140,17 @@ class WalletService:
         return payout
     
     @staticmethod
+    @transaction.atomic
     def mark_payout_paid(payout_id):
         """Mark payout as paid (after manual bank transfer)"""
-        payout = Payout.objects.get(id=payout_id)
+        payout = Payout.objects.select_for_update().get(id=payout_id)
         payout.status = 'PAID'
         payout.paid_at = timezone.now()
         payout.save()
+        # F() update: the balance columns are maintained by LedgerService
+        TeacherWallet.objects.filter(teacher_id=payout.teacher_id).update(
+            total_withdrawn=F('total_withdrawn') + payout.amount
+        )
         return payout
     
     @staticmethod
@@ -147,12 +161,12 @@ class WalletService:
         with transaction.atomic():
             payout = Payout.objects.select_for_update().get(id=payout_id)
             
-            if payout.status == 'APPROVED':
-                # Return money to wallet if already deducted
-                wallet = payout.teacher.teacher_wallet
-                wallet.balance += payout.amount
-                wallet.total_withdrawn -= payout.amount
-                wallet.save()
+            if payout.status in ('REQUESTED', 'APPROVED'):
+                # Return the amount reserved when the payout was requested
+                LedgerService.transfer(
+                    LedgerService.EXTERNAL, LedgerService.teacher_available(payout.teacher_id), payout.amount,
+                    'PAYOUT_REVERSAL', reference=f"payout:{payout.id}"
+                )
             
             payout.status = 'REJECTED'
             payout.rejection_reason = reason
@@ -3,36 +3,39 @@ Certificate Signals - Auto-generate certificates
 Triggers when course is completed or olympiad ends
 """
 from django.db.models.signals import post_save, pre_save, post_delete
+from django.db import transaction
 from django.dispatch import receiver
 from django.utils import timezone
 
 from .models import Certificate, Enrollment, TestResult
-from .certificate_generator import generate_certificate_pdf, generate_qr_code
+from .services.certificate_render_service import CertificateRenderService
+from .services.certificate_storage_service import CertificateStorageService
+from .services.certificate_verification_service import CertificateVerificationService
 
 
 @receiver(post_save, sender=Certificate)
 def generate_certificate_files(sender, instance, created, **kwargs):
     """
-    Generate PDF and QR code when certificate is verified
+    Schedule PDF and QR code rendering when certificate is verified
     """
-    # Only generate when status changes to VERIFIED and files don't exist
+    # Batch issuance renders through a CertificateRenderJob instead
+    if CertificateRenderService.rendering_deferred():
+        return
+    
+    # Only render when status changes to VERIFIED and files don't exist;
+    # rendering runs in the background after commit (download also renders lazily)
     if instance.status == 'VERIFIED' and not instance.pdf_file:
-        try:
-            # Generate PDF
-            pdf_file = generate_certificate_pdf(instance)
-            instance.pdf_file.save(pdf_file.name, pdf_file, save=False)
-            
-            # Generate QR Code
-            qr_file = generate_qr_code(instance)
-            instance.qr_code.save(qr_file.name, qr_file, save=False)
-            
-            # Save without triggering signal again
-            Certificate.objects.filter(pk=instance.pk).update(
-                pdf_file=instance.pdf_file,
-                qr_code=instance.qr_code
-            )
-        except Exception as e:
-            print(f"Error generating certificate files: {e}")
+        CertificateStorageService.schedule_render(instance)
+
+
+@receiver(post_save, sender=Certificate)
+@receiver(post_delete, sender=Certificate)
+def invalidate_certificate_verification(sender, instance, **kwargs):
+    """
+    Drop the cached public verification payload (after commit, so it is not re-cached from the old row)
+    """
+    cert_number = instance.cert_number
+    transaction.on_commit(lambda: CertificateVerificationService.invalidate(cert_number))
 
 
 def create_course_certificate(enrollment):
@@ -48,14 +51,15 @@ def create_course_certificate(enrollment):
         return None
     
     # Calculate final grade
-    from .models import LessonProgress, QuizAttempt
+    from .models import LessonProgress
     from django.db.models import Avg
     
-    # Average quiz score
-    avg_score = QuizAttempt.objects.filter(
+    # Average lesson test score (same grade as the CourseCompleted certificate handler)
+    avg_score = LessonProgress.objects.filter(
         user=enrollment.user,
-        quiz__lesson__module__course=enrollment.course
-    ).aggregate(avg=Avg('score'))['avg'] or 0
+        lesson__course=enrollment.course,
+        test_score__isnull=False
+    ).aggregate(avg=Avg('test_score'))['avg'] or 0
     
     grade = f"{int(avg_score)}%"
     
@@ -77,66 +81,107 @@ def create_olympiad_certificates(olympiad):
     Create certificates for olympiad participants when olympiad ends
     Called when olympiad status changes to COMPLETED
     """
+    with transaction.atomic():
+        certificates_created = _issue_olympiad_certificates(olympiad)
+    
+    # bulk_create skips post_save, files are rendered by the batch pipeline after commit
+    certificate_ids = [certificate.id for certificate in certificates_created]
+    transaction.on_commit(lambda: CertificateRenderService.enqueue(certificate_ids))
+    
+    return certificates_created
+
+
+def _generate_cert_numbers(count):
+    """`count` unique cert numbers not used by any certificate yet (one query per round)"""
+    from .services.certificate_service import CertificateService
+    
+    numbers = set()
+    while len(numbers) < count:
+        candidates = set()
+        while len(candidates) < count - len(numbers):
+            number = CertificateService.generate_cert_number()
+            if number not in numbers:
+                candidates.add(number)
+        
+        candidates = list(candidates)
+        taken = set()
+        for i in range(0, len(candidates), 5000):
+            taken.update(
+                Certificate.objects.filter(cert_number__in=candidates[i:i + 5000]).values_list('cert_number', flat=True)
+            )
+        numbers.update(number for number in candidates if number not in taken)
+    return list(numbers)
+
+
+def _issue_olympiad_certificates(olympiad):
     from .models import TestResult, OlympiadRegistration
     
-    # Get all participants with results
-    results = TestResult.objects.filter(olympiad=olympiad, status='COMPLETED')
+    # Participants who already have a certificate for this olympiad (one query)
+    issued_user_ids = set(
+        Certificate.objects.filter(olympiad=olympiad).values_list('user_id', flat=True)
+    )
     
-    certificates_created = []
+    results = TestResult.objects.filter(olympiad=olympiad, status='COMPLETED')
     
-    for result in results:
-        # Skip if certificate already exists
-        if Certificate.objects.filter(
-            user=result.user,
-            olympiad=olympiad
-        ).exists():
+    new_certificates = []
+    for user_id, percentage, score in results.values_list('user_id', 'percentage', 'score').iterator(chunk_size=5000):
+        if user_id in issued_user_ids:
             continue
+        issued_user_ids.add(user_id)
         
         # Determine certificate type (simplified logic since rank is not in model)
-        cert_type = 'OLYMPIAD'
-        if result.percentage >= 90:
-            cert_type = 'DIPLOMA'
+        cert_type = 'DIPLOMA' if percentage >= 90 else 'OLYMPIAD'
         
-        # Create grade text
-        grade = f"{result.percentage}%"
-        
-        # Create certificate
-        certificate = Certificate.objects.create(
-            user=result.user,
+        new_certificates.append(Certificate(
+            user_id=user_id,
             olympiad=olympiad,
             cert_type=cert_type,
-            grade=grade,
-            score=result.score,
+            grade=f"{percentage}%",
+            score=score,
             status='VERIFIED'  # Auto-verify for olympiad completion
-        )
-        
-        certificates_created.append(certificate)
+        ))
     
     # Also create participation certificates for those registered but without results
-    registrations = OlympiadRegistration.objects.filter(
+    registered_user_ids = OlympiadRegistration.objects.filter(
         olympiad=olympiad
     ).exclude(
-        user__in=[r.user for r in results]
-    )
+        user_id__in=results.values('user_id')
+    ).values_list('user_id', flat=True)
     
-    for reg in registrations:
-        if Certificate.objects.filter(
-            user=reg.user,
-            olympiad=olympiad
-        ).exists():
+    for user_id in registered_user_ids.iterator(chunk_size=5000):
+        if user_id in issued_user_ids:
             continue
+        issued_user_ids.add(user_id)
         
-        certificate = Certificate.objects.create(
-            user=reg.user,
+        new_certificates.append(Certificate(
+            user_id=user_id,
             olympiad=olympiad,
             cert_type='OLYMPIAD',
             grade='Ishtirok etdi',
             score=0,
             status='VERIFIED'
+        ))
+    
+    # bulk_create bypasses Certificate.save, so numbers are assigned up front
+    for certificate, cert_number in zip(new_certificates, _generate_cert_numbers(len(new_certificates))):
+        certificate.cert_number = cert_number
+    
+    certificates = Certificate.objects.bulk_create(new_certificates, batch_size=1000)
+    
+    # Same "certificate ready" notification Certificate.save sends on verification
+    from .models import Notification
+    Notification.objects.bulk_create([
+        Notification(
+            user_id=certificate.user_id,
+            title="Sertifikat tayyor!",
+            message=f"Tabriklaymiz! Sizning '{olympiad.title}' bo'yicha sertifikatingiz tasdiqlandi.",
+            notification_type='ACHIEVEMENT',
+            link="/profile"
         )
-        certificates_created.append(certificate)
+        for certificate in certificates
+    ], batch_size=1000)
     
-    return certificates_created
+    return certificates
 
 
 # ==================== ENROLLMENT COMPLETION TRACKING ====================
@@ -167,16 +212,13 @@ def olympiad_status_change(sender, instance, **kwargs):
         try:
             old_instance = sender.objects.get(pk=instance.pk)
             if old_instance.status != 'COMPLETED' and instance.status == 'COMPLETED':
-                # Olympiad just finished
-                # We use a bit of delay or call it directly
-                # For safety in pre_save, we might want to use a transaction.on_commit
-                # but for simplicity we call it here (assuming save succeeds)
-                create_olympiad_certificates(instance)
+                # Olympiad just finished: issue once the save has committed
+                transaction.on_commit(lambda: create_olympiad_certificates(instance))
         except sender.DoesNotExist:
             pass
     elif instance.status == 'COMPLETED':
-        # Rare case of creating as completed
-        create_olympiad_certificates(instance)
+        # Rare case of creating as completed (pk is only set after the save)
+        transaction.on_commit(lambda: create_olympiad_certificates(instance))
 
 
 @receiver(post_save, sender='api.Lesson')
@@ -188,6 +230,8 @@ def update_course_stats(sender, instance, **kwargs):
     course = instance.course
     # Count lessons
     course.lessons_count = course.lessons.all().count()
+    # Denominator of enrollment progress (LearningService.update_enrollment_stats)
+    course.published_lessons_count = course.lessons.filter(is_published=True).count()
     
     # Calculate duration
     from django.db.models import Sum
@@ -203,7 +247,42 @@ def update_course_stats(sender, instance, **kwargs):
     else:
         course.duration = "0 daqiqa"
     
-    course.save(update_fields=['lessons_count', 'duration'])
+    course.save(update_fields=['lessons_count', 'published_lessons_count', 'duration'])
+
+    if instance.module_id:
+        from .models import Lesson, Module
+        Module.objects.filter(pk=instance.module_id).update(
+            published_lessons_count=Lesson.objects.filter(module_id=instance.module_id, is_published=True).count()
+        )
+
+
+@receiver(post_save, sender='api.Lesson')
+@receiver(post_delete, sender='api.Lesson')
+@receiver(post_save, sender='api.Module')
+@receiver(post_delete, sender='api.Module')
+def bump_course_structure_version(sender, instance, **kwargs):
+    """
+    Invalidate the cached course structure and the learning-state snapshots
+    built from it (LearningService.get_course_structure)
+    """
+    from django.db.models import F
+    from .models import Course
+    Course.objects.filter(pk=instance.course_id).update(structure_version=F('structure_version') + 1)
+
+
+@receiver(post_save, sender='api.ProfessionLevel')
+@receiver(post_delete, sender='api.ProfessionLevel')
+@receiver(post_save, sender='api.ProfessionNode')
+@receiver(post_delete, sender='api.ProfessionNode')
+def bump_profession_graph_version(sender, instance, **kwargs):
+    """Invalidate the compiled career graph (CareerEngineService.get_graph)"""
+    from django.db.models import F
+    from .models import Profession, ProfessionLevel
+    if sender is ProfessionLevel:
+        professions = Profession.objects.filter(pk=instance.profession_id)
+    else:
+        professions = Profession.objects.filter(levels=instance.level_id)
+    professions.update(graph_version=F('graph_version') + 1)
 
 
 @receiver(post_save, sender='api.Enrollment')
@@ -215,3 +294,52 @@ def update_course_students_count(sender, instance, **kwargs):
     course = instance.course
     course.students_count = course.enrollments.count()
     course.save(update_fields=['students_count'])
+
+
+@receiver(post_save, sender='api.AIAssistantFAQ')
+@receiver(post_delete, sender='api.AIAssistantFAQ')
+def invalidate_faq_index(sender, instance, **kwargs):
+    """Rebuild the FAQ search index (FAQIndex) once the change is committed"""
+    from .services.faq_index import FAQIndex
+    transaction.on_commit(FAQIndex.invalidate)
+
+
+@receiver(pre_save, sender='api.Question')
+def link_question_to_bank(sender, instance, raw=False, **kwargs):
+    """Point the question at the bank item with its (possibly edited) content"""
+    if raw:
+        return
+    from .services.question_bank_service import QuestionBankService
+    olympiad = instance.olympiad
+    QuestionBankService.link(
+        [instance],
+        subject_id=olympiad.subject_id_id if olympiad else None,
+        difficulty=olympiad.difficulty if olympiad else 'MEDIUM',
+    )
+
+
+@receiver(post_save, sender='api.Question')
+@receiver(post_delete, sender='api.Question')
+def bump_olympiad_questions_version(sender, instance, **kwargs):
+    """Invalidate the cached answer key of the olympiad (QuestionBankService.answer_key)"""
+    from .services.question_bank_service import QuestionBankService
+    QuestionBankService.bump_questions_version([instance.olympiad_id])
+
+
+@receiver(post_save, sender='api.Payment')
+@receiver(post_delete, sender='api.Payment')
+def mark_payment_day_dirty(sender, instance, **kwargs):
+    """Refunds and status changes of earlier payments (AnalyticsService daily facts)"""
+    from .services.analytics_service import AnalyticsService
+    AnalyticsService.mark_dirty(instance.created_at, instance.completed_at)
+
+
+@receiver(post_delete, sender='api.Enrollment')
+@receiver(post_delete, sender='api.OlympiadRegistration')
+@receiver(post_delete, sender='api.User')
+def mark_deleted_record_day_dirty(sender, instance, **kwargs):
+    from .services.analytics_service import AnalyticsService
+    AnalyticsService.mark_dirty(
+        getattr(instance, 'created_at', None), getattr(instance, 'registered_at', None),
+        getattr(instance, 'date_joined', None)
+    )
@@ -1,6 +1,8 @@
 from django.test import TestCase
 from django.utils import timezone
-from api.models import User, Olympiad, TestResult
+from api.models import User, Olympiad, TestResult, Payment
+from api.services.payment_service import PaymentService
+from api.services.export_service import ExportService
 from rest_framework.test import APIClient
 import datetime
 
@@ -50,3 +52,1222 @@ class OlympiadVisibilityTest(TestCase):
         response = self.client.get(f'/api/olympiads/{self.olympiad.id}/leaderboard/')
         self.assertEqual(response.status_code, 200)
         self.assertGreater(len(response.data['leaderboard']), 0)
+
+
+class PaymentServiceTest(TestCase):
+    def setUp(self):
+        from decimal import Decimal
+        self.user = User.objects.create_user(username='payer', password='testpassword', role='STUDENT')
+        self.payment = Payment.objects.create(
+            user=self.user,
+            amount=Decimal('50000'),
+            original_amount=Decimal('50000'),
+            final_amount=Decimal('50000'),
+            type='TOPUP',
+            method='USERBOT',
+            status='PENDING'
+        )
+
+    def test_confirm_is_idempotent(self):
+        """Confirming the same payment twice credits the balance only once"""
+        _, first = PaymentService.confirm_payment(self.payment.id)
+        _, second = PaymentService.confirm_payment(self.payment.id)
+        self.user.refresh_from_db()
+        self.assertTrue(first)
+        self.assertFalse(second)
+        self.assertEqual(self.user.balance, 50000)
+
+    def test_replayed_bank_messages_confirm_once(self):
+        """A replayed backlog with duplicate message ids confirms each payment once"""
+        confirmed = PaymentService.confirm_by_amounts([
+            (50000, 'tg:1:100'),
+            (50000, 'tg:1:100'),
+        ])
+        self.assertEqual(len(confirmed), 1)
+        self.payment.refresh_from_db()
+        self.user.refresh_from_db()
+        self.assertEqual(self.payment.status, 'COMPLETED')
+        self.assertEqual(self.payment.external_id, 'tg:1:100')
+        self.assertEqual(self.user.balance, 50000)
+
+
+class PaymentMonitorTest(TestCase):
+    def test_amount_parser(self):
+        from api.services.payment_monitor_service import parse_amount
+
+        self.assertEqual(parse_amount("Kirim\n➕ 150 000.00 so'm\n💰 2 350 000.00 so'm"), 150000)
+        self.assertEqual(parse_amount("Postuplenie: 75,000 UZS"), 75000)
+        self.assertEqual(parse_amount("Received 12000 sum"), 12000)
+        self.assertEqual(parse_amount("Kirim 1\u00a0500,50 so‘m"), 1500)
+        self.assertIsNone(parse_amount("Oplata 40 000.00 so'm"))
+
+    def test_replayed_fixture_confirms_each_payment_once(self):
+        import os
+        from decimal import Decimal
+        from asgiref.sync import async_to_sync
+        from api.services.payment_monitor_service import PaymentMonitor
+
+        user = User.objects.create_user(username='payer', password='testpassword')
+        for amount in (150000, 75000, 12000):
+            Payment.objects.create(user=user, amount=amount, original_amount=amount, final_amount=amount,
+                                   type='TOPUP', method='USERBOT', status='PENDING')
+
+        fixture = os.path.join(os.path.dirname(__file__), 'fixtures', 'payment_monitor_messages.json')
+        messages = PaymentMonitor.load_fixture(fixture)
+        confirmed = async_to_sync(PaymentMonitor(flush_interval=0.05).replay)(messages)
+
+        self.assertEqual(sorted(payment.final_amount for payment in confirmed), [12000, 75000, 150000])
+        user.refresh_from_db()
+        self.assertEqual(user.balance, Decimal('237000'))
+
+        # Replaying the same backlog again is a no-op
+        self.assertEqual(async_to_sync(PaymentMonitor(flush_interval=0.05).replay)(messages), [])
+
+    def test_accounts_require_telegram_credentials(self):
+        from unittest import mock
+        from django.core.exceptions import ImproperlyConfigured
+        from api.models_settings import PaymentProviderConfig
+        from api.services import payment_monitor_service
+        from api.services.payment_monitor_service import PaymentMonitor
+
+        config = PaymentProviderConfig.objects.create(
+            name='Userbot', type='BOT', provider='USERBOT', is_active=True, config={'target_username': '@bank_bot'}
+        )
+        with mock.patch.object(payment_monitor_service, 'DEFAULT_API_ID', None), \
+                mock.patch.object(payment_monitor_service, 'DEFAULT_API_HASH', None):
+            with self.assertRaises(ImproperlyConfigured):
+                PaymentMonitor.load_accounts()
+
+            config.config.update(api_id='123', api_hash='abc')
+            config.save()
+            self.assertEqual(PaymentMonitor.load_accounts()[0][1:3], ('123', 'abc'))
+
+
+class ExportServiceTest(TestCase):
+    def test_csv_export_streams_rows(self):
+        user = User.objects.create_user(username='exporter', password='testpassword')
+        for i in range(3):
+            Payment.objects.create(user=user, amount=1000 + i, type='TOPUP', method='PAYME', status='COMPLETED')
+
+        response = ExportService.export(Payment.objects.all(), ExportService.PAYMENT_COLUMNS, 'payments')
+        lines = b''.join(response.streaming_content).decode().strip().splitlines()
+        self.assertEqual(lines[0].split(',')[:2], ['ID', 'User'])
+        self.assertEqual(len(lines), 4)
+        self.assertIn('exporter', lines[1])
+
+    def test_xlsx_export(self):
+        response = ExportService.export(Payment.objects.none(), ExportService.PAYMENT_COLUMNS, 'payments', 'xlsx')
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'PK'))
+
+
+class ReleasePendingBalanceTest(TestCase):
+    def test_sales_are_released_once(self):
+        from api.models import TeacherWallet, Transaction
+        from api.services.wallet_service import WalletService
+
+        teacher = User.objects.create_user(username='seller', password='testpassword', role='TEACHER')
+        TeacherWallet.objects.create(teacher=teacher, pending_balance=900)
+        old_sale = Transaction.objects.create(
+            transaction_type='COURSE_SALE', user=teacher, amount=1000,
+            teacher_earnings=700, status='SUCCESS'
+        )
+        Transaction.objects.filter(pk=old_sale.pk).update(created_at=timezone.now() - datetime.timedelta(days=30))
+        Transaction.objects.create(transaction_type='COURSE_SALE', user=teacher, amount=200, status='SUCCESS')
+
+        self.assertEqual(WalletService.release_pending_balance(), 1)
+        self.assertEqual(WalletService.release_pending_balance(), 0)
+
+        wallet = TeacherWallet.objects.get(teacher=teacher)
+        self.assertEqual(wallet.balance, 700)
+        self.assertEqual(wallet.pending_balance, 200)
+
+
+class LedgerServiceTest(TestCase):
+    def test_transfers_materialize_and_reconcile(self):
+        from api.services.ledger_service import LedgerService, InsufficientFunds
+
+        user = User.objects.create_user(username='ledger', password='testpassword', balance=300)
+        self.assertEqual(LedgerService.post_opening_balances(), 1)
+
+        LedgerService.transfer(LedgerService.EXTERNAL, LedgerService.user(user.id), 200, 'TOPUP')
+        LedgerService.create_checkpoint()
+        LedgerService.transfer(LedgerService.user(user.id), LedgerService.PLATFORM, 100, 'PURCHASE', require_funds=True)
+        with self.assertRaises(InsufficientFunds):
+            LedgerService.transfer(LedgerService.user(user.id), LedgerService.PLATFORM, 1000, 'PURCHASE', require_funds=True)
+
+        user.refresh_from_db()
+        self.assertEqual(user.balance, 400)
+        self.assertEqual(LedgerService.get_balance(LedgerService.user(user.id)), 400)
+        self.assertEqual(LedgerService.reconcile(), [])
+
+        # A second checkpoint builds on the first one
+        checkpoint = LedgerService.create_checkpoint()
+        self.assertEqual(checkpoint.snapshots.get(owner=user).balance, 400)
+        self.assertEqual(LedgerService.get_balance(LedgerService.user(user.id)), 400)
+
+        User.objects.filter(pk=user.pk).update(balance=999)
+        self.assertEqual(len(LedgerService.reconcile()), 1)
+
+
+class PayoutLedgerTest(TestCase):
+    def test_payout_is_deducted_once_and_paid_without_overwriting_balances(self):
+        from api.models import Payout, TeacherWallet
+        from api.services.ledger_service import LedgerService
+        from api.services.wallet_service import WalletService
+
+        teacher = User.objects.create_user(username='payee', password='testpassword', role='TEACHER')
+        admin = User.objects.create_user(username='admin', password='testpassword', role='ADMIN')
+        LedgerService.transfer(LedgerService.EXTERNAL, LedgerService.teacher_available(teacher.id), 300000, 'SALE')
+
+        client = APIClient()
+        client.force_authenticate(teacher)
+        response = client.post('/api/payouts/', {
+            'teacher': teacher.id, 'amount': '100000', 'payment_method': 'CARD', 'payment_details': {'card': '8600'}
+        }, format='json', secure=True)
+        self.assertEqual(response.status_code, 201, response.data)
+        payout = Payout.objects.get()
+
+        WalletService.process_payout(payout.id, admin)
+        # A sale lands while the admin still holds the old wallet in memory
+        LedgerService.transfer(LedgerService.EXTERNAL, LedgerService.teacher_available(teacher.id), 50000, 'SALE')
+        client.force_authenticate(admin)
+        response = client.post(f'/api/payouts/{payout.id}/mark_paid/', secure=True)
+        self.assertEqual(response.status_code, 200)
+
+        wallet = TeacherWallet.objects.get(teacher=teacher)
+        self.assertEqual((wallet.balance, wallet.total_withdrawn), (250000, 100000))
+        self.assertEqual(LedgerService.reconcile(), [])
+
+
+class AnalyticsServiceTest(TestCase):
+    def test_backfill_builds_daily_facts(self):
+        from api.models import Course, DailyRevenue, DailyUserStats
+        from api.services.analytics_service import AnalyticsService
+
+        user = User.objects.create_user(username='buyer', password='testpassword')
+        course = Course.objects.create(title='Algebra', price=1000)
+        for _ in range(2):
+            Payment.objects.create(
+                user=user, amount=1000, type='COURSE', reference_id=str(course.id),
+                status='COMPLETED', completed_at=timezone.now()
+            )
+        Payment.objects.create(user=user, amount=500, type='TOPUP', status='PENDING')
+
+        AnalyticsService.backfill()
+
+        fact = DailyRevenue.objects.get()
+        self.assertEqual((fact.revenue, fact.payments_count, fact.product_name), (2000, 2, 'Algebra'))
+        self.assertEqual(DailyUserStats.objects.get().new_users, 1)
+        self.assertEqual(AnalyticsService.revenue_totals(total=(None, 'COURSE'))['total'], 2000)
+
+        # Today was just rebuilt: reads share that rebuild until it is stale or forced
+        Payment.objects.create(
+            user=user, amount=1000, type='COURSE', reference_id=str(course.id),
+            status='COMPLETED', completed_at=timezone.now()
+        )
+        self.assertEqual(AnalyticsService.revenue_totals(total=(None, 'COURSE'))['total'], 2000)
+        AnalyticsService.refresh_today(force=True)
+        self.assertEqual(AnalyticsService.revenue_totals(total=(None, 'COURSE'))['total'], 3000)
+
+    def test_changes_to_earlier_days_are_rebuilt(self):
+        from api.models import AnalyticsDirtyDay, DailyRevenue
+        from api.services.analytics_service import AnalyticsService
+
+        user = User.objects.create_user(username='buyer', password='testpassword')
+        paid_at = timezone.now() - datetime.timedelta(days=10)
+        payment = Payment.objects.create(user=user, amount=700, type='TOPUP', status='COMPLETED', completed_at=paid_at)
+        AnalyticsService.backfill(start_date=timezone.localdate(paid_at))
+        AnalyticsDirtyDay.objects.all().delete()
+        self.assertEqual(DailyRevenue.objects.get(date=timezone.localdate(paid_at)).revenue, 700)
+
+        # Refunded long after the day was built
+        payment.status = 'REFUNDED'
+        payment.save()
+        self.assertEqual(list(AnalyticsDirtyDay.objects.values_list('date', flat=True)), [timezone.localdate(paid_at)])
+        AnalyticsService.refresh_today(force=True)
+        self.assertFalse(DailyRevenue.objects.filter(date=timezone.localdate(paid_at)).exists())
+        self.assertFalse(AnalyticsDirtyDay.objects.exists())
+
+
+class CertificateRenderServiceTest(TestCase):
+    def test_render_job_is_resumable(self):
+        import tempfile
+        from django.test import override_settings
+        from api.models import Certificate
+        from api.services.certificate_render_service import CertificateRenderService
+
+        user = User.objects.create_user(username='graduate', password='testpassword', first_name='Ali')
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            with CertificateRenderService.defer_rendering():
+                certificate = Certificate.objects.create(user=user, cert_type='OLYMPIAD', grade='95%', status='VERIFIED')
+            self.assertFalse(certificate.pdf_file)
+
+            job = CertificateRenderService.enqueue([certificate.id])
+            job = CertificateRenderService.run_job(job, workers=1)
+            self.assertEqual((job.status, job.rendered_count), ('COMPLETED', 1))
+
+            certificate.refresh_from_db()
+            self.assertTrue(certificate.pdf_file.read().startswith(b'%PDF'))
+            self.assertEqual(CertificateRenderService.load_render_data([certificate.id]), [])
+
+    def test_running_job_is_claimed_once(self):
+        from unittest import mock
+        from api.models import Certificate, CertificateRenderJob
+        from api.services.certificate_render_service import CertificateRenderService
+
+        user = User.objects.create_user(username='graduate', password='testpassword')
+        with CertificateRenderService.defer_rendering():
+            certificate = Certificate.objects.create(user=user, cert_type='OLYMPIAD', grade='95%', status='VERIFIED')
+        job = CertificateRenderService.enqueue([certificate.id])
+
+        # First runner claims the job; a second runner (another host) must not render it again
+        CertificateRenderJob.objects.filter(pk=job.pk).update(status='RUNNING', started_at=timezone.now())
+        with mock.patch.object(CertificateRenderService, '_render_chunks') as render:
+            CertificateRenderService.run_job(job, workers=1)
+        render.assert_not_called()
+
+        # ...until the first runner has been silent for STALE_AFTER_SECONDS
+        stale = timezone.now() - datetime.timedelta(seconds=CertificateRenderService.STALE_AFTER_SECONDS + 1)
+        CertificateRenderJob.objects.filter(pk=job.pk).update(started_at=stale)
+        with mock.patch.object(CertificateRenderService, '_render_chunks', return_value=[]) as render:
+            job = CertificateRenderService.run_job(job, workers=1)
+        render.assert_called_once()
+        self.assertEqual(job.status, 'COMPLETED')
+
+
+class CertificateStorageServiceTest(TestCase):
+    def test_content_addressed_artifact_is_served_with_etag_and_range(self):
+        import tempfile
+        from django.test import RequestFactory, override_settings
+        from api.models import Certificate
+        from api.certificate_generator import certificate_render_data
+        from api.services.certificate_render_service import CertificateRenderService
+        from api.services.certificate_storage_service import CertificateStorageService
+
+        user = User.objects.create_user(username='graduate', password='testpassword', first_name='Ali')
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            with CertificateRenderService.defer_rendering():
+                certificate = Certificate.objects.create(user=user, cert_type='OLYMPIAD', grade='95%', status='VERIFIED')
+            CertificateRenderService.run_job(CertificateRenderService.enqueue([certificate.id]), workers=1)
+            certificate.refresh_from_db()
+
+            # Batch and lazy rendering agree on the content key
+            data = certificate_render_data(certificate)
+            self.assertEqual(certificate.content_hash, CertificateStorageService.content_key(data))
+            self.assertTrue(CertificateStorageService.is_current(certificate))
+            self.assertNotEqual(CertificateStorageService.content_key(dict(data, grade='96%')), certificate.content_hash)
+
+            factory = RequestFactory()
+            etag = f'"{certificate.content_hash}"'
+            response = CertificateStorageService.serve(factory.get('/', HTTP_IF_NONE_MATCH=etag), certificate)
+            self.assertEqual(response.status_code, 304)
+
+            response = CertificateStorageService.serve(factory.get('/', HTTP_RANGE='bytes=0-3'), certificate)
+            self.assertEqual((response.status_code, response.content), (206, b'%PDF'))
+
+            response = CertificateStorageService.serve(factory.get('/', HTTP_RANGE='bytes=999999999-'), certificate)
+            self.assertEqual(response.status_code, 416)
+
+
+class OlympiadCertificateIssuanceTest(TestCase):
+    def test_completion_issues_certificates_in_bulk(self):
+        from api.models import Certificate, CertificateRenderJob, Notification, OlympiadRegistration
+
+        teacher = User.objects.create_user(username='teacher', password='testpassword', role='TEACHER')
+        olympiad = Olympiad.objects.create(
+            title="Test Olympiad", subject="Math", start_date=timezone.now(),
+            end_date=timezone.now() + datetime.timedelta(days=1), status='ONGOING', teacher=teacher, duration=60
+        )
+        students = [User.objects.create_user(username=f'student{i}', password='testpassword') for i in range(4)]
+        for student in students:
+            OlympiadRegistration.objects.create(user=student, olympiad=olympiad)
+        TestResult.objects.create(user=students[0], olympiad=olympiad, score=95, percentage=95, status='COMPLETED')
+        TestResult.objects.create(user=students[1], olympiad=olympiad, score=50, percentage=50, status='COMPLETED')
+        Certificate.objects.create(user=students[2], olympiad=olympiad, cert_type='OLYMPIAD', grade='Ishtirok etdi')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            olympiad.status = 'COMPLETED'
+            olympiad.save()
+
+        certificates = {c.user_id: c for c in Certificate.objects.filter(olympiad=olympiad)}
+        self.assertEqual(len(certificates), 4)
+        self.assertEqual(certificates[students[0].id].cert_type, 'DIPLOMA')
+        self.assertEqual(certificates[students[1].id].grade, '50.00%')
+        self.assertEqual(certificates[students[3].id].grade, 'Ishtirok etdi')
+        self.assertEqual(len({c.cert_number for c in certificates.values()}), 4)
+
+        job = CertificateRenderJob.objects.get()
+        self.assertEqual(len(job.certificate_ids), 3)
+
+        # bulk_create skips Certificate.save, the "certificate ready" notifications are created with it
+        notified = Notification.objects.filter(title="Sertifikat tayyor!").values_list('user_id', flat=True)
+        self.assertEqual(sorted(notified), sorted([students[0].id, students[1].id, students[3].id]))
+
+
+class CertificateVerificationTest(TestCase):
+    def setUp(self):
+        from api.services.certificate_verification_service import CertificateVerificationService
+        CertificateVerificationService.clear()
+        self.client = APIClient()
+
+    def test_verify_is_cached_and_invalidated_on_save(self):
+        from api.models import Certificate
+        from api.services.certificate_render_service import CertificateRenderService
+        from api.services.certificate_verification_service import CertificateVerificationService
+
+        user = User.objects.create_user(username='graduate', password='testpassword')
+        with CertificateRenderService.defer_rendering():
+            certificate = Certificate.objects.create(user=user, cert_type='OLYMPIAD', grade='95%', status='PENDING')
+
+        response = self.client.get('/api/certificates/verify/', {'number': certificate.cert_number}, secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.data['valid'])
+        self.assertIn('public', response['Cache-Control'])
+        signed = CertificateVerificationService.verify_signature(response.data['signature'])
+        self.assertEqual(signed['cert_number'], certificate.cert_number)
+
+        with self.assertNumQueries(0):
+            cached = self.client.get('/api/certificates/verify/', {'number': certificate.cert_number},
+                                     HTTP_IF_NONE_MATCH=response['ETag'], secure=True)
+        self.assertEqual(cached.status_code, 304)
+
+        certificate.status = 'VERIFIED'
+        with CertificateRenderService.defer_rendering(), self.captureOnCommitCallbacks(execute=True):
+            certificate.save()
+        response = self.client.get('/api/certificates/verify/', {'number': certificate.cert_number}, secure=True)
+        self.assertTrue(response.data['valid'])
+
+    def test_batch_reject_invalidates_after_update(self):
+        from api.models import Certificate
+        from api.services.certificate_render_service import CertificateRenderService
+
+        user = User.objects.create_user(username='graduate', password='testpassword')
+        admin = User.objects.create_user(username='admin', password='testpassword', role='ADMIN')
+        with CertificateRenderService.defer_rendering():
+            certificate = Certificate.objects.create(user=user, cert_type='OLYMPIAD', grade='95%', status='PENDING')
+        response = self.client.get('/api/certificates/verify/', {'number': certificate.cert_number}, secure=True)
+        self.assertEqual(response.data['certificate']['status'], 'PENDING')
+
+        self.client.force_authenticate(admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/certificates/batch_reject/', {'ids': [certificate.id]}, format='json', secure=True)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get('/api/certificates/verify/', {'number': certificate.cert_number}, secure=True)
+        self.assertEqual(response.data['certificate']['status'], 'REJECTED')
+
+    def test_unknown_numbers_are_negatively_cached(self):
+        response = self.client.get('/api/certificates/verify/', {'number': 'ARD-0000-AAAA-BBBB'}, secure=True)
+        self.assertEqual(response.status_code, 404)
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/certificates/verify/', {'number': 'ARD-0000-AAAA-BBBB'}, secure=True)
+        self.assertEqual(response.status_code, 404)
+
+
+class BotStateStoreTest(TestCase):
+    def test_state_round_trip_and_expiry(self):
+        from api.models import BotConversationState
+        from api.services.bot_state_service import BotStateStore
+
+        for backend in ('db', 'cache'):
+            store = BotStateStore(backend=backend, ttl=60)
+            store.set(42, 2)
+            store.update(42, 3, amount=100, sum=12000)
+            self.assertEqual(store.get(42), {"state": 3, "data": {"amount": 100, "sum": 12000}})
+
+            store.clear(42)
+            self.assertEqual(store.get(42), {"state": 0, "data": {}})
+
+        store = BotStateStore(backend='db', ttl=60)
+        store.set(7, 3, {"payment_id": 1})
+        BotConversationState.objects.filter(chat_id=7).update(expires_at=timezone.now())
+        self.assertEqual(store.get(7)["state"], 0)
+        self.assertEqual(store.purge_expired(), 1)
+
+
+class BotUpdateCoreTest(TestCase):
+    def test_updates_are_ordered_per_chat(self):
+        import random
+        import threading
+        import time
+        from api.services.bot_update_core import BotUpdateCore
+
+        handled = []
+        lock = threading.Lock()
+
+        def handle(update):
+            time.sleep(random.random() / 1000)
+            with lock:
+                handled.append((update['message']['chat']['id'], update['update_id']))
+
+        core = BotUpdateCore(handle, workers=4, max_pending=8, name='test')
+        for update_id in range(200):
+            core.submit({'update_id': update_id, 'message': {'chat': {'id': update_id % 5}, 'text': 'hi'}})
+        # Telegram retried delivery of an update that was already accepted
+        self.assertEqual(core.submit({'update_id': 3, 'message': {'chat': {'id': 3}, 'text': 'hi'}}), BotUpdateCore.DUPLICATE)
+        self.assertTrue(core.join(timeout=10))
+        core.shutdown()
+
+        self.assertEqual(len(handled), 200)
+        for chat_id in range(5):
+            update_ids = [update_id for chat, update_id in handled if chat == chat_id]
+            self.assertEqual(update_ids, sorted(update_ids))
+        self.assertEqual(core.metrics.snapshot()['text']['count'], 200)
+
+    def test_webhook_acknowledges_and_processes_in_background(self):
+        from unittest import mock
+        from api.services.bot_update_core import webhook_core
+
+        update = {'update_id': 9001, 'message': {'chat': {'id': 1}, 'text': '/start'}}
+        with mock.patch('api.services.bot_handler_service.BotUpdateHandler.handle_update') as handle_update:
+            webhook_core.cache_clear()
+            response = self.client.post('/api/bot/webhook/', update, content_type='application/json', secure=True)
+            self.assertEqual(response.status_code, 200)
+            retried = self.client.post('/api/bot/webhook/', update, content_type='application/json', secure=True)
+            self.assertEqual(retried.status_code, 200)
+            self.assertTrue(webhook_core().join(timeout=10))
+            webhook_core().shutdown()
+            webhook_core.cache_clear()
+        handle_update.assert_called_once_with(update)
+
+    def test_failed_update_can_be_redelivered(self):
+        from api.services.bot_update_core import BotUpdateCore
+
+        attempts = []
+
+        def handle(update):
+            attempts.append(update['update_id'])
+            if len(attempts) == 1:
+                raise RuntimeError("database unavailable")
+
+        core = BotUpdateCore(handle, workers=1, name='test-retry')
+        update = {'update_id': 77, 'message': {'chat': {'id': 1}, 'text': 'hi'}}
+        core.submit(update)
+        self.assertTrue(core.join(timeout=10))
+        self.assertEqual(core.submit(update), BotUpdateCore.ACCEPTED)
+        self.assertTrue(core.join(timeout=10))
+        self.assertEqual(core.submit(update), BotUpdateCore.DUPLICATE)
+        core.shutdown()
+        self.assertEqual(attempts, [77, 77])
+
+    def test_help_text_is_not_indented(self):
+        from unittest import mock
+        from api.services.bot_handler_service import BotUpdateHandler
+
+        User.objects.create_user(username='botuser', password='testpassword', telegram_id=1)
+        handler = BotUpdateHandler(token='TEST')
+        with mock.patch.object(handler, 'send_message') as send_message:
+            handler.handle_update({'message': {'chat': {'id': 1}, 'text': "❓ Yordam"}})
+        text = send_message.call_args[0][1]
+        self.assertIn("\n❓ <b>Yordam markazi</b>\n", text)
+        self.assertFalse([line for line in text.splitlines() if line.startswith(' ')])
+
+
+class LearningStateSnapshotTest(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from api.models import Course, Module, Lesson, Enrollment
+        # Course structures are cached by id and version; ids are reused between tests
+        cache.clear()
+        self.user = User.objects.create_user(username='learner', password='testpassword', role='STUDENT')
+        self.course = Course.objects.create(title='Geometry', price=0, lock_strategy='sequential')
+        module = Module.objects.create(course=self.course, title='Basics', order=1)
+        self.lessons = [
+            Lesson.objects.create(course=self.course, module=module, title=f'Lesson {i}', order=i)
+            for i in range(1, 4)
+        ]
+        Enrollment.objects.create(user=self.user, course=self.course)
+
+    def locks(self):
+        from api.services.learning_service import LearningService
+        state = LearningService.get_course_learning_state(self.user, self.course.id)
+        return [lesson.is_locked for lesson in state['flat_lessons']], state['current_lesson_id']
+
+    def test_structure_is_built_in_one_query(self):
+        from django.core.cache import cache
+        from api.models import Module, Lesson
+        from api.services.learning_service import LearningService
+
+        # Declared out of order: lessons follow module order, then lesson order
+        first = Module.objects.create(course=self.course, title='Intro', order=0)
+        intro = [
+            Lesson.objects.create(course=self.course, module=first, title=f'Intro {i}', order=3 - i)
+            for i in range(1, 3)
+        ]
+        Module.objects.create(course=self.course, title='Empty', order=2)
+        cache.clear()
+
+        with self.assertNumQueries(1):
+            structure = LearningService.get_course_structure(self.course)
+        self.assertEqual(structure['lesson_ids'], [intro[1].id, intro[0].id] + [lesson.id for lesson in self.lessons])
+
+    def test_completion_updates_snapshot_incrementally(self):
+        from api.models import LearningStateSnapshot
+        from api.services.learning_service import LearningService
+
+        self.assertEqual(self.locks(), ([False, True, True], self.lessons[0].id))
+
+        LearningService.update_lesson_progress(self.user, self.lessons[0].id, 'VIDEO_COMPLETE')
+        self.assertEqual(self.locks(), ([False, False, True], self.lessons[1].id))
+        self.assertFalse(LearningService.is_lesson_locked(self.user, self.lessons[1]))
+        self.assertTrue(LearningService.is_lesson_locked(self.user, self.lessons[2]))
+        self.assertEqual(LearningStateSnapshot.objects.filter(user=self.user).count(), 1)
+
+    def test_structure_change_rebuilds_snapshot(self):
+        from api.models import Lesson
+        from api.services.learning_service import LearningService
+
+        LearningService.update_lesson_progress(self.user, self.lessons[0].id, 'VIDEO_COMPLETE')
+        self.assertEqual(self.locks()[0], [False, False, True])
+
+        # A new first lesson shifts every bit; the snapshot must follow the new structure
+        first = Lesson.objects.create(course=self.course, module=self.lessons[0].module, title='Intro', order=0)
+        self.assertEqual(self.locks(), ([False, True, False, True], first.id))
+
+
+class EventBusTest(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from api.models import Course, Module, Lesson, Enrollment
+        cache.clear()
+        self.user = User.objects.create_user(username='eventful', password='testpassword', role='STUDENT')
+        self.course = Course.objects.create(title='Physics', price=0, lock_strategy='free')
+        module = Module.objects.create(course=self.course, title='Mechanics', order=1)
+        self.lessons = [
+            Lesson.objects.create(course=self.course, module=module, title=f'Lesson {i}', order=i, xp_amount=20)
+            for i in range(1, 3)
+        ]
+        Enrollment.objects.create(user=self.user, course=self.course)
+
+    def test_lesson_side_effects_run_after_commit(self):
+        from django.test import override_settings
+        from api.models import Enrollment
+        from api.services.learning_service import LearningService
+
+        with override_settings(EVENT_BUS_MODE='inline'):
+            with self.captureOnCommitCallbacks() as callbacks:
+                LearningService.update_lesson_progress(self.user, self.lessons[0].id, 'VIDEO_COMPLETE')
+                # Progress is part of the core write, rewards wait for the commit
+                self.assertEqual(Enrollment.objects.get(user=self.user, course=self.course).progress, 50)
+                self.user.refresh_from_db()
+                self.assertEqual(self.user.xp, 0)
+            for callback in callbacks:
+                callback()
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.xp, 20)
+        self.assertEqual(Enrollment.objects.get(user=self.user, course=self.course).progress, 50)
+
+    def test_keyed_handlers_run_once_per_batch(self):
+        from unittest import mock
+        from api.services.event_bus import EventBus, LessonCompleted
+
+        events = [
+            LessonCompleted(user_id=self.user.id, lesson_id=lesson.id, course_id=self.course.id, module_id=lesson.module_id)
+            for lesson in self.lessons
+        ]
+        with mock.patch('api.services.learning_service.LearningService.check_module_completion') as check_module:
+            failed = EventBus.dispatch(events + events[:1])
+        self.assertEqual(failed, {})
+        # Both lessons are in one module
+        check_module.assert_called_once()
+        self.user.refresh_from_db()
+        # The duplicated event is rewarded once
+        self.assertEqual(self.user.xp, 40)
+        self.assertGreaterEqual(EventBus.metrics.snapshot()['event_handlers.reward_lesson_xp']['count'], 2)
+
+    def test_worker_mode_stores_and_processes_events(self):
+        from django.test import override_settings
+        from api.models import DomainEvent
+        from api.services.event_bus import EventBus, LessonCompleted
+
+        with override_settings(EVENT_BUS_MODE='worker'):
+            with self.captureOnCommitCallbacks(execute=True):
+                EventBus.publish(LessonCompleted(user_id=self.user.id, lesson_id=self.lessons[0].id, course_id=self.course.id))
+        self.assertEqual(DomainEvent.objects.filter(status='PENDING').count(), 1)
+
+        self.assertEqual(EventBus.process_stored(), 1)
+        self.assertEqual(DomainEvent.objects.get().status, 'DONE')
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.xp, 20)
+
+    def test_retry_runs_only_the_failed_handlers(self):
+        import io
+        from unittest import mock
+        from django.core.management import call_command
+        from api.models import DomainEvent
+        from api.services.event_bus import EventBus, LessonCompleted
+
+        with self.captureOnCommitCallbacks(execute=True):
+            EventBus.publish(LessonCompleted(
+                user_id=self.user.id, lesson_id=self.lessons[0].id, course_id=self.course.id,
+                module_id=self.lessons[0].module_id
+            ))
+        with mock.patch('api.services.learning_service.LearningService.check_module_completion',
+                        side_effect=RuntimeError("database unavailable")):
+            EventBus.process_stored()
+        event = DomainEvent.objects.get()
+        self.assertEqual(event.status, 'FAILED')
+        self.assertEqual(event.failed_handlers, ['event_handlers.check_module_completion'])
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.xp, 20)
+
+        with mock.patch('api.services.learning_service.LearningService.check_module_completion') as check_module:
+            call_command('process_domain_events', '--retry-failed', stdout=io.StringIO())
+        check_module.assert_called_once()
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.failed_handlers), ('DONE', []))
+        # The XP handler succeeded the first time and is not run again
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.xp, 20)
+
+
+class EnrollmentProgressCounterTest(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from api.models import Course, Module, Lesson, Enrollment
+        cache.clear()
+        self.user = User.objects.create_user(username='counter', password='testpassword', role='STUDENT')
+        self.course = Course.objects.create(title='Chemistry', price=0, lock_strategy='free')
+        module = Module.objects.create(course=self.course, title='Atoms', order=1)
+        self.lessons = [
+            Lesson.objects.create(course=self.course, module=module, title=f'Lesson {i}', order=i)
+            for i in range(1, 5)
+        ]
+        self.enrollment = Enrollment.objects.create(user=self.user, course=self.course)
+
+    def test_completion_increments_counter_once(self):
+        from api.services.learning_service import LearningService
+
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.published_lessons_count, 4)
+        for _ in range(2):
+            LearningService.update_lesson_progress(self.user, self.lessons[0].id, 'VIDEO_COMPLETE')
+        LearningService.update_enrollment_stats(self.user, self.course)
+
+        self.enrollment.refresh_from_db()
+        self.assertEqual(self.enrollment.completed_lessons_count, 1)
+        self.assertEqual(self.enrollment.progress, 25)
+
+    def test_reconcile_repairs_drift(self):
+        from api.models import Enrollment, LessonProgress
+        from api.services.learning_service import LearningService
+
+        LessonProgress.objects.create(user=self.user, lesson=self.lessons[1], is_completed=True)
+        course_drift, enrollment_drift = LearningService.reconcile_progress_counters()
+        self.assertEqual(course_drift, [])
+        self.assertEqual([(stored, actual) for _, stored, actual in enrollment_drift], [(0, 1)])
+
+        LearningService.reconcile_progress_counters(fix=True)
+        enrollment = Enrollment.objects.get(pk=self.enrollment.pk)
+        self.assertEqual((enrollment.completed_lessons_count, enrollment.progress), (1, 25))
+        self.assertEqual(LearningService.reconcile_progress_counters(), ([], []))
+
+
+class ModuleProgressTest(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from api.models import Course, Module, Lesson, Enrollment
+        cache.clear()
+        self.user = User.objects.create_user(username='modular', password='testpassword', role='STUDENT')
+        course = Course.objects.create(title='Biology', price=0, lock_strategy='free')
+        self.module = Module.objects.create(course=course, title='Cells', order=1, xp_reward=30)
+        self.lessons = [
+            Lesson.objects.create(course=course, module=self.module, title=f'Lesson {i}', order=i)
+            for i in range(1, 3)
+        ]
+        Enrollment.objects.create(user=self.user, course=course)
+
+    def test_module_reward_is_given_once(self):
+        from api.models import ModuleProgress
+        from api.services.learning_service import LearningService
+
+        LearningService.update_lesson_progress(self.user, self.lessons[0].id, 'VIDEO_COMPLETE')
+        self.module.refresh_from_db()
+        self.assertFalse(LearningService.check_module_completion(self.user, self.module))
+
+        LearningService.update_lesson_progress(self.user, self.lessons[1].id, 'VIDEO_COMPLETE')
+        self.assertTrue(LearningService.check_module_completion(self.user, self.module))
+        self.assertFalse(LearningService.check_module_completion(self.user, self.module))
+
+        row = ModuleProgress.objects.get(user=self.user, module=self.module)
+        self.assertEqual(row.completed_lessons_count, 2)
+        self.assertIsNotNone(row.completed_at)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.xp, 30)
+        self.assertEqual(LearningService.reconcile_module_counters(), ([], []))
+
+
+class CareerGraphTest(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from api.models import Profession, ProfessionLevel, ProfessionNode
+        cache.clear()
+        self.profession = Profession.objects.create(name='Data Scientist', description='...')
+        self.level1 = ProfessionLevel.objects.create(profession=self.profession, level_number=1, title='Apprentice', order=1)
+        self.level2 = ProfessionLevel.objects.create(profession=self.profession, level_number=2, title='Adept', order=2)
+        self.a = ProfessionNode.objects.create(level=self.level1, title='Python', order=0)
+        self.b = ProfessionNode.objects.create(level=self.level1, title='Statistics', order=1, reference_id=7)
+        self.c = ProfessionNode.objects.create(
+            level=self.level2, title='ML', order=0, unlock_condition={'required_nodes': [self.a.id]}
+        )
+        self.profession.refresh_from_db()
+
+    def test_unlock_and_progression_use_compiled_graph(self):
+        from api.models import Notification
+        from api.services.career_engine_service import CareerEngineService
+
+        user = User.objects.create_user(username='career', password='testpassword', role='STUDENT')
+        state = CareerEngineService.get_or_create_state(user, self.profession)
+        self.assertFalse(CareerEngineService.can_unlock_node(user, self.b))
+        self.assertFalse(CareerEngineService.can_unlock_node(user, self.c))
+
+        CareerEngineService.complete_node(user, self.a)
+        self.assertTrue(CareerEngineService.can_unlock_node(user, self.c))
+        CareerEngineService.complete_reference_nodes(user, 'course', 7, score=100)
+
+        state.refresh_from_db()
+        self.assertEqual(state.current_level_id, self.level2.id)
+        self.assertTrue(Notification.objects.filter(user=user, title__startswith="Yangi bosqich").exists())
+
+    def test_recompute_profession_advances_all_users(self):
+        from api.models import UserNodeProgress, UserProfessionState
+        from api.services.career_engine_service import CareerEngineService
+
+        users = [User.objects.create_user(username=f'career{i}', password='testpassword') for i in range(3)]
+        for user in users:
+            CareerEngineService.get_or_create_state(user, self.profession)
+        for user in users[:2]:
+            for node in (self.a, self.b):
+                UserNodeProgress.objects.create(user=user, node=node, status='completed')
+
+        self.assertEqual(CareerEngineService.recompute_profession(self.profession), 2)
+        levels = dict(UserProfessionState.objects.values_list('user_id', 'current_level_id'))
+        self.assertEqual([levels[user.id] for user in users], [self.level2.id, self.level2.id, self.level1.id])
+
+
+class ProfessionProgressTest(TestCase):
+    def setUp(self):
+        from api.models import Course, Enrollment, Profession, ProfessionRoadmapStep, UserProfessionProgress
+        self.profession = Profession.objects.create(name='Backend Developer', description='...')
+        courses = [Course.objects.create(title=f'Course {i}', price=0) for i in range(4)]
+        for i, course in enumerate(courses):
+            ProfessionRoadmapStep.objects.create(profession=self.profession, title=course.title, course=course, order=i)
+        ProfessionRoadmapStep.objects.create(profession=self.profession, title='Extra', course=courses[0], is_mandatory=False)
+
+        self.users = [User.objects.create_user(username=f'follower{i}', password='testpassword') for i in range(3)]
+        for done, user in zip((1, 4, 0), self.users):
+            for course in courses:
+                Enrollment.objects.create(user=user, course=course, progress=10)
+            # update() skips the course-completion signal (certificates are not under test)
+            Enrollment.objects.filter(user=user, course__in=courses[:done]).update(progress=100)
+            UserProfessionProgress.objects.create(user=user, profession=self.profession)
+
+    def test_single_user_progress(self):
+        from api.services.profession_service import ProfessionService
+
+        progress = ProfessionService.update_user_profession_progress(self.users[0], self.profession)
+        self.assertEqual((progress.progress_percent, progress.status), (25, 'FOLLOWING'))
+
+    def test_recompute_followers(self):
+        from api.models import Notification, UserProfessionProgress
+        from api.services.profession_service import ProfessionService
+
+        self.assertEqual(ProfessionService.recompute_followers(self.profession, chunk_size=2), 2)
+        rows = dict(UserProfessionProgress.objects.values_list('user_id', 'progress_percent'))
+        self.assertEqual([rows[user.id] for user in self.users], [25, 100, 0])
+        self.assertEqual(UserProfessionProgress.objects.get(user=self.users[1]).status, 'COMPLETED')
+        self.assertEqual(Notification.objects.filter(user=self.users[1]).count(), 1)
+
+
+class FAQIndexTest(TestCase):
+    # Paraphrases of the seeded FAQs (seed_ai_faq.py) -> expected question_uz
+    RELEVANCE = [
+        ("Qaysi yo'nalishni tanlasam bo'ladi?", "Qaysi kursni tanlashim kerak?"),
+        ("Какой курс выбрать новичку?", "Qaysi kursni tanlashim kerak?"),
+        ("Kurslar narxi qancha?", "Narxlar qanday?"),
+        ("Какая цена курса?", "Narxlar qanday?"),
+        ("bepul dars", "Bepul darslar bormi?"),
+        ("Sertifikat olsam bo'ladimi?", "Sertifikat beriladimi?"),
+        ("Как получить диплом?", "Sertifikat beriladimi?"),
+        ("Olimpiada natijalari qachon chiqadi?", "Olimpiadalar qanday o'tkaziladi?"),
+        ("Payme orqali to'lasa bo'ladimi?", "Qanday to'lash mumkin?"),
+        ("Как оплатить через Click?", "Qanday to'lash mumkin?"),
+        ("Ro'yxatdan qanday o'taman?", "Qanday ro'yxatdan o'tish mumkin?"),
+        ("Kurs davomiyligi necha oy?", "Kurs davomiyligi qancha?"),
+        ("Кто преподаватели?", "Mentorlar kim?"),
+        ("Ustozlar kimlar?", "Mentorlar kim?"),
+        ("Поддержка не отвечает, нужна помощь", "Yordam kerak bo'lsa kim bilan bog'lanaman?"),
+    ]
+    # Share a word with an FAQ but ask something it does not answer -> LLM fallback and unanswered log
+    NEGATIVE = [
+        "Kursni qanday o'chirsam bo'ladi?",
+        "Как удалить курс?",
+        "Kursdan qanday chiqaman?",
+        "Dars videosi ochilmayapti",
+    ]
+
+    def setUp(self):
+        import contextlib
+        import io
+        from api.services.faq_index import FAQIndex
+        from seed_ai_faq import seed_ai_faq
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            seed_ai_faq()
+        FAQIndex.invalidate()
+
+    def test_relevance_regression(self):
+        from api.services.ai_service import AIService
+
+        for question, expected in self.RELEVANCE:
+            with self.subTest(question=question):
+                match = AIService.find_faq_match(question, 'uz')
+                self.assertIsNotNone(match)
+                self.assertEqual(match.question_uz, expected)
+
+    def test_unrelated_questions_fall_through(self):
+        from api.services.ai_service import AIService
+
+        for question in ("Ob-havo qanday bugun?", "Как приготовить плов?", "", "???"):
+            with self.subTest(question=question):
+                self.assertIsNone(AIService.find_faq_match(question, 'ru'))
+
+    def test_questions_sharing_a_generic_word_fall_through(self):
+        from api.services.ai_service import AIService
+
+        for question in self.NEGATIVE:
+            with self.subTest(question=question):
+                self.assertIsNone(AIService.find_faq_match(question, 'uz'))
+
+    def test_index_rebuilds_after_faq_save(self):
+        from api.models import AIAssistantFAQ
+        from api.services.ai_service import AIService
+
+        self.assertIsNone(AIService.find_faq_match("Mobil ilova bormi?", 'uz'))
+        with self.captureOnCommitCallbacks(execute=True):
+            faq = AIAssistantFAQ.objects.create(
+                question_uz="Mobil ilova bormi?", question_ru="Есть ли мобильное приложение?",
+                answer_uz="Ha", answer_ru="Да", category='GENERAL', search_tags='ilova, приложение',
+            )
+        self.assertEqual(AIService.find_faq_match("Mobil ilova bormi?", 'uz'), faq)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            faq.is_active = False
+            faq.save()
+        self.assertIsNone(AIService.find_faq_match("Mobil ilova bormi?", 'uz'))
+
+    def test_index_follows_edits_from_other_processes(self):
+        from api.models import AIAssistantFAQ
+        from api.services.ai_service import AIService
+        from api.services.faq_index import FAQIndex
+
+        self.assertIsNone(AIService.find_faq_match("Mobil ilova bormi?", 'uz'))
+        # Saved by another worker: the on_commit invalidation never runs in this process
+        faq = AIAssistantFAQ.objects.create(
+            question_uz="Mobil ilova bormi?", question_ru="Есть ли мобильное приложение?",
+            answer_uz="Ha", answer_ru="Да", category='GENERAL', search_tags='ilova, приложение',
+        )
+        self.assertIsNone(AIService.find_faq_match("Mobil ilova bormi?", 'uz'))
+        FAQIndex._checked_at = 0.0  # VERSION_CHECK_SECONDS have passed
+        self.assertEqual(AIService.find_faq_match("Mobil ilova bormi?", 'uz'), faq)
+
+
+class FAQEmbeddingTest(TestCase):
+    def setUp(self):
+        import contextlib
+        import io
+        import tempfile
+        from api.services.faq_index import FAQIndex
+        from seed_ai_faq import seed_ai_faq
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            seed_ai_faq()
+        FAQIndex.invalidate()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        settings_override = self.settings(FAQ_EMBEDDING_DIR=self.directory.name, AI_FAQ_SEMANTIC_WEIGHT=0.5)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_embeddings_rerank_keyword_candidates(self):
+        from api.services.ai_service import AIService
+        from api.services.faq_embeddings import FAQEmbeddingIndex
+
+        # "kurs" and "to'lov" are equally confident keywords; the wording is about paying
+        question = "Kurs uchun to'lov qanday?"
+        self.assertEqual(AIService.find_faq_match(question, 'uz').question_uz, "Qaysi kursni tanlashim kerak?")
+        FAQEmbeddingIndex.build()
+        self.assertEqual(AIService.find_faq_match(question, 'uz').question_uz, "Qanday to'lash mumkin?")
+
+        for question, expected in [
+            ("Darslar tekinmi?", "Bepul darslar bormi?"),
+            ("Mentorlaringiz kimlar", "Mentorlar kim?"),
+            ("Kurslar narxi qancha?", "Narxlar qanday?"),
+        ]:
+            with self.subTest(question=question):
+                self.assertEqual(AIService.find_faq_match(question, 'uz').question_uz, expected)
+
+        # Similarity alone never accepts a match: n-gram overlap with the wrong FAQ
+        # ("Qaysi kursni tanlashim kerak?") or a script the keywords don't cover
+        for question in ("Kursni qanday o'chirsam bo'ladi?", "Сертификатлар бериладими?", "Как приготовить плов?"):
+            with self.subTest(question=question):
+                self.assertIsNone(AIService.find_faq_match(question, 'uz'))
+
+    def test_semantic_stage_is_skipped_over_budget(self):
+        from unittest import mock
+        from api.services.ai_service import AIService
+        from api.services.faq_embeddings import FAQEmbeddingIndex
+
+        FAQEmbeddingIndex.build()
+        # Any keyword search takes longer than a negative budget
+        with self.settings(AI_FAQ_LATENCY_BUDGET_MS=-1), \
+                mock.patch('api.services.ai_service.FAQEmbeddingIndex.get') as get_embeddings:
+            self.assertEqual(AIService.find_faq_match("Kurs uchun to'lov qanday?", 'uz').question_uz, "Qaysi kursni tanlashim kerak?")
+            self.assertEqual(AIService.find_faq_match("Sertifikat beriladimi?", 'uz').question_uz, "Sertifikat beriladimi?")
+        get_embeddings.assert_not_called()
+
+    def test_suggest_faqs_clusters_unanswered_questions(self):
+        from api.models import AIUnansweredQuestion
+        from api.services.faq_embeddings import FAQEmbeddingIndex, suggest_faqs
+
+        FAQEmbeddingIndex.build()
+        for question in ["Mobil ilova bormi?", "mobil ilovangiz bormi", "Mobil ilova qachon chiqadi?",
+                         "Sertifikat olsam bo'ladimi?", "Sertifikat beriladimi?", "Как приготовить плов?"]:
+            AIUnansweredQuestion.objects.create(question=question)
+
+        suggestions = suggest_faqs()
+        # Certificates already have an FAQ, the plov question is a one-off
+        self.assertEqual(len(suggestions), 1)
+        self.assertEqual(suggestions[0]['count'], 3)
+        self.assertIn('ilova', suggestions[0]['question'].lower())
+
+
+class AILogBufferTest(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from api.services.ai_log_buffer import ai_log_buffer
+        from api.services.faq_index import FAQIndex
+
+        cache.clear()
+        FAQIndex.invalidate()
+        settings_override = self.settings(AI_LOG_FLUSH_INTERVAL=None, AI_FAQ_SEMANTIC_WEIGHT=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        ai_log_buffer.cache_clear()
+        self.addCleanup(ai_log_buffer.cache_clear)
+        self.log = ai_log_buffer()
+
+    def test_queries_are_written_in_one_flush(self):
+        from api.models import AIConversation, AIMessage, AIUnansweredQuestion
+        from api.services.ai_service import AIService
+
+        conv = AIService.get_or_create_conversation(session_id='s1', context_url='/courses')
+        AIService.process_query(conv, "Ob-havo qanday bugun?")
+        # Only the (rateable) LLM reply is written right away
+        with self.assertNumQueries(1):
+            conv = AIService.get_or_create_conversation(session_id='s1')
+            AIService.process_query(conv, "ob-havo  qanday bugun")
+        self.assertEqual(list(AIMessage.objects.values_list('role', flat=True)), ['assistant', 'assistant'])
+
+        with self.assertNumQueries(8):
+            self.assertEqual(self.log.flush(), 2)
+        self.assertEqual(
+            list(AIMessage.objects.values_list('role', flat=True)), ['user', 'assistant', 'user', 'assistant']
+        )
+        self.assertEqual(AIConversation.objects.get().context_url, '/courses')
+        question = AIUnansweredQuestion.objects.get()
+        self.assertEqual((question.count, question.context_url), (2, '/courses'))
+
+        AIService.process_query(conv, "Ob-havo qanday bugun?")
+        self.log.flush()
+        question.refresh_from_db()
+        self.assertEqual(question.count, 3)
+        self.assertEqual(AIUnansweredQuestion.objects.count(), 1)
+
+    def test_rate_llm_reply_from_another_worker(self):
+        from unittest import mock
+        from api.models import AIMessage, AIUnansweredQuestion
+        from api.services.ai_service import AIService
+
+        conv = AIService.get_or_create_conversation(session_id='s2')
+        response = AIService.process_query(conv, "Как приготовить плов?", 'ru')
+
+        # Rated on another worker: this process's buffer is not flushed there
+        with mock.patch.object(self.log, 'flush'):
+            self.assertTrue(AIService.rate_response(response['message_id'], -1))
+        self.assertEqual(AIMessage.objects.get(uid=response['message_id']).rating, -1)
+        self.assertFalse(AIService.rate_response('not-a-uid', 1))
+
+        self.log.flush()
+        self.assertTrue(AIUnansweredQuestion.objects.filter(question__startswith='LOW RATING').exists())
+
+
+class QuestionImportTest(TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create_user(username='teacher', password='testpassword', role='TEACHER')
+        self.olympiad = Olympiad.objects.create(
+            title="Import Olympiad", subject="Math", start_date=timezone.now(), teacher=self.teacher, duration=60
+        )
+
+    def upload(self, name, content):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        return SimpleUploadedFile(name, content)
+
+    def test_xlsx_rows_are_validated_and_bulk_created(self):
+        import io
+        from openpyxl import Workbook
+        from api.services.question_import_service import QuestionImportService
+
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.append(['Savol', 'Type', 'Variantlar', 'Javob', 'Points', None])
+        sheet.append(['2+2?', 'MCQ', '3|4|5', 'B', 2, None])
+        sheet.append(['Poytaxt?', None, 'Toshkent, Samarqand', 'toshkent', None, None])
+        sheet.append([None, None, None, None, None, None])
+        sheet.append(['Pi?', 'NUMERIC', None, 'uch', 1, None])
+        sheet.append(['Bad MCQ', 'MCQ', 'faqat bitta', 'A', 1, None])
+        sheet.append(['Kub ildiz 27?', 'NUMERIC', None, 3, 1.0, None])
+        buffer = io.BytesIO()
+        workbook.save(buffer)
+
+        report = QuestionImportService.import_file(self.olympiad, self.upload('q.xlsx', buffer.getvalue()))
+
+        self.assertEqual(report['created'], 3)
+        self.assertEqual(report['errors'], [
+            {'row': 5, 'error': 'correct_answer must be a number'},
+            {'row': 6, 'error': 'MCQ needs at least 2 options'},
+        ])
+        questions = list(self.olympiad.questions.values_list('text', 'correct_answer', 'points', 'order'))
+        self.assertEqual(questions, [('2+2?', '1', 2, 1), ('Poytaxt?', '0', 1, 2), ('Kub ildiz 27?', '3', 1, 3)])
+
+    def test_strict_csv_import_through_the_view(self):
+        client = APIClient()
+        client.force_authenticate(user=self.teacher)
+        csv = "text,type,options,correct_answer,points\n1+1?,MCQ,1|2,2,1\nBroken,ESSAY,,x,0\n".encode()
+        url = f'/api/olympiads/{self.olympiad.id}/import_questions/'
+
+        response = client.post(url, {'file': self.upload('q.csv', csv), 'strict': 'true'}, secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 0)
+        self.assertEqual(response.data['errors'], [{
+            'row': 3, 'error': 'type must be one of MCQ, TEXT, NUMERIC, CODE; points must be a positive whole number'
+        }])
+        self.assertFalse(self.olympiad.questions.exists())
+
+        response = client.post(url, {'file': self.upload('q.csv', csv)}, secure=True)
+        self.assertEqual((response.data['count'], response.data['skipped']), (1, 1))
+        self.assertEqual(self.olympiad.questions.get().correct_answer, '1')
+
+
+class QuestionBankTest(TestCase):
+    CSV = "text,options,correct_answer\n2+2?,3|4,B\nPoytaxt?,Toshkent|Buxoro,Toshkent\n".encode()
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.teacher = User.objects.create_user(username='teacher', password='testpassword', role='TEACHER')
+        self.olympiads = [
+            Olympiad.objects.create(title=f"Bank {i}", subject="Math", start_date=timezone.now(), teacher=self.teacher)
+            for i in range(3)
+        ]
+
+    def test_imports_share_bank_items_and_copies_keep_links(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from api.models import BankQuestion, Question
+        from api.services.question_bank_service import QuestionBankService
+        from api.services.question_import_service import QuestionImportService
+
+        for olympiad in self.olympiads[:2]:
+            QuestionImportService.import_file(olympiad, SimpleUploadedFile('q.csv', self.CSV))
+        self.assertEqual(BankQuestion.objects.count(), 2)
+        first, second = (list(o.questions.values_list('bank_item_id', flat=True)) for o in self.olympiads[:2])
+        self.assertEqual(first, second)
+
+        # Read, count, one insert, version bump (plus the savepoint pair)
+        with self.assertNumQueries(6):
+            QuestionBankService.copy_questions(self.olympiads[0], self.olympiads[2])
+        copied = list(self.olympiads[2].questions.values_list('text', 'order', 'bank_item_id'))
+        self.assertEqual(copied, [('2+2?', 1, first[0]), ('Poytaxt?', 2, first[1])])
+        self.assertEqual(BankQuestion.objects.count(), 2)
+        self.assertEqual(Question.objects.count(), 6)
+
+    def test_finish_test_grades_from_cached_answer_key(self):
+        from api.models import BankQuestion, Question
+        from api.services.olympiad_service import OlympiadService
+        from api.services.question_bank_service import QuestionBankService
+
+        olympiad = self.olympiads[0]
+        mcq = Question.objects.create(olympiad=olympiad, text="2+2?", options=['3', '4'], correct_answer='1', points=2)
+        numeric = Question.objects.create(olympiad=olympiad, text="3*3?", type='NUMERIC', correct_answer=' 9 ', points=1)
+        self.assertIsNotNone(mcq.bank_item_id)
+
+        student = User.objects.create_user(username='student', password='testpassword')
+        TestResult.objects.create(
+            user=student, olympiad=olympiad, status='IN_PROGRESS', answers={str(mcq.id): '1', str(numeric.id): '9'}
+        )
+        self.assertEqual(OlympiadService.finish_test(student, olympiad.id).score, 3)
+        olympiad.refresh_from_db()
+        with self.assertNumQueries(0):
+            self.assertEqual(QuestionBankService.grade(olympiad, {str(mcq.id): '0'}), (0, 3))
+
+        # An edit links new content and bumps the version in the key; the old item stays in the bank
+        mcq.correct_answer = '0'
+        mcq.save()
+        olympiad.refresh_from_db()
+        self.assertEqual(QuestionBankService.grade(olympiad, {str(mcq.id): '0'}), (2, 3))
+        self.assertEqual(BankQuestion.objects.count(), 3)
+
+    def test_copy_source_must_be_editable_by_the_caller(self):
+        from api.models import Question
+
+        Question.objects.create(olympiad=self.olympiads[0], text="2+2?", options=['3', '4'], correct_answer='1')
+        other = User.objects.create_user(username='other', password='testpassword', role='TEACHER')
+        foreign = Olympiad.objects.create(title="Foreign", subject="Math", start_date=timezone.now(), teacher=other)
+        Question.objects.create(olympiad=foreign, text="3*3?", type='NUMERIC', correct_answer='9')
+        Olympiad.objects.filter(pk=self.olympiads[1].pk).update(is_active=False)
+
+        client = APIClient()
+        client.force_authenticate(self.teacher)
+        url = f'/api/olympiads/{self.olympiads[2].id}/copy_questions/'
+        for source in (foreign, self.olympiads[1]):
+            with self.subTest(source=source.title):
+                response = client.post(url, {'source': source.id}, format='json', secure=True)
+                self.assertEqual(response.status_code, 400)
+        response = client.post(url, {'source': self.olympiads[0].id}, format='json', secure=True)
+        self.assertEqual(response.data['count'], 1)
+
+        # Nor can questions be copied into another teacher's olympiad
+        response = client.post(f'/api/olympiads/{foreign.id}/copy_questions/', {'source': self.olympiads[0].id},
+                               format='json', secure=True)
+        self.assertEqual(response.status_code, 403)
+
+    def test_bank_lists_only_items_of_the_callers_olympiads(self):
+        from api.models import BankQuestion, Question
+
+        own = Question.objects.create(olympiad=self.olympiads[0], text="2+2?", options=['3', '4'], correct_answer='1')
+        other = User.objects.create_user(username='other', password='testpassword', role='TEACHER')
+        foreign = Olympiad.objects.create(title="Foreign", subject="Math", start_date=timezone.now(), teacher=other)
+        secret = Question.objects.create(olympiad=foreign, text="3*3?", type='NUMERIC', correct_answer='9')
+        # Same content in both teachers' olympiads: one shared item, visible to neither
+        Question.objects.create(olympiad=self.olympiads[1], text="Poytaxt?", type='TEXT', correct_answer='Toshkent')
+        Question.objects.create(olympiad=foreign, text="Poytaxt?", type='TEXT', correct_answer='Toshkent')
+        admin = User.objects.create_user(username='bankadmin', password='testpassword', role='ADMIN')
+        everything = sorted(BankQuestion.objects.values_list('id', flat=True))
+        self.assertEqual(len(everything), 3)
+
+        client = APIClient()
+        for user, expected in ((other, [secret.bank_item_id]), (self.teacher, [own.bank_item_id]), (admin, everything)):
+            with self.subTest(user=user.username):
+                client.force_authenticate(user)
+                response = client.get('/api/question-bank/', secure=True)
+                self.assertEqual(response.status_code, 200)
+                results = response.data['results'] if isinstance(response.data, dict) else response.data
+                self.assertEqual(sorted(item['id'] for item in results), expected)
+
+        # Nor can another teacher's item be added by id
+        client.force_authenticate(self.teacher)
+        response = client.post(f'/api/olympiads/{self.olympiads[2].id}/add_bank_questions/',
+                               {'items': [secret.bank_item_id]}, format='json', secure=True)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(self.olympiads[2].questions.exists())
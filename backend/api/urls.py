@@ -7,6 +7,7 @@ router = DefaultRouter()
 router.register(r'courses', views.CourseViewSet)
 router.register(r'olympiads', views.OlympiadViewSet, basename='olympiads')
 router.register(r'questions', views.QuestionViewSet, basename='questions')
+router.register(r'question-bank', views.QuestionBankViewSet, basename='question-bank')
 router.register(r'olympiad-prizes', views.OlympiadPrizeViewSet, basename='olympiad-prizes')
 router.register(r'winner-prizes', views.WinnerPrizeViewSet, basename='winner-prizes')
 router.register(r'subjects', views.SubjectViewSet)
@@ -98,6 +99,8 @@ urlpatterns = [
     # Telegram Bot & Linking
     path('bot/link-token/', views.get_telegram_linking_token, name='bot-link-token'),
     path('bot/webhook/', views.telegram_webhook, name='bot-webhook'),
+    path('bot/webhook/metrics/', views.telegram_webhook_metrics, name='bot-webhook-metrics'),
+    path('events/metrics/', views.domain_event_metrics, name='domain-event-metrics'),
     
     # Include router URLs
     path('', include(router.urls)),
@@ -3,16 +3,17 @@ from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from rest_framework.parsers import MultiPartParser, FormParser
-import pandas as pd
 import json
-import os
 from rest_framework.exceptions import ValidationError
 from django.contrib.auth import authenticate
 from django.contrib.auth.hashers import make_password
 from django.utils import timezone
 from django.db.models import Count, Sum, Avg, Max, Q, Min, F
-from django.db import models
+from django.db.models.functions import TruncMonth
+from django.db import models, transaction
 from django.shortcuts import get_object_or_404
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
 from django.core.files.storage import default_storage
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
@@ -31,12 +32,13 @@ from .models import (
     Testimonial, Winner, Banner, AIAssistantFAQ,
     NotificationBroadcast, NotificationTemplate,
     AIConversation, AIMessage, AIUnansweredQuestion, OlympiadPrize, WinnerPrize, PrizeAddress,
-    TeacherWallet, Transaction, Payout, LessonContent, Homework, HomeworkSubmission
+    TeacherWallet, Transaction, Payout, LessonContent, Homework, HomeworkSubmission,
+    DailyRevenue, DailyUserStats
 )
 from .serializers import (
     UserSerializer, UserRegisterSerializer, UserLoginSerializer,
     CourseSerializer, CourseDetailSerializer, LessonSerializer, EnrollmentSerializer,
-    OlympiadSerializer, OlympiadDetailSerializer, QuestionSerializer, QuestionAdminSerializer,
+    OlympiadSerializer, OlympiadDetailSerializer, QuestionSerializer, QuestionAdminSerializer, BankQuestionSerializer,
     OlympiadPrizeSerializer,
     OlympiadRegistrationSerializer, TestResultSerializer, TestSubmitSerializer,
     CertificateSerializer, CertificateVerifySerializer,
@@ -69,7 +71,14 @@ from .services.olympiad_service import OlympiadService
 from .services.email_service import EmailService
 from .bot_service import BotService
 from .services.certificate_service import CertificateService
+from .services.certificate_storage_service import CertificateStorageService
+from .services.certificate_verification_service import CertificateVerificationService
+from .services.bot_update_core import BotUpdateCore, webhook_core
 from .services.reward_service import RewardService
+from .services.payment_service import PaymentService
+from .services.export_service import ExportService
+from .services.ledger_service import LedgerService, InsufficientFunds
+from .services.analytics_service import AnalyticsService
 
 
 
@@ -961,7 +970,8 @@ class CourseViewSet(viewsets.ModelViewSet):
         
         return Response({
             "enrollment": EnrollmentSerializer(state['enrollment']).data,
-            "modules": serializer.data
+            "modules": serializer.data,
+            "current_lesson_id": state['current_lesson_id']
         })
     
     
@@ -1198,8 +1208,10 @@ class CourseViewSet(viewsets.ModelViewSet):
             return Response({'error': 'Mablag\' yetarli emas', 'requires_balance': float(course.price - user.balance)}, status=status.HTTP_402_PAYMENT_REQUIRED)
             
         # 3. Deduct balance & Create Payment record
-        user.balance -= course.price
-        user.save(update_fields=['balance'])
+        if not PaymentService.debit_balance(user.id, course.price, reference=f"COURSE:{course.id}"):
+            user.refresh_from_db(fields=['balance'])
+            return Response({'error': 'Mablag\' yetarli emas', 'requires_balance': float(course.price - user.balance)}, status=status.HTTP_402_PAYMENT_REQUIRED)
+        user.refresh_from_db(fields=['balance'])
         
         payment = Payment.objects.create(
             user=user,
@@ -1230,10 +1242,11 @@ class CourseViewSet(viewsets.ModelViewSet):
             teacher_share = course.price - platform_share
             
             # Update Teacher Wallet
-            wallet, created = TeacherWallet.objects.get_or_create(teacher=course.teacher)
-            wallet.pending_balance += teacher_share
-            wallet.total_earned += teacher_share
-            wallet.save()
+            LedgerService.transfer(
+                LedgerService.PLATFORM, LedgerService.teacher_pending(course.teacher_id), teacher_share,
+                'COURSE_SALE', reference=f"course:{course.id}"
+            )
+            TeacherWallet.objects.filter(teacher=course.teacher).update(total_earned=F('total_earned') + teacher_share)
             
             # Create Transaction for Teacher (Income)
             Transaction.objects.create(
@@ -1433,15 +1446,11 @@ class LessonViewSet(viewsets.ModelViewSet):
         if user.role == 'ADMIN' or (user.role == 'TEACHER' and instance.course.teacher == user):
              return super().retrieve(request, *args, **kwargs)
              
-        # Guest/Student check
-        state = LearningService.get_course_learning_state(user, instance.course_id)
-        # Find this lesson in the flat list
-        lesson_data = next((l for l in state['flat_lessons'] if l.id == instance.id), None)
-        
-        if lesson_data and getattr(lesson_data, 'is_locked', False):
+        # Guest/Student check (precomputed learning-state snapshot)
+        if LearningService.is_lesson_locked(user, instance):
             return Response({
                 'error': 'Lesson is locked. Complete previous requirements first.',
-                'required_lesson_id': lesson_data.required_lesson_id
+                'required_lesson_id': instance.required_lesson_id
             }, status=status.HTTP_403_FORBIDDEN)
             
         return super().retrieve(request, *args, **kwargs)
@@ -1649,31 +1658,26 @@ class OlympiadViewSet(viewsets.ModelViewSet):
         month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
         
         # 1. Status Stats
-        status_counts = Olympiad.objects.values('status').annotate(count=Count('id'))
+        status_counts = dict(Olympiad.objects.values_list('status').annotate(count=Count('id')).order_by())
         stats_dict = {
-            'ACTIVE': Olympiad.objects.filter(status='ONGOING').count(),
-            'UPCOMING': Olympiad.objects.filter(status='UPCOMING').count(),
-            'COMPLETED': Olympiad.objects.filter(status='COMPLETED').count(),
-            'REGISTRATION_OPEN': Olympiad.objects.filter(status='REGISTRATION_OPEN').count(),
+            'ACTIVE': status_counts.get('ONGOING', 0),
+            'UPCOMING': status_counts.get('UPCOMING', 0),
+            'COMPLETED': status_counts.get('COMPLETED', 0),
+            'REGISTRATION_OPEN': status_counts.get('REGISTRATION_OPEN', 0),
         }
         
-        # 2. Revenue Stats
-        total_revenue = Payment.objects.filter(
-            type='OLYMPIAD', 
-            status='COMPLETED'
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        monthly_revenue = Payment.objects.filter(
-            type='OLYMPIAD', 
-            status='COMPLETED',
-            created_at__gte=month_start
-        ).aggregate(total=Sum('amount'))['total'] or 0
+        # 2. Revenue Stats (daily facts)
+        revenue = AnalyticsService.revenue_totals(
+            total=(None, 'OLYMPIAD'),
+            monthly=(timezone.localtime(month_start).date(), 'OLYMPIAD'),
+        )
+        total_revenue = revenue['total']
+        monthly_revenue = revenue['monthly']
         
         # 3. Participation Stats
         total_participants = OlympiadRegistration.objects.count()
-        avg_participants = Olympiad.objects.annotate(
-            p_count=Count('registrations')
-        ).aggregate(avg=Avg('p_count'))['avg'] or 0
+        olympiads_count = sum(status_counts.values())
+        avg_participants = total_participants / olympiads_count if olympiads_count else 0
         
         return Response({
             'success': True,
@@ -2394,6 +2398,23 @@ class OlympiadViewSet(viewsets.ModelViewSet):
             'questions': q_data
         })
 
+    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated, IsTeacherOrAdmin])
+    def export_results(self, request, pk=None):
+        """
+        Export all results of an olympiad
+        GET /api/olympiads/{id}/export_results/?file_format=csv|xlsx&status=COMPLETED
+        """
+        olympiad = self.get_object()
+        queryset = TestResult.objects.filter(olympiad=olympiad).order_by('-score', 'time_taken', 'submitted_at')
+        
+        result_status = request.query_params.get('status')
+        if result_status:
+            queryset = queryset.filter(status=result_status)
+        
+        return ExportService.export(
+            queryset, ExportService.TEST_RESULT_COLUMNS, f"olympiad_{olympiad.id}_results", ExportService.get_format(request)
+        )
+
     @action(detail=True, methods=['get'])
     def submissions(self, request, pk=None):
         """List all submissions for teacher/admin"""
@@ -2657,179 +2678,73 @@ class OlympiadViewSet(viewsets.ModelViewSet):
             'registrations': OlympiadRegistrationSerializer(registrations, many=True).data
         })
 
+    def _editable(self, queryset):
+        """Olympiads of queryset the requesting teacher may edit (all of them for admins)"""
+        user = self.request.user
+        return queryset if user.role == 'ADMIN' else queryset.filter(teacher=user)
+
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated, IsTeacherOrAdmin])
+    def add_bank_questions(self, request, pk=None):
+        """Append question bank items ({'items': [ids], 'points': 1}) in the given order"""
+        from .services.question_bank_service import QuestionBankService
+        olympiad = self.get_object()
+        if not self._editable(Olympiad.objects.filter(pk=olympiad.pk)).exists():
+            return Response({'error': 'Ruxsat yo\'q'}, status=status.HTTP_403_FORBIDDEN)
+        ids = [int(item) for item in request.data.get('items', []) if str(item).isdigit()]
+        items = QuestionBankService.visible_items(request.user).in_bulk(ids)
+        missing = [item for item in ids if item not in items]
+        if not ids or missing:
+            return Response({'error': f'Unknown bank items: {missing}' if missing else 'items is required'}, status=400)
+
+        questions = QuestionBankService.add_items(
+            olympiad, [items[item] for item in ids], points=int(request.data.get('points') or 1)
+        )
+        return Response({'success': True, 'count': len(questions)})
+
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated, IsTeacherOrAdmin])
+    def copy_questions(self, request, pk=None):
+        """Append every question of another olympiad ({'source': id}), sharing its bank items"""
+        from .services.question_bank_service import QuestionBankService
+        olympiad = self.get_object()
+        if not self._editable(Olympiad.objects.filter(pk=olympiad.pk)).exists():
+            return Response({'error': 'Ruxsat yo\'q'}, status=status.HTTP_403_FORBIDDEN)
+        # Questions carry their correct answers: only the caller's own (active) olympiads can be copied
+        source_id = request.data.get('source')
+        source = self._editable(self.get_queryset()).filter(id=source_id).first() if str(source_id).isdigit() else None
+        if source is None or source.id == olympiad.id:
+            return Response({'error': 'Source olympiad not found'}, status=400)
+
+        questions = QuestionBankService.copy_questions(source, olympiad)
+        return Response({'success': True, 'count': len(questions)})
+
     @action(detail=True, methods=['post'], parser_classes=[MultiPartParser, FormParser], permission_classes=[IsAuthenticated, IsTeacherOrAdmin])
     def import_questions(self, request, pk=None):
-        """Import questions from Excel/CSV/Word"""
+        """
+        Import questions from Excel/CSV/Word. Invalid rows are skipped and
+        listed in 'errors'; with strict=true nothing is imported if any row
+        is invalid.
+        """
+        from .services.question_import_service import QuestionImportError, QuestionImportService
         olympiad = self.get_object()
         
         if 'file' not in request.FILES:
             return Response({'error': 'File not provided'}, status=400)
-            
-        file = request.FILES['file']
-        ext = os.path.splitext(file.name)[1].lower()
-        
-        created_count = 0
-        
-        try:
-            questions_data = []
-            
-            # --- IMPORT LOGIC START ---
-            if ext in ['.xlsx', '.xls', '.csv']:
-                # Read via Pandas
-                if ext == '.csv':
-                    df = pd.read_csv(file)
-                else:
-                    df = pd.read_excel(file)
-                
-                # Expected columns: text, type, options, correct_answer, points, time_limit, explanation
-                # Map simple columns to standard names if needed
-                df.columns = [str(c).lower().strip() for c in df.columns]
-                
-                for _, row in df.iterrows():
-                    # Safely get values
-                    text = str(row.get('text', '') or row.get('savol', '')).strip()
-                    if not text: continue
-                    
-                    q_type = str(row.get('type', 'MCQ')).upper()
-                    if q_type not in ['MCQ', 'TEXT', 'NUMERIC', 'CODE']: q_type = 'MCQ'
-                    
-                    # Options (comma separated or JSON)
-                    options_raw = row.get('options', '') or row.get('variantlar', '')
-                    options = []
-                    if options_raw and pd.notna(options_raw):
-                        raw_str = str(options_raw)
-                        options = raw_str.split('|') if '|' in raw_str else raw_str.split(',')
-                        options = [o.strip() for o in options if o.strip()]
-                    
-                    # Ensure minimal options for MCQ if empty in 'options' column
-                    if q_type == 'MCQ' and len(options) < 2:
-                        # Fallback: maybe A, B, C columns exist?
-                        opts = []
-                        for char in ['a', 'b', 'c', 'd']:
-                            val = row.get(char, '')
-                            if val and pd.notna(val): opts.append(str(val))
-                        if opts: options = opts
-                    
-                    correct = str(row.get('correct_answer', '') or row.get('javob', '0')).strip()
-                    points = int(row.get('points', 1)) if pd.notna(row.get('points', 1)) else 1
-
-                    # Fix MCQ Answer (Convert Text/A/B to Index)
-                    if q_type == 'MCQ' and options:
-                        # 1. Check if it's A/B/C/D
-                        if len(correct) == 1 and correct.upper() in ['A', 'B', 'C', 'D', 'E']:
-                            idx = ord(correct.upper()) - ord('A')
-                            if idx < len(options):
-                                correct = str(idx)
-                        
-                        # 2. Check if it matches an Option Text perfectly
-                        elif correct in options:
-                            correct = str(options.index(correct))
-                        
-                        # 3. Check if it matches Option Text (case insensitive)
-                        else:
-                            for idx, opt in enumerate(options):
-                                if opt.lower().strip() == correct.lower().strip():
-                                    correct = str(idx)
-                                    break
-
-                    questions_data.append({
-                        'text': text,
-                        'type': q_type,
-                        'options': options,
-                        'correct_answer': correct,
-                        'points': points,
-                        'explanation': str(row.get('explanation', '')) if pd.notna(row.get('explanation', '')) else '',
-                        'time_limit': int(row.get('time_limit', 0)) if pd.notna(row.get('time_limit', 0)) else 0
-                    })
-
-            elif ext == '.docx':
-                # Basic Word Parser
-                from docx import Document
-                doc = Document(file)
-                
-                current_q = None
-                
-                for para in doc.paragraphs:
-                    line = para.text.strip()
-                    if not line: continue
-                    
-                    # Detect New Question (Starts with Digit + Dot)
-                    # Heuristic parsing
-                    is_new_q = False
-                    if len(line) > 2 and line[0].isdigit():
-                        # Check if dots/parenthesis follow
-                        idx = 0
-                        while idx < len(line) and line[idx].isdigit(): idx += 1
-                        if idx < len(line) and line[idx] in ['.', ')']:
-                            is_new_q = True
-                    
-                    if is_new_q:
-                        # Save previous
-                        if current_q: questions_data.append(current_q)
-                        
-                        # Start new
-                        clean_text = line.split('.', 1)[-1].strip() if '.' in line else line
-                        clean_text = clean_text.split(')', 1)[-1].strip() if ')' in clean_text[:5] else clean_text
-                        
-                        current_q = {
-                            'text': clean_text,
-                            'type': 'MCQ',
-                            'options': [],
-                            'correct_answer': '',
-                            'points': 1,
-                            'explanation': '',
-                            'time_limit': 0
-                        }
-                    
-                    elif current_q:
-                        # Parse Options (A), a), etc.)
-                        first_word = line.split(' ')[0].replace('.', '').replace(')', '').upper()
-                        if len(first_word) == 1 and first_word in ['A', 'B', 'C', 'D', 'E']:
-                            opt_text = line[len(first_word)+1:].strip().replace(')', '', 1).replace('.', '', 1).strip()
-                            current_q['options'].append(opt_text)
-                        
-                        # Parse Answer
-                        elif line.lower().startswith('javob:') or line.lower().startswith('answer:'):
-                            ans = line.split(':', 1)[1].strip().upper()
-                            # If answer is 'A', convert to index 0
-                            if ans in ['A', 'B', 'C', 'D']:
-                                current_q['correct_answer'] = str(ord(ans) - ord('A'))
-                            else:
-                                current_q['correct_answer'] = ans
-                
-                # Append last
-                if current_q: questions_data.append(current_q)
-
-            else:
-                 return Response({'error': 'Unsupported file format. Use .xlsx, .csv or .docx'}, status=400)
 
-            # --- SAVE TO DB ---
-            current_order = olympiad.questions.count() + 1
-            
-            for q in questions_data:
-                Question.objects.create(
-                    olympiad=olympiad,
-                    text=q['text'],
-                    type=q.get('type', 'MCQ'),
-                    options=q.get('options', []),
-                    correct_answer=str(q.get('correct_answer', '')),
-                    points=q.get('points', 1),
-                    explanation=q.get('explanation', ''),
-                    time_limit=q.get('time_limit', 0),
-                    order=current_order
-                )
-                current_order += 1
-            
-            created_count = len(questions_data)
-            
+        strict = str(request.data.get('strict', '')).lower() in ('1', 'true')
+        try:
+            report = QuestionImportService.import_file(olympiad, request.FILES['file'], strict=strict)
+        except QuestionImportError as e:
+            return Response({'error': str(e)}, status=400)
         except Exception as e:
             print(f"Import Error: {e}")
             return Response({'error': f"Import failed: {str(e)}"}, status=400)
 
         return Response({
-            'success': True,
-            'message': f"{created_count} ta savol yuklandi",
-            'count': created_count
+            'success': report['created'] > 0 or not report['error_count'],
+            'message': f"{report['created']} ta savol yuklandi",
+            'count': report['created'],
+            'skipped': report['skipped'],
+            'errors': report['errors'],
         })
 
 
@@ -2879,18 +2794,23 @@ class CertificateViewSet(viewsets.ModelViewSet):
                 'error': 'Sertifikat raqami talab qilinadi'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        try:
-            cert = Certificate.objects.select_related('user', 'course', 'olympiad').get(cert_number=cert_number)
-            return Response({
-                'success': True,
-                'valid': cert.status == 'VERIFIED',
-                'certificate': CertificateVerifySerializer(cert).data
-            })
-        except Certificate.DoesNotExist:
-            return Response({
+        payload = CertificateVerificationService.lookup(cert_number)
+        if payload is None:
+            response = Response({
                 'success': False,
                 'error': 'Sertifikat topilmadi'
             }, status=status.HTTP_404_NOT_FOUND)
+            response['Cache-Control'] = f'public, max-age={CertificateVerificationService.NEGATIVE_TTL}'
+            return response
+        
+        etag = CertificateVerificationService.etag(payload)
+        if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(payload)
+        response['ETag'] = etag
+        response['Cache-Control'] = f'public, max-age={CertificateVerificationService.TTL}'
+        return response
     
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def approve(self, request, pk=None):
@@ -2971,11 +2891,15 @@ class CertificateViewSet(viewsets.ModelViewSet):
         if not cert_ids:
             return Response({'error': 'ID lar talab qilinadi'}, status=status.HTTP_400_BAD_REQUEST)
         
-        updated = Certificate.objects.filter(id__in=cert_ids, status='PENDING').update(
+        pending = Certificate.objects.filter(id__in=cert_ids, status='PENDING')
+        cert_numbers = list(pending.values_list('cert_number', flat=True))
+        updated = pending.update(
             status='VERIFIED',
             verified_at=timezone.now(),
             verified_by=request.user.get_full_name() or request.user.username
         )
+        # After the update, so a concurrent verify cannot re-cache the PENDING payload
+        transaction.on_commit(lambda: CertificateVerificationService.invalidate_many(cert_numbers))
         
         return Response({
             'success': True,
@@ -2992,7 +2916,10 @@ class CertificateViewSet(viewsets.ModelViewSet):
         if not cert_ids:
             return Response({'error': 'ID lar talab qilinadi'}, status=status.HTTP_400_BAD_REQUEST)
         
-        updated = Certificate.objects.filter(id__in=cert_ids, status='PENDING').update(status='REJECTED')
+        pending = Certificate.objects.filter(id__in=cert_ids, status='PENDING')
+        cert_numbers = list(pending.values_list('cert_number', flat=True))
+        updated = pending.update(status='REJECTED')
+        transaction.on_commit(lambda: CertificateVerificationService.invalidate_many(cert_numbers))
         
         return Response({
             'success': True,
@@ -3011,17 +2938,17 @@ class CertificateViewSet(viewsets.ModelViewSet):
         if cert.status != 'VERIFIED':
             return Response({'error': 'Sertifikat hali tasdiqlanmagan'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Generate PDF if not exists
-        if not cert.pdf_file:
-            from .certificate_generator import generate_certificate_pdf, generate_qr_code
-            try:
-                pdf_file = generate_certificate_pdf(cert)
-                cert.pdf_file.save(pdf_file.name, pdf_file, save=True)
-                
-                qr_file = generate_qr_code(cert)
-                cert.qr_code.save(qr_file.name, qr_file, save=True)
-            except Exception as e:
-                return Response({'error': f'PDF yaratishda xatolik: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        # Render lazily (shared with concurrent requests for the same certificate)
+        try:
+            CertificateStorageService.ensure_rendered(cert)
+        except TimeoutError:
+            return Response({
+                'success': False,
+                'status': 'RENDERING',
+                'error': 'PDF tayyorlanmoqda, birozdan so\'ng qayta urinib ko\'ring'
+            }, status=status.HTTP_202_ACCEPTED)
+        except Exception as e:
+            return Response({'error': f'PDF yaratishda xatolik: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
         # Return PDF URL
         pdf_url = request.build_absolute_uri(cert.pdf_file.url)
@@ -3031,6 +2958,28 @@ class CertificateViewSet(viewsets.ModelViewSet):
             'qr_url': request.build_absolute_uri(cert.qr_code.url) if cert.qr_code else None
         })
     
+    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated])
+    def file(self, request, pk=None):
+        """Stream certificate PDF (ETag / Range aware)"""
+        cert = self.get_object()
+        
+        if cert.user != request.user and request.user.role not in ['ADMIN', 'TEACHER']:
+            return Response({'error': 'Ruxsat yo\'q'}, status=status.HTTP_403_FORBIDDEN)
+        
+        if cert.status != 'VERIFIED':
+            return Response({'error': 'Sertifikat hali tasdiqlanmagan'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            CertificateStorageService.ensure_rendered(cert)
+        except TimeoutError:
+            response = Response({'status': 'RENDERING'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            response['Retry-After'] = '5'
+            return response
+        except Exception as e:
+            return Response({'error': f'PDF yaratishda xatolik: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        
+        return CertificateStorageService.serve(request, cert)
+    
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def regenerate_pdf(self, request, pk=None):
         """Regenerate certificate PDF (Admin only)"""
@@ -3042,13 +2991,8 @@ class CertificateViewSet(viewsets.ModelViewSet):
         if cert.status != 'VERIFIED':
             return Response({'error': 'Faqat tasdiqlangan sertifikatlar uchun PDF yaratish mumkin'}, status=status.HTTP_400_BAD_REQUEST)
         
-        from .certificate_generator import generate_certificate_pdf, generate_qr_code
         try:
-            pdf_file = generate_certificate_pdf(cert)
-            cert.pdf_file.save(pdf_file.name, pdf_file, save=True)
-            
-            qr_file = generate_qr_code(cert)
-            cert.qr_code.save(qr_file.name, qr_file, save=True)
+            CertificateStorageService.ensure_rendered(cert, force=True)
             
             return Response({
                 'success': True,
@@ -3378,8 +3322,8 @@ class PaymentViewSet(viewsets.ModelViewSet):
         )
         
         # Update Balance
-        request.user.balance += Decimal(str(amount)) # Ensure decimal compat
-        request.user.save(update_fields=['balance'])
+        PaymentService.credit_balance(request.user.id, amount, reference=f"payment:{payment.id}")
+        request.user.refresh_from_db(fields=['balance'])
         
         return Response({
             'success': True,
@@ -3490,21 +3434,12 @@ class PaymentViewSet(viewsets.ModelViewSet):
         """Confirm a pending payment"""
         payment = self.get_object()
         
-        if payment.status != 'PENDING':
+        # Balance credit / enrollment / registration happen inside the service
+        payment, confirmed = PaymentService.confirm_payment(payment.pk)
+        if not confirmed:
              return Response({'error': 'To\'lov allaqachon yakunlangan'}, status=status.HTTP_400_BAD_REQUEST)
-             
-        payment.status = 'COMPLETED'
-        payment.completed_at = timezone.now()
-        payment.save()
         
-        # Logic to add balance/enroll/etc based on type
-        # For 'TOPUP' or 'USERBOT', add to balance
-        if payment.type in ['TOPUP', 'USERBOT'] or payment.method == 'USERBOT': 
-             # Note: USERBOT method usually means manual transfer via bot, so we add to balance
-             payment.user.balance += payment.amount
-             payment.user.save()
-             
-
+        if PaymentService.is_balance_payment(payment):
              # Notify User via Telegram
              if payment.user.telegram_id:
                  try:
@@ -3591,18 +3526,12 @@ class PaymentViewSet(viewsets.ModelViewSet):
         payment.save()
         
         # Deduct balance if it was a TOPUP
+        # (even if the user already spent it: the balance may go negative)
         if payment.type in ['TOPUP', 'USERBOT'] or payment.method == 'USERBOT':
-            if payment.user.balance >= payment.amount:
-                payment.user.balance -= payment.amount
-                payment.user.save()
-            else:
-                 # What if user spent it? 
-                 # For now, we just deduct what connects, or allow negative? 
-                 # Let's deduct and allow negative or just deduct max possible?
-                 # Safest: deduct anyway, let balance go negative or strictly check.
-                 # Let's Deduct.
-                 payment.user.balance -= payment.amount
-                 payment.user.save()
+            LedgerService.transfer(
+                LedgerService.user(payment.user_id), LedgerService.EXTERNAL, payment.amount,
+                'REFUND', reference=f"payment:{payment.id}"
+            )
         
         # Note: If it was a COURSE purchase, we usually DO NOT revoke access automatically 
         # unless specifically requested, to avoid accidental data loss.
@@ -3612,30 +3541,14 @@ class PaymentViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
     def export(self, request):
-        """Export payments to CSV"""
-        import csv
-        from django.http import HttpResponse
-
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="payments.csv"'
-
-        writer = csv.writer(response)
-        writer.writerow(['ID', 'User', 'Type', 'Amount', 'Method', 'Status', 'Date', 'Transaction ID'])
-
+        """
+        Export payments (same filters as list)
+        GET /api/payments/export/?file_format=csv|xlsx
+        """
         queryset = self.filter_queryset(self.get_queryset())
-        for payment in queryset:
-            writer.writerow([
-                payment.id,
-                payment.user.username,
-                payment.type,
-                payment.amount,
-                payment.method,
-                payment.status,
-                payment.created_at.strftime('%Y-%m-%d %H:%M'),
-                payment.transaction_id
-            ])
-
-        return response
+        return ExportService.export(
+            queryset, ExportService.PAYMENT_COLUMNS, 'payments', ExportService.get_format(request)
+        )
 
         
         # Get Bot Config
@@ -3659,46 +3572,16 @@ class PaymentViewSet(viewsets.ModelViewSet):
         """Complete a payment (Mock for testing)"""
         payment = self.get_object()
         
-        if payment.status != 'PENDING':
+        payment, confirmed = PaymentService.confirm_payment(
+            payment.pk,
+            transaction_id=generate_unique_id('TXN', 12)
+        )
+        if not confirmed:
             return Response({
                 'success': False,
                 'error': 'To\'lov allaqachon amalga oshirilgan'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Mark as completed
-        payment.status = 'COMPLETED'
-        payment.completed_at = timezone.now()
-        payment.transaction_id = generate_unique_id('TXN', 12)
-        payment.save()
-        
-        # Handle post-payment logic
-        if payment.type == 'TOPUP':
-            payment.user.balance += payment.amount
-            payment.user.save(update_fields=['balance'])
-        elif payment.type == 'COURSE':
-            try:
-                course = Course.objects.get(id=payment.reference_id)
-                first_lesson = course.lessons.all().order_by('module__order', 'order').first()
-                Enrollment.objects.get_or_create(
-                    user=payment.user, 
-                    course=course,
-                    defaults={'current_lesson': first_lesson}
-                )
-                course.students_count += 1
-                course.save(update_fields=['students_count'])
-            except Course.DoesNotExist:
-                pass
-        elif payment.type == 'OLYMPIAD':
-            try:
-                olympiad = Olympiad.objects.get(id=payment.reference_id)
-                OlympiadRegistration.objects.get_or_create(
-                    user=payment.user,
-                    olympiad=olympiad,
-                    defaults={'is_paid': True}
-                )
-            except Olympiad.DoesNotExist:
-                pass
-        
         return Response({
             'success': True,
             'message': 'To\'lov muvaffaqiyatli amalga oshirildi',
@@ -3737,8 +3620,11 @@ class PaymentViewSet(viewsets.ModelViewSet):
             
         price = item.price
         
-        # Check Balance
-        if user.balance < price:
+        # Deduct balance, create payment record and grant access atomically
+        try:
+            PaymentService.pay_with_balance(user, payment_type, item, transaction_id=generate_unique_id('WAL', 12))
+        except ValueError:
+            user.refresh_from_db(fields=['balance'])
             return Response({
                 'success': False, 
                 'error': 'Mablag\' yetarli emas',
@@ -3746,40 +3632,6 @@ class PaymentViewSet(viewsets.ModelViewSet):
                 'balance': float(user.balance)
             }, status=status.HTTP_402_PAYMENT_REQUIRED)
             
-        # Deduct Balance
-        user.balance -= price
-        user.save(update_fields=['balance'])
-        
-        # Create Payment Record
-        payment = Payment.objects.create(
-            user=user,
-            amount=price,
-            type=payment_type,
-            reference_id=reference_id,
-            method='WALLET',
-            status='COMPLETED',
-            completed_at=timezone.now(),
-            transaction_id=generate_unique_id('WAL', 12)
-        )
-        
-        # Grant Access
-        if payment_type == 'COURSE':
-            first_lesson = item.lessons.all().order_by('module__order', 'order').first()
-            Enrollment.objects.create(
-                user=user, 
-                course=item,
-                current_lesson=first_lesson
-            )
-            item.students_count += 1
-            item.save(update_fields=['students_count'])
-            
-        elif payment_type == 'OLYMPIAD':
-            OlympiadRegistration.objects.create(
-                user=user,
-                olympiad=item,
-                is_paid=True
-            )
-            
         return Response({
             'success': True,
             'message': 'To\'lov amalga oshirildi',
@@ -4192,114 +4044,121 @@ def admin_stats(request):
     if request.user.role != 'ADMIN':
         return Response({'error': 'Admin huquqi talab qilinadi'}, status=status.HTTP_403_FORBIDDEN)
     
-    today = timezone.now().date()
+    today = timezone.localdate()
     this_month_start = today.replace(day=1)
     last_month_start = (this_month_start - timedelta(days=1)).replace(day=1)
+    today_start = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
     
-    # User stats
-    total_users = User.objects.count()
-    new_users_this_month = User.objects.filter(date_joined__gte=this_month_start).count()
-    new_users_last_month = User.objects.filter(
-        date_joined__gte=last_month_start,
-        date_joined__lt=this_month_start
-    ).count()
+    # User stats (one query + daily facts for growth)
+    users = User.objects.aggregate(
+        total=Count('id'),
+        students=Count('id', filter=Q(role='STUDENT')),
+        admins=Count('id', filter=Q(role='ADMIN')),
+        active=Count('id', filter=Q(is_active=True)),
+    )
+    signups = AnalyticsService.new_users_totals(
+        this_month=(this_month_start, None),
+        last_month=(last_month_start, this_month_start),
+    )
+    new_users_this_month = signups['this_month']
+    new_users_last_month = signups['last_month']
     
     user_growth = 0
     if new_users_last_month > 0:
         user_growth = ((new_users_this_month - new_users_last_month) / new_users_last_month) * 100
     
     # Course stats
-    total_courses = Course.objects.count()
+    courses = Course.objects.aggregate(
+        total=Count('id'),
+        active=Count('id', filter=Q(is_active=True)),
+        featured=Count('id', filter=Q(is_featured=True)),
+        avg_rating=Avg('rating'),
+    )
     total_enrollments = Enrollment.objects.count()
-    avg_course_rating = Course.objects.aggregate(avg=Avg('rating'))['avg'] or 0
     
     # Olympiad stats
-    total_olympiads = Olympiad.objects.count()
-    active_olympiads = Olympiad.objects.filter(status='ACTIVE').count()
-    upcoming_olympiads = Olympiad.objects.filter(status='UPCOMING').count()
+    olympiad_counts = dict(Olympiad.objects.values_list('status').annotate(count=Count('id')).order_by())
     total_participants = OlympiadRegistration.objects.count()
+    test_results = TestResult.objects.aggregate(
+        avg_score=Avg('percentage'),
+        recent=Count('id', filter=Q(submitted_at__gte=this_month_start)),
+    )
     
     # Certificate stats
-    total_certificates = Certificate.objects.count()
-    pending_certificates = Certificate.objects.filter(status='PENDING').count()
-    verified_certificates = Certificate.objects.filter(status='VERIFIED').count()
+    certificate_counts = dict(Certificate.objects.values_list('status').annotate(count=Count('id')).order_by())
     
     # Support stats
-    total_tickets = SupportTicket.objects.count()
-    open_tickets = SupportTicket.objects.filter(status='OPEN').count()
-    in_progress_tickets = SupportTicket.objects.filter(status='IN_PROGRESS').count()
-    high_priority_tickets = SupportTicket.objects.filter(priority='HIGH', status__in=['OPEN', 'IN_PROGRESS']).count()
-    
-    # Finance stats
-    total_revenue = Payment.objects.filter(status='COMPLETED').aggregate(sum=Sum('amount'))['sum'] or 0
-    this_month_revenue = Payment.objects.filter(
-        status='COMPLETED',
-        completed_at__gte=this_month_start
-    ).aggregate(sum=Sum('amount'))['sum'] or 0
-    today_start = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
-    today_count = Payment.objects.filter(created_at__gte=today_start).count()
-    refunded_amount = Payment.objects.filter(status='CANCELLED').aggregate(sum=Sum('amount'))['sum'] or 0
+    tickets = SupportTicket.objects.aggregate(
+        total=Count('id'),
+        open=Count('id', filter=Q(status='OPEN')),
+        in_progress=Count('id', filter=Q(status='IN_PROGRESS')),
+        resolved=Count('id', filter=Q(status='RESOLVED')),
+        high_priority=Count('id', filter=Q(priority='HIGH', status__in=['OPEN', 'IN_PROGRESS'])),
+        recent=Count('id', filter=Q(created_at__gte=this_month_start)),
+    )
     
-    pending_payments = Payment.objects.filter(status='PENDING').count()
+    # Finance stats (revenue from daily facts, counts in one query)
+    revenue = AnalyticsService.revenue_totals(total=(None, None), this_month=(this_month_start, None))
+    payments = Payment.objects.aggregate(
+        pending=Count('id', filter=Q(status='PENDING')),
+        completed=Count('id', filter=Q(status='COMPLETED')),
+        today=Count('id', filter=Q(created_at__gte=today_start)),
+        refunded_amount=Sum('amount', filter=Q(status='CANCELLED')),
+    )
     
     # Top courses by enrollment
     top_courses = Course.objects.order_by('-students_count')[:5].values('id', 'title', 'students_count')
     
-    # Top subjects by revenue
-    subject_revenue = Course.objects.values('subject').annotate(
-        total=Sum('enrollments__id')
-    ).order_by('-total')[:5]
-    
     stats = {
         'users': {
-            'total': total_users,
-            'students': User.objects.filter(role='STUDENT').count(),
-            'admins': User.objects.filter(role='ADMIN').count(),
+            'total': users['total'],
+            'students': users['students'],
+            'admins': users['admins'],
             'new_this_month': new_users_this_month,
             'growth_percent': round(user_growth, 1),
-            'active': User.objects.filter(is_active=True).count(),
+            'active': users['active'],
         },
         'courses': {
-            'total': total_courses,
-            'active': Course.objects.filter(is_active=True).count(),
-            'featured': Course.objects.filter(is_featured=True).count(),
+            'total': courses['total'],
+            'active': courses['active'],
+            'featured': courses['featured'],
             'total_enrollments': total_enrollments,
-            'avg_rating': round(float(avg_course_rating), 2),
+            'avg_rating': round(float(courses['avg_rating'] or 0), 2),
             'top_courses': list(top_courses),
         },
         'olympiads': {
-            'total': total_olympiads,
-            'upcoming': upcoming_olympiads,
-            'active': active_olympiads,
-            'completed': Olympiad.objects.filter(status='COMPLETED').count(),
+            'total': sum(olympiad_counts.values()),
+            'upcoming': olympiad_counts.get('UPCOMING', 0),
+            'active': olympiad_counts.get('ACTIVE', 0),
+            'completed': olympiad_counts.get('COMPLETED', 0),
             'total_participants': total_participants,
-            'avg_score': TestResult.objects.aggregate(avg=Avg('percentage'))['avg'] or 0,
+            'avg_score': test_results['avg_score'] or 0,
         },
         'certificates': {
-            'total': total_certificates,
-            'pending': pending_certificates,
-            'verified': verified_certificates,
-            'rejected': Certificate.objects.filter(status='REJECTED').count(),
+            'total': sum(certificate_counts.values()),
+            'pending': certificate_counts.get('PENDING', 0),
+            'verified': certificate_counts.get('VERIFIED', 0),
+            'rejected': certificate_counts.get('REJECTED', 0),
         },
         'support': {
-            'total': total_tickets,
-            'open': open_tickets,
-            'in_progress': in_progress_tickets,
-            'resolved': SupportTicket.objects.filter(status='RESOLVED').count(),
-            'high_priority': high_priority_tickets,
+            'total': tickets['total'],
+            'open': tickets['open'],
+            'in_progress': tickets['in_progress'],
+            'resolved': tickets['resolved'],
+            'high_priority': tickets['high_priority'],
         },
         'finance': {
-            'total_revenue': float(total_revenue),
-            'this_month': float(this_month_revenue),
-            'pending_payments': pending_payments,
-            'completed_payments': Payment.objects.filter(status='COMPLETED').count(),
-            'today_count': today_count,
-            'refunded_amount': float(refunded_amount),
+            'total_revenue': float(revenue['total']),
+            'this_month': float(revenue['this_month']),
+            'pending_payments': payments['pending'],
+            'completed_payments': payments['completed'],
+            'today_count': payments['today'],
+            'refunded_amount': float(payments['refunded_amount'] or 0),
         },
         'recent_activity': {
-            'recent_enrollments': Enrollment.objects.count(),
-            'recent_tests': TestResult.objects.filter(submitted_at__gte=this_month_start).count(),
-            'recent_tickets': SupportTicket.objects.filter(created_at__gte=this_month_start).count(),
+            'recent_enrollments': total_enrollments,
+            'recent_tests': test_results['recent'],
+            'recent_tickets': tickets['recent'],
         }
     }
     
@@ -4457,159 +4316,47 @@ def get_telegram_linking_token(request):
     })
 
 
-@api_view(['POST'])
-@permission_classes([AllowAny])
-def telegram_webhook(request):
+@csrf_exempt
+async def telegram_webhook(request):
     """
     Webhook endpoint for Telegram Bot
-    This will process updates and handle user linking
+    Acknowledges at once; the update is processed in the background by the
+    shared update core (see BotUpdateHandler.handle_update)
     """
-    from .bot_service import BotService
-    
-    update = request.data
-    
-    def show_main_menu(chat_id, text="Nima bilan yordam bera olaman?"):
-        reply_markup = {
-            "keyboard": [
-                [{"text": "🏆 Mening Olimpiadalarim"}, {"text": "📚 Mening Kurslarim"}],
-                [{"text": "🎥 Meetinglar"}, {"text": "📊 Natijalarim"}],
-                [{"text": "❓ Yordam"}]
-            ],
-            "resize_keyboard": True
-        }
-        return BotService.send_message(chat_id, text, reply_markup=reply_markup)
-
-    # Handle incoming message
-    if 'message' in update:
-        message = update['message']
-        chat_id = message['chat']['id']
-        text = message.get('text', '')
-        
-        # Handle /start with token: /start <token>
-        if text.startswith('/start'):
-            parts = text.split()
-            if len(parts) > 1:
-                token = parts[1]
-                user = BotService.link_user(chat_id, token)
-                
-                if user:
-                    welcome_text = f"✅ <b>Tabriklaymiz, {user.first_name}!</b>\n\nSizning platformadagi hisobingiz muvaffaqiyatli bog'landi."
-                    show_main_menu(chat_id, welcome_text)
-                else:
-                    BotService.send_message(chat_id, "❌ <b>Xatolik!</b>\n\nToken yaroqsiz yoki muddati o'tgan. Iltimos, platformadan qaytadan urinib ko'ring.")
-            else:
-                user = User.objects.filter(telegram_id=chat_id).first()
-                if user:
-                    show_main_menu(chat_id, f"Qaytganingizdan xursandmiz, <b>{user.first_name}</b>!")
-                else:
-                    welcome_text = "👋 <b>Ardent Olimpiada botiga xush kelibsiz!</b>\n\nHisobingizni bog'lash uchun platformadagi profilingizdan foydalaning."
-                    reply_markup = {
-                        "inline_keyboard": [[
-                            {"text": "🚀 Platformada ro'yxatdan o'tish", "url": "https://ardent.uz/auth"}
-                        ]]
-                    }
-                    BotService.send_message(chat_id, welcome_text, reply_markup=reply_markup)
-        
-        # Handle location sharing
-        elif 'location' in message:
-            location = message['location']
-            lat = location.get('latitude')
-            lon = location.get('longitude')
-            
-            user = User.objects.filter(telegram_id=chat_id).first()
-            if user:
-                # Check for contacted winner prize
-                prize = WinnerPrize.objects.filter(student=user, status='CONTACTED').order_by('-awarded_at').first()
-                if prize:
-                    PrizeAddress.objects.update_or_create(
-                        prize=prize,
-                        defaults={
-                            'latitude': lat,
-                            'longitude': lon
-                        }
-                    )
-                    prize.status = 'ADDRESS_RECEIVED'
-                    prize.save()
-                    BotService.send_message(chat_id, "✅ <b>Manzil qabul qilindi!</b>\n\nTez orada sovriningizni yuboramiz. Rahmat!")
-                    BotService.send_to_admin(f"📦 <b>Yangi manzil!</b>\nStudent: {user.get_full_name()}\nOlimpiada: {prize.olympiad.title}\nTur: Lokatsiya")
-                else:
-                    BotService.send_message(chat_id, "Manzil uchun rahmat!")
-
-        # Handle menu buttons
-        elif text == "🏆 Mening Olimpiadalarim":
-            user = User.objects.filter(telegram_id=chat_id).first()
-            if user:
-                registrations = user.olympiad_registrations.all()[:5]
-                if registrations:
-                    resp = "🏆 <b>Sizning olimpiadalaringiz:</b>\n\n"
-                    for reg in registrations:
-                        status_emoji = "⏳" if reg.olympiad.status == 'UPCOMING' else "🚀"
-                        resp += f"{status_emoji} <b>{reg.olympiad.title}</b>\n"
-                        resp += f"📅 {reg.olympiad.start_date.strftime('%d.%m %H:%M')}\n\n"
-                    BotService.send_message(chat_id, resp)
-                else:
-                    BotService.send_message(chat_id, "Siz hali hech qanday olimpiadaga ro'yxatdan o'tmagansiz.")
-        
-        # Handle address text if not a menu command
-        elif text and text not in ["📚 Mening Kurslarim", "🎥 Meetinglar", "📊 Natijalarim", "❓ Yordam"]:
-             user = User.objects.filter(telegram_id=chat_id).first()
-             if user:
-                prize = WinnerPrize.objects.filter(student=user, status='CONTACTED').order_by('-awarded_at').first()
-                if prize:
-                    PrizeAddress.objects.update_or_create(
-                        prize=prize,
-                        defaults={'address_text': text}
-                    )
-                    prize.status = 'ADDRESS_RECEIVED'
-                    prize.save()
-                    BotService.send_message(chat_id, "✅ <b>Manzil qabul qilindi!</b>\n\nTez orada sovriningizni yuboramiz. Rahmat!")
-                    BotService.send_to_admin(f"📦 <b>Yangi manzil!</b>\nStudent: {user.get_full_name()}\nOlimpiada: {prize.olympiad.title}\nTur: Matn: {text}")
-        
-        elif text == "📚 Mening Kurslarim":
-            user = User.objects.filter(telegram_id=chat_id).first()
-            if user:
-                enrollments = user.enrollments.all()[:5]
-                if enrollments:
-                    resp = "📚 <b>Sizning kurslaringiz:</b>\n\n"
-                    for enr in enrollments:
-                        resp += f"📘 <b>{enr.course.title}</b>\n"
-                        resp += f"📈 Progress: {float(enr.progress):.0f}%\n\n"
-                    BotService.send_message(chat_id, resp)
-                else:
-                    BotService.send_message(chat_id, "Siz hali hech qanday kursga yozilmagansiz.")
-
-        elif text == "🎥 Meetinglar":
-            # In a real app, you would fetch from a Meetings model
-            BotService.send_message(chat_id, "📅 <b>Yaqinlashayotgan meetinglar:</b>\n\nHozircha rejalashtirilgan meetinglar yo'q.")
-
-        elif text == "📊 Natijalarim":
-            user = User.objects.filter(telegram_id=chat_id).first()
-            if user:
-                results = user.test_results.order_by('-submitted_at')[:5]
-                if results:
-                    resp = "📊 <b>Sizning so'nggi natijalaringiz:</b>\n\n"
-                    for res in results:
-                        resp += f"📝 <b>{res.olympiad.title}</b>\n"
-                        resp += f"✅ Ball: {res.score} ({float(res.percentage):.1f}%)\n"
-                        resp += f"📅 {res.submitted_at.strftime('%d.%m.%Y')}\n\n"
-                    BotService.send_message(chat_id, resp)
-                else:
-                    BotService.send_message(chat_id, "Siz hali olimpiadalarda qatnashmagansiz.")
-
-        elif text == "❓ Yordam":
-            help_text = """
-❓ <b>Yordam markazi</b>
-
-Bot orqali siz:
-• Olimpiada va darslar haqida eslatmalar olasiz
-• Kurslaringiz progressini kuzatasiz
-• Imtihon natijalarini ko'rasiz
-
-Agar savollaringiz bo'lsa, @admin_user ga murojaat qiling yoki platformadagi "Yordam" bo'limidan foydalaning.
-"""
-            BotService.send_message(chat_id, help_text)
+    from django.conf import settings
+    
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    
+    secret = getattr(settings, 'TELEGRAM_WEBHOOK_SECRET', None)
+    if secret and request.headers.get('X-Telegram-Bot-Api-Secret-Token') != secret:
+        return JsonResponse({'error': 'Forbidden'}, status=403)
+    
+    try:
+        update = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    
+    result = webhook_core().submit(update, block=False)
+    if result == BotUpdateCore.BUSY:
+        # Telegram retries non-2xx responses later
+        return JsonResponse({'status': result}, status=503)
+    return JsonResponse({'status': 'ok'})
+
 
-    return Response({'status': 'ok'})
+@api_view(['GET'])
+@permission_classes([IsAdmin])
+def telegram_webhook_metrics(request):
+    """Per-handler latency of webhook updates processed by this worker process"""
+    return Response({'success': True, 'handlers': webhook_core().metrics.snapshot()})
+
+
+@api_view(['GET'])
+@permission_classes([IsAdmin])
+def domain_event_metrics(request):
+    """Per-handler latency of domain events (lesson/course/olympiad side effects) handled by this process"""
+    from .services.event_bus import EventBus
+    return Response({'success': True, 'mode': EventBus.mode(), 'handlers': EventBus.metrics.snapshot()})
 
 # ============= WALLET VIEWS =============
 
@@ -4650,8 +4397,8 @@ class WalletViewSet(viewsets.GenericViewSet):
         payment.save()
         
         # 2. Update User Balance
-        request.user.balance = float(request.user.balance) + amount_decimal
-        request.user.save(update_fields=['balance'])
+        PaymentService.credit_balance(request.user.id, amount_decimal, reference=f"payment:{payment.id}")
+        request.user.refresh_from_db(fields=['balance'])
         
         return Response({
             'success': True,
@@ -4701,45 +4448,26 @@ class WalletViewSet(viewsets.GenericViewSet):
         except (Course.DoesNotExist, Olympiad.DoesNotExist):
             return Response({'error': 'error.not_found'}, status=status.HTTP_404_NOT_FOUND)
             
-        # 2. Check Balance
-        if user.balance < price:
+        # 2. Deduct Balance, create Payment Record (Internal Transfer) and fulfill atomically
+        try:
+            PaymentService.pay_with_balance(user, item_type, item, transaction_id=f"INT-{generate_unique_id('PAY')}")
+        except ValueError:
+            user.refresh_from_db(fields=['balance'])
             return Response({
                 'success': False,
                 'error': 'error.insufficient_balance',
                 'required': price,
                 'balance': user.balance
             }, status=status.HTTP_402_PAYMENT_REQUIRED)
-            
-        # 3. Deduct Balance
-        user.balance = float(user.balance) - float(price)
-        user.save(update_fields=['balance'])
         
-        # 4. Create Payment Record (Internal Transfer)
-        Payment.objects.create(
-            user=user,
-            amount=price,
-            type=item_type,
-            reference_id=str(item_id),
-            method='WALLET',
-            status='COMPLETED',
-            transaction_id=f"INT-{generate_unique_id('PAY')}",
-            completed_at=timezone.now()
-        )
-        
-        # 5. Fulfill Service
+        # 3. Post-purchase extras
         if item_type == 'COURSE':
-            first_lesson = item.lessons.all().order_by('module__order', 'order').first()
-            Enrollment.objects.create(
-                user=user, 
-                course=item,
-                current_lesson=first_lesson
-            )
             # No immediate XP for buying course, only for completion? User said "hp har bir oquvchi bir kurs tugatganida beriladi" -> OK. 
             # But "olimpiadada qancha hp berislhari" -> usually participation XP?
             # Let's give minimal XP for purchase action itself? No, stick to completion/participation.
+            pass
             
         elif item_type == 'OLYMPIAD':
-            OlympiadRegistration.objects.create(user=user, olympiad=item, is_paid=True)
             # Give participation XP immediately? 
             # item.xp_reward is for ? Let's assume participation.
             user.add_xp(item.xp_reward, 'OLYMPIAD_PARTICIPATION', f"Olimpiada sotib olindi: {item.title}")
@@ -4790,6 +4518,30 @@ class WalletViewSet(viewsets.GenericViewSet):
         serializer = TransactionSerializer(transactions, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'], url_path='transactions/export')
+    def export_transactions(self, request):
+        """
+        Export transaction history (all for admin, own for teacher)
+        GET /api/wallet/transactions/export/?file_format=csv|xlsx&transaction_type=&status=
+        """
+        user = request.user
+        
+        if user.role == 'ADMIN' or user.is_staff:
+            queryset = Transaction.objects.all()
+        elif user.role == 'TEACHER':
+            queryset = Transaction.objects.filter(user=user)
+        else:
+            return Response({'error': 'Only teachers can view transactions'}, status=status.HTTP_403_FORBIDDEN)
+        
+        for field in ('transaction_type', 'status', 'course'):
+            value = request.query_params.get(field)
+            if value:
+                queryset = queryset.filter(**{field: value})
+        
+        return ExportService.export(
+            queryset.order_by('-created_at'), ExportService.TRANSACTION_COLUMNS, 'transactions', ExportService.get_format(request)
+        )
+
 
 class LevelRewardViewSet(viewsets.ReadOnlyModelViewSet):
     """
@@ -4828,8 +4580,17 @@ class StreakViewSet(viewsets.ViewSet):
             }, status=status.HTTP_400_BAD_REQUEST)
         
         # Deduct balance
-        user.balance -= price
-        user.save()
+        try:
+            LedgerService.transfer(
+                LedgerService.user(user.id), LedgerService.PLATFORM, price,
+                'STREAK_FREEZE', require_funds=True
+            )
+        except InsufficientFunds:
+            return Response({
+                'success': False,
+                'error': 'Mablag\' yetarli emas'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        user.refresh_from_db(fields=['balance'])
         
         # Add freeze
         streak = StreakService.get_user_streak(user)
@@ -5761,13 +5522,10 @@ class ProfessionViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['POST'])
     def enroll(self, request, pk=None):
         """Enroll in a professional roadmap"""
+        from .services.profession_service import ProfessionService
         profession = self.get_object()
-        progress, created = UserProfessionProgress.objects.get_or_create(
-            user=request.user,
-            profession=profession
-        )
-        # Recalculate progress right away
-        self._recalculate_progress(request.user, profession, progress)
+        # Creates the roadmap progress row and recalculates it right away
+        progress = ProfessionService.update_user_profession_progress(request.user, profession)
         return Response({
             'success': True,
             'message': 'Roadmapga muvaffaqiyatli qo\'shildingiz',
@@ -5885,35 +5643,6 @@ class ProfessionViewSet(viewsets.ModelViewSet):
         except Exception as e:
             return Response({'success': False, 'message': 'Xatolik yuz berdi'}, status=500)
 
-    def _recalculate_progress(self, user, profession, progress_item=None):
-        """Helper to calculate % of mandatory courses completed in this roadmap"""
-        if not progress_item:
-            progress_item = UserProfessionProgress.objects.filter(user=user, profession=profession).first()
-        
-        if not progress_item:
-            return 0
-            
-        mandatory_steps = profession.roadmap_steps.filter(is_mandatory=True, course__isnull=False)
-        total_mandatory = mandatory_steps.count()
-        
-        if total_mandatory == 0:
-            progress_item.progress_percent = 100
-            progress_item.status = 'COMPLETED'
-            progress_item.save()
-            return 100
-            
-        completed_count = 0
-        for step in mandatory_steps:
-            if Enrollment.objects.filter(user=user, course=step.course, progress__gte=100).exists():
-                completed_count += 1
-                
-        percent = int((completed_count / total_mandatory) * 100)
-        progress_item.progress_percent = percent
-        if percent == 100:
-            progress_item.status = 'COMPLETED'
-        progress_item.save()
-        return percent
-
 
 
 class TestResultViewSet(viewsets.ReadOnlyModelViewSet):
@@ -5984,18 +5713,23 @@ class AdminDashboardViewSet(viewsets.ViewSet):
         Comprehensive dashboard overview for Admin
         GET /api/admin/dashboard/overview/
         """
-        today = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        today = timezone.localdate()
         month_start = today.replace(day=1)
         
         # 1. KPIs
+        users = User.objects.aggregate(
+            total=Count('id'),
+            teachers=Count('id', filter=Q(role='TEACHER')),
+        )
+        revenue = AnalyticsService.revenue_totals(today=(today, None), month=(month_start, None))
         kpis = {
-            'total_users': User.objects.count(),
-            'teachers_count': User.objects.filter(role='TEACHER').count(),
+            'total_users': users['total'],
+            'teachers_count': users['teachers'],
             'active_courses': Course.objects.filter(status='APPROVED').count(),
             'active_olympiads': Olympiad.objects.filter(status__in=['UPCOMING', 'ONGOING']).count(),
-            'revenue_today': float(Payment.objects.filter(status='COMPLETED', completed_at__gte=today).aggregate(sum=Sum('amount'))['sum'] or 0),
-            'revenue_month': float(Payment.objects.filter(status='COMPLETED', completed_at__gte=month_start).aggregate(sum=Sum('amount'))['sum'] or 0),
-            'new_users_today': User.objects.filter(date_joined__gte=today).count(),
+            'revenue_today': float(revenue['today']),
+            'revenue_month': float(revenue['month']),
+            'new_users_today': AnalyticsService.new_users_totals(today=(today, None))['today'],
         }
         
         # 2. Alerts (Attention Required)
@@ -6056,37 +5790,33 @@ class AdminDashboardViewSet(viewsets.ViewSet):
         Get chart data
         GET /api/admin/dashboard/chart/
         """
-        # 1. User Growth & Revenue (Last 6 months)
-        current_date = timezone.now()
-        chart_data = []
-        
+        # 1. User Growth & Revenue (Last 6 months, from daily facts)
+        current_date = timezone.localdate()
+        months = []
         for i in range(5, -1, -1):
-            date = current_date - timedelta(days=i*30) 
-            month_start = date.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-            
-            # Simple next month calculation
-            if month_start.month == 12:
-                next_month_start = month_start.replace(year=month_start.year + 1, month=1)
-            else:
-                next_month_start = month_start.replace(month=month_start.month + 1)
-            
-            # Count users joined in this month
-            users_count = User.objects.filter(
-                date_joined__gte=month_start, 
-                date_joined__lt=next_month_start
-            ).count()
-            
-            # Sum revenue for this month
-            revenue_sum = Payment.objects.filter(
-                status='COMPLETED',
-                created_at__gte=month_start,
-                created_at__lt=next_month_start
-            ).aggregate(sum=Sum('amount'))['sum'] or 0
-            
+            date = current_date - timedelta(days=i*30)
+            months.append(date.replace(day=1))
+        
+        AnalyticsService.refresh_today()
+        revenue_by_month = {
+            row['month']: row['total'] or 0
+            for row in DailyRevenue.objects.filter(date__gte=months[0]).annotate(
+                month=TruncMonth('date')
+            ).values('month').annotate(total=Sum('revenue')).order_by()
+        }
+        users_by_month = {
+            row['month']: row['total'] or 0
+            for row in DailyUserStats.objects.filter(date__gte=months[0]).annotate(
+                month=TruncMonth('date')
+            ).values('month').annotate(total=Sum('new_users')).order_by()
+        }
+        
+        chart_data = []
+        for month_start in months:
             chart_data.append({
                 'name': month_start.strftime("%b").lower(), # jan, feb, etc.
-                'users': users_count,
-                'revenue': float(revenue_sum)
+                'users': users_by_month.get(month_start, 0),
+                'revenue': float(revenue_by_month.get(month_start, 0))
             })
             
         return Response({
@@ -6276,6 +6006,27 @@ class QuestionViewSet(viewsets.ModelViewSet):
             }, status=status.HTTP_400_BAD_REQUEST)
 
 
+class QuestionBankViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Question bank for teachers: filter by subject, difficulty, type or
+    search text, then add items to an olympiad (OlympiadViewSet.add_bank_questions).
+    Items carry their answers, so teachers only see the ones used in their own
+    olympiads (QuestionBankService.visible_items).
+    """
+    serializer_class = BankQuestionSerializer
+    permission_classes = [IsAuthenticated, IsTeacherOrAdmin]
+    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filterset_fields = ['subject', 'difficulty', 'type']
+    search_fields = ['text']
+    ordering_fields = ['created_at', 'usage_count']
+
+    def get_queryset(self):
+        from .services.question_bank_service import QuestionBankService
+        return QuestionBankService.visible_items(self.request.user).select_related('subject').annotate(
+            usage_count=Count('links')
+        ).order_by('-created_at', '-id')
+
+
 class PayoutViewSet(viewsets.ModelViewSet):
     """
     Teacher Payout Management
@@ -6284,6 +6035,10 @@ class PayoutViewSet(viewsets.ModelViewSet):
     serializer_class = PayoutSerializer
     permission_classes = [IsAuthenticated]
     
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filterset_fields = ['status', 'payment_method', 'teacher']
+    ordering_fields = ['created_at', 'amount']
+    
     def get_queryset(self):
         user = self.request.user
         if user.role == 'ADMIN' or user.is_staff:
@@ -6305,10 +6060,26 @@ class PayoutViewSet(viewsets.ModelViewSet):
             raise ValidationError({"detail": "Minimal yechib olish miqdori 100,000 so'm."})
             
         # Deduct from wallet immediately
-        wallet.balance -= amount
-        wallet.save()
-        
-        serializer.save(teacher=user, status='REQUESTED')
+        with transaction.atomic():
+            payout = serializer.save(teacher=user, status='REQUESTED')
+            try:
+                LedgerService.transfer(
+                    LedgerService.teacher_available(user.id), LedgerService.EXTERNAL, amount,
+                    'PAYOUT', reference=f"payout:{payout.id}", require_funds=True
+                )
+            except InsufficientFunds:
+                raise ValidationError({"detail": "Balansda yetarli mablag' mavjud emas."})
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Export payouts (same filters as list)
+        GET /api/payouts/export/?file_format=csv|xlsx
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        return ExportService.export(
+            queryset, ExportService.PAYOUT_COLUMNS, 'payouts', ExportService.get_format(request)
+        )
 
     @action(detail=True, methods=['post'], permission_classes=[IsAdmin])
     def approve(self, request, pk=None):
@@ -6343,11 +6114,10 @@ class PayoutViewSet(viewsets.ModelViewSet):
             metadata={'payout_id': payout.id}
         )
         
-        # Total withdrawn update
-        wallet = TeacherWallet.objects.filter(teacher=payout.teacher).first()
-        if wallet:
-            wallet.total_withdrawn += payout.amount
-            wallet.save()
+        # Total withdrawn update (F() update: the balance columns are maintained by LedgerService)
+        TeacherWallet.objects.filter(teacher=payout.teacher).update(
+            total_withdrawn=F('total_withdrawn') + payout.amount
+        )
             
         return Response({'success': True, 'message': 'To\'lov yakunlandi'})
 
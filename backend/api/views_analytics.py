@@ -2,11 +2,11 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAdminUser
-from django.db.models import Sum, Count
-from django.db.models.functions import TruncDate
+from django.db.models import Sum
 from django.utils import timezone
 from datetime import timedelta
-from .models import Payment, Course, Olympiad
+from .models import DailyRevenue
+from .services.analytics_service import AnalyticsService
 
 class AnalyticsViewSet(viewsets.ViewSet):
     permission_classes = [IsAdminUser]
@@ -23,17 +23,14 @@ class AnalyticsViewSet(viewsets.ViewSet):
         except:
             days = 7
         
-        start_date = timezone.now().date() - timedelta(days=days-1) # Include today
+        start_date = timezone.localdate() - timedelta(days=days-1) # Include today
         
-        # Aggregate payments by date
-        # Filter: status='COMPLETED'
-        trends = Payment.objects.filter(
-            status='COMPLETED', 
-            created_at__date__gte=start_date
-        ).annotate(
-            date=TruncDate('created_at')
+        # Aggregate pre-built daily revenue facts
+        AnalyticsService.refresh_today()
+        trends = DailyRevenue.objects.filter(
+            date__gte=start_date
         ).values('date').annotate(
-            income=Sum('amount')
+            income=Sum('revenue')
         ).order_by('date')
         
         # Fill missing days with 0
@@ -56,52 +53,41 @@ class AnalyticsViewSet(viewsets.ViewSet):
     def top_products(self, request):
         """
         Get top 5 products by revenue.
-        Strategy: Group Payments by 'reference_id' and 'type'.
+        Strategy: Group daily revenue facts by product (titles are stored on the facts).
         """
-        # Filter COMPLETED payments of type COURSE, OLYMPIAD only
-        payments = Payment.objects.filter(
-            status='COMPLETED',
-            reference_id__isnull=False,
-            type__in=['COURSE', 'OLYMPIAD']
-        ).exclude(reference_id='')
-        
-        # 1. Aggregate grouping by reference_id and type
-        stats = payments.values('type', 'reference_id').annotate(
-            revenue=Sum('amount'),
-            count=Count('id')
+        AnalyticsService.refresh_today()
+        stats = DailyRevenue.objects.filter(
+            payment_type__in=AnalyticsService.PRODUCT_TYPES
+        ).exclude(product_id='').values('payment_type', 'product_id').annotate(
+            revenue=Sum('revenue')
         ).order_by('-revenue')[:5]
+        stats = list(stats)
+        
+        # Latest stored title per product (one query)
+        names = {}
+        for p_type, ref_id, name in DailyRevenue.objects.filter(
+            payment_type__in=AnalyticsService.PRODUCT_TYPES,
+            product_id__in=[item['product_id'] for item in stats]
+        ).exclude(product_name='').order_by('date').values_list('payment_type', 'product_id', 'product_name'):
+            names[(p_type, ref_id)] = name
+        
+        colors = {
+            'COURSE': "#3b82f6", # blue
+            'OLYMPIAD': "#8b5cf6", # purple
+        }
         
         result_data = []
         
         for item in stats:
-            p_type = item['type'] # 'COURSE', 'OLYMPIAD'
-            ref_id = item['reference_id']
+            p_type = item['payment_type'] # 'COURSE', 'OLYMPIAD'
+            ref_id = item['product_id']
             revenue = item['revenue'] or 0
             
-            name = f"#{ref_id} {p_type}"
-            color = "#cbd5e1" # default slate-300
-            
-            p_id = 0
-            try:
-                p_id = int(ref_id)
-            except:
-                pass
-
-            if p_type == 'COURSE' and p_id:
-                course = Course.objects.filter(id=p_id).first()
-                if course:
-                    name = course.title
-                    color = "#3b82f6" # blue
-            elif p_type == 'OLYMPIAD' and p_id:
-                olympiad = Olympiad.objects.filter(id=p_id).first()
-                if olympiad:
-                    name = olympiad.title
-                    color = "#8b5cf6" # purple
-            
+            name = names.get((p_type, ref_id))
             result_data.append({
-                'name': name,
+                'name': name or f"#{ref_id} {p_type}",
                 'revenue': float(revenue), # Ensure float
-                'color': color
+                'color': colors[p_type] if name else "#cbd5e1" # default slate-300
             })
             
         return Response(result_data)
@@ -194,6 +194,28 @@ SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 USE_X_FORWARDED_HOST = True
 # USE_X_FORWARDED_PORT = True
 
+# Telegram bot conversation state (runbot): 'db' or 'cache' (needs a shared cache such as Redis)
+BOT_STATE_BACKEND = 'db'
+BOT_STATE_TTL = 60 * 60 * 24  # idle conversations expire after a day
+# secret_token given to setWebhook; when set, webhook calls without it are rejected
+TELEGRAM_WEBHOOK_SECRET = None
+
+# Side effects of completed lessons/courses/olympiads (api.services.event_bus):
+# 'worker' (stored in domain_events, handled by the process_domain_events command), 'thread'
+# (background thread in each process) or 'inline'. 'worker' needs process_domain_events running
+# (e.g. `--watch 1` or every minute from cron); 'thread' loses pending events when a process restarts.
+EVENT_BUS_MODE = 'worker'
+
+# AI assistant FAQ matching (AIService.find_faq_match). The semantic stage needs the
+# embedding files written by `manage.py build_faq_embeddings`; until then it is keywords only.
+# Embeddings only re-rank FAQs that already match on keywords.
+FAQ_EMBEDDING_DIR = BASE_DIR / 'faq_embeddings'
+AI_FAQ_SEMANTIC_WEIGHT = 0.5  # share of embedding similarity in the ranking (0 disables it)
+AI_FAQ_LATENCY_BUDGET_MS = 25  # skip the semantic stage when keyword matching took longer
+# AI assistant messages and unanswered questions are written behind in batches (AILogBuffer)
+AI_LOG_BATCH_SIZE = 200
+AI_LOG_FLUSH_INTERVAL = 1.0  # seconds; None flushes only when a batch is full
+
 CSRF_TRUSTED_ORIGINS = [
     "https://ardent-olimpiada-course.vercel.app",
     "https://course.ardentsoft.uz",
@@ -25,7 +25,7 @@ interface Message {
     source?: 'FAQ' | 'LLM';
     action?: { label: string, link: string };
     faq_id?: number;
-    message_id?: number;
+    message_id?: string;
     rated?: 'up' | 'down' | null;
 }
 